@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .base import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    embeddings_model,
+)
+from .langchain_vector import document_id
+
+
+class CachedAnswer:
+    """缓存的回答，chunks 为原始的流式输出片段，用于按原格式回放"""
+
+    def __init__(self, vector, doc_ids, version, chunks, think, content):
+        self.vector = vector
+        self.doc_ids = doc_ids
+        self.version = version
+        self.chunks = chunks
+        self.think = think
+        self.content = content
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    """
+    语义回答缓存
+    - 以问题向量的余弦相似度匹配，相似度不低于 threshold 视为同一个问题
+    - 同时校验检索到的文本块 id 和检索链版本，重新向量化后自动失效
+    - 超过 ttl 秒的回答过期，超过 max_entries 条时淘汰最久未使用的回答
+    """
+
+    def __init__(
+        self,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl=ANSWER_CACHE_TTL,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def embed(self, question: str) -> np.ndarray:
+        """问题向量，归一化后点积即为余弦相似度"""
+
+        vector = np.asarray(embeddings_model().embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _similar(self, vector: np.ndarray) -> list[tuple[int, float]]:
+        """相似度不低于阈值的缓存，按相似度从高到低排列"""
+
+        if not self._entries:
+            return []
+        keys = list(self._entries)
+        matrix = np.stack([self._entries[key].vector for key in keys])
+        scores = matrix @ vector
+        order = np.argsort(-scores)
+        return [(keys[i], float(scores[i])) for i in order if scores[i] >= self.threshold]
+
+    def _purge_expired(self):
+        deadline = time.time() - self.ttl
+        for key in [k for k, e in self._entries.items() if e.created_at < deadline]:
+            del self._entries[key]
+
+    def lookup(self, question: str, docs, version: int):
+        """
+        查找缓存的回答，返回 (回答或 None, 问题向量)。
+        问题向量可以传给 put，避免重复计算。
+        """
+
+        vector = self.embed(question)
+        doc_ids = tuple(document_id(doc) for doc in docs)
+        with self._lock:
+            self._purge_expired()
+            for key, _ in self._similar(vector):
+                entry = self._entries[key]
+                if entry.version == version and entry.doc_ids == doc_ids:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry, vector
+            self.misses += 1
+        return None, vector
+
+    def put(self, vector, docs, version: int, chunks: list[str], think: str, content: str):
+        """保存回答，替换相似问题的旧回答"""
+
+        doc_ids = tuple(document_id(doc) for doc in docs)
+        with self._lock:
+            for key, _ in self._similar(vector):
+                del self._entries[key]
+            self._entries[self._next_key] = CachedAnswer(
+                vector, doc_ids, version, chunks, think, content
+            )
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """缓存命中统计，用于调整相似度阈值"""
+
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+        }
+
+
+answer_cache = AnswerCache()
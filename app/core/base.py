@@ -2,9 +2,16 @@ from langchain_chroma import Chroma
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List
+import numpy as np
 from langchain_core.embeddings import Embeddings
-from FlagEmbedding import FlagModel
+
+from .bm25_index import BM25Index
+from .embedding_cache import CachedEmbeddings
+from .flat_vector_store import FlatVectorStore
 
 
 """
@@ -32,9 +39,156 @@ OLLAMA_EMBEDDING_NAME = "nomic-embed-text"
 COLLECTION_NAME = "documents_qa"
 """向量数据库的集合名"""
 
+VECTOR_BACKEND = "chroma"
+"""
+向量存储后端：
+- chroma：Chroma 向量数据库
+- flat：内存映射的向量文件 + SQLite 元数据（FlatVectorStore），多个工作进程共享内存，适合只读为主的大规模数据
+切换后需要重新向量化
+"""
+
+FLAT_VECTOR_DIR = f"{VECTOR_DIR}/flat"
+"""flat 后端的存储路径"""
+
+FLAT_VECTOR_DTYPE = "float32"
+"""flat 后端的向量精度：float32 或 float16（占用减半，相似度误差约 1e-3），修改后下次向量化时清空重建"""
+
+FLAT_IVF_LISTS = 1024
+"""flat 后端 IVF 的簇数量，0 表示始终精确检索"""
+
+FLAT_IVF_MIN_ROWS = 1000000
+"""flat 后端文本块数达到该值后才划分 IVF 簇，之前精确检索"""
+
+FLAT_IVF_NPROBE = 32
+"""flat 后端检索时计算的簇数量，越大召回越高、越慢"""
+
+FLAT_QUANTIZATION = "none"
+"""
+flat 后端候选检索使用的量化编码，原始向量仍然保留，用于重新排序和 MMR：
+- none：直接用原始向量检索
+- int8：每维 1 字节（float32 的 1/4），召回损失很小
+- binary：每维 1 位（float32 的 1/32），需要较大的 FLAT_RESCORE_FACTOR 弥补召回
+修改后下次向量化时清空重建
+"""
+
+FLAT_RESCORE_FACTOR = 10
+"""量化检索时按编码取 k * FLAT_RESCORE_FACTOR 个候选，再按原始向量重新计算相似度，越大召回越高、越慢"""
+
+INDEX_MANIFEST_PATH = f"{VECTOR_DIR}/index_manifest.json"
+"""增量向量化的索引清单，记录每个文件的内容哈希与分割参数"""
+
+CHUNK_SIZE = 800
+"""文本块的最大字符数"""
+
+CHUNK_OVERLAP = 150
+"""相邻文本块之间的重叠字符数"""
+
+PARSE_WORKERS = None
+"""解析文档的进程数，None 表示使用 CPU 核数"""
+
+PARSE_TIMEOUT = 300
+"""单个文件的解析超时时间（秒）"""
+
+PARSE_IDLE_TIMEOUT = 60
+"""解析进程池空闲多少秒后关闭子进程，None 表示一直保留"""
+
+EMBED_BATCH_SIZE = 64
+"""每批写入向量数据库的文本块数量"""
+
+PIPELINE_QUEUE_SIZE = 4
+"""向量化流水线中，分割阶段与写入阶段之间最多缓存的批次数"""
+
+CHECKPOINT_INTERVAL = 10
+"""向量化过程中保存索引清单（断点）的间隔秒数"""
+
+ENCODE_BATCH_SIZE = 32
+"""本地 embedding 模型每批编码的文本数量"""
+
+ANSWER_CACHE_THRESHOLD = 0.95
+"""问题向量余弦相似度达到该阈值时，视为同一个问题，直接返回缓存的回答"""
+
+ANSWER_CACHE_MAX_ENTRIES = 512
+"""回答缓存最多保存的条数，超出后淘汰最久未使用的回答"""
+
+ANSWER_CACHE_TTL = 3600
+"""缓存回答的有效期（秒）"""
+
+EMBEDDING_CACHE_PATH = f"{VECTOR_DIR}/embedding_cache.db"
+"""embedding 缓存数据库路径"""
+
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+"""embedding 缓存最多保存的向量条数，超出后淘汰最久未使用的记录"""
+
+BM25_INDEX_PATH = f"{VECTOR_DIR}/bm25_index.db"
+"""BM25 关键词索引的数据库路径"""
+
+BM25_MAX_DF_RATIO = 0.2
+"""出现在超过该比例文本块中的词，关键词检索时跳过"""
+
+BM25_CACHE_SIZE = 4096
+"""关键词检索在内存中缓存的倒排表数量"""
+
+RETRIEVAL_K = 3
+"""检索结果返回的文档数量"""
+
+RETRIEVAL_CANDIDATES = 10
+"""混合检索时，向量检索和关键词检索各自返回的候选数量"""
+
+RETRIEVAL_FETCH_K = 20
+"""向量检索传给 MMR 算法的候选数量，可用 benchmark/eval_retrieval.py 评估后调整"""
+
+RETRIEVAL_LAMBDA_MULT = 0.5
+"""MMR 结果的多样性，1 表示最小多样性，0 表示最大多样性"""
+
+RRF_K = 60
+"""倒数排名融合的平滑常数，越大各路排名靠后的结果权重越接近靠前的结果"""
+
+HISTORY_MAX_TURNS = 10
+"""提问时最多读取的历史对话轮数（一问一答为一轮）"""
+
+HISTORY_MAX_TOKENS = 2000
+"""提示词中历史记录的 token 预算（估算值），超出预算的较早对话只保留提问摘要"""
 
+HISTORY_SUMMARY_TOKENS = 200
+"""较早对话摘要的 token 预算（估算值）"""
+
+STREAM_COALESCE_MS = 0
+"""流式响应合并发送的间隔（毫秒），0 表示每个 token 单独发送"""
+
+STREAM_COALESCE_BYTES = 4096
+"""开启合并发送时，缓冲超过该字节数立即发送"""
+
+STREAM_COALESCE_QUEUE = 64
+"""
+开启合并发送时最多预先读取的输出行数，超过后暂停读取上游，客户端读取慢时背压传递到 LLM。
+取每个合并间隔输出行数的几倍：LLM 每秒约 50~100 个 token、间隔 50 毫秒时每个间隔约 5 行
+"""
+
+STREAM_SPLIT_THINK = False
+"""推理过程与回答是否分开输出，True 时去掉 <think> 标签，推理过程放在 message.thinking 中"""
+
+LLM_MAX_CONCURRENCY = 2
+"""同时调用 LLM 的最大数量，与 Ollama 的 OLLAMA_NUM_PARALLEL 保持一致"""
+
+LLM_MAX_QUEUE = 32
+"""等待调用 LLM 的最大排队数，超过时返回 429"""
+
+LLM_QUEUE_REPORT_INTERVAL = 1.0
+"""排队期间发送排队状态的间隔（秒）"""
+
+DISCONNECT_CHECK_INTERVAL = 0.5
+"""流式响应期间检查客户端是否断开的间隔（秒），断开后停止调用 LLM"""
+
+TRACE_SAMPLE_RATE = 0.01
+"""记录分阶段耗时日志的请求比例，0 表示只记录带调试请求头的请求"""
+
+TRACE_DEBUG_HEADER = "X-Debug-Timings"
+"""请求头 X-Debug-Timings: 1 时必定记录耗时，并在响应流最后一行返回各阶段耗时"""
+
+
+@lru_cache(maxsize=1)
 def chat_llm():
-    """LLM 聊天模型"""
+    """LLM 聊天模型，进程内只创建一次"""
 
     # 方式一：调用本地模型，调用 langchain_ollama 库下的 ChatOllama
     # 导入包：from langchain_ollama import ChatOllama
@@ -75,8 +229,52 @@ def chroma_vector_store():
     )
 
 
+@lru_cache(maxsize=1)
+def flat_vector_store():
+    """内存映射的向量存储，进程内只创建一次，向量化和检索共用"""
+
+    return FlatVectorStore(
+        FLAT_VECTOR_DIR,
+        embedding_function=embeddings_model(),
+        dtype=FLAT_VECTOR_DTYPE,
+        ivf_lists=FLAT_IVF_LISTS,
+        ivf_min_rows=FLAT_IVF_MIN_ROWS,
+        nprobe=FLAT_IVF_NPROBE,
+        quantization=FLAT_QUANTIZATION,
+        rescore=FLAT_RESCORE_FACTOR,
+    )
+
+
+def open_vector_store():
+    """按 VECTOR_BACKEND 配置返回向量存储"""
+
+    if VECTOR_BACKEND == "flat":
+        return flat_vector_store()
+    return chroma_vector_store()
+
+
+def vector_store_format() -> str:
+    """向量存储后端和存储格式，记录在向量化清单中，变化后清空并重新向量化"""
+
+    if VECTOR_BACKEND == "flat":
+        return f"flat:{FLAT_VECTOR_DTYPE}:{FLAT_QUANTIZATION}"
+    return VECTOR_BACKEND
+
+
+@lru_cache(maxsize=1)
+def bm25_index():
+    """BM25 关键词索引，进程内只创建一次，向量化和检索共用"""
+
+    return BM25Index(
+        BM25_INDEX_PATH,
+        cache_size=BM25_CACHE_SIZE,
+        max_df_ratio=BM25_MAX_DF_RATIO,
+    )
+
+
+@lru_cache(maxsize=1)
 def embeddings_model():
-    """Embedding 模型"""
+    """Embedding 模型，进程内只创建一次，向量化和检索共用"""
 
     # 方式一：调用 Ollama 服务的 embedding 模型，使用下载量第一的 nomic-embed-text embedding 模型
     # 导入包：from langchain_ollama import OllamaEmbeddings
@@ -101,25 +299,71 @@ def embeddings_model():
     # 方式四：自定义 Embedding 接口实现
     # embeddings = CustomEmbeddings()
 
-    return embeddings
+    # 缓存 embedding 结果，按模型名称区分，重新向量化时相同文本不再重复计算
+    return CachedEmbeddings(
+        embeddings,
+        path=EMBEDDING_CACHE_PATH,
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+    )
 
 
 class CustomEmbeddings(Embeddings):
-    """自定义 Embedding 接口实现"""
-
-    def __init__(self):
+    """
+    自定义 Embedding 接口实现
+    - 按长度排序后分批编码，同一批次内文本长度接近，减少 padding
+    - 一次性转换为 float32 矩阵后再转为 LangChain 需要的 list
+    - query_cache_size 大于 0 时，缓存最近查询的向量
+    """
+
+    def __init__(self, batch_size=ENCODE_BATCH_SIZE, query_cache_size=0):
         # 调用 FlagEmbedding 库下的 FlagModel
         # 导入包：from FlagEmbedding import FlagModel
+        from FlagEmbedding import FlagModel
+
         model = FlagModel(model_name_or_path=EMBEDDING_MODEL_PATH)
 
         self.model = model
+        self.model_name = EMBEDDING_MODEL_PATH
+        self.batch_size = batch_size
+        self.query_cache_size = query_cache_size
+        self._query_cache: OrderedDict[str, List[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, texts: List[str], encode=None) -> np.ndarray:
+        """批量编码，返回与 texts 顺序一致的 float32 矩阵"""
+
+        encode = encode or self.model.encode
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        vectors = encode([texts[i] for i in order], batch_size=self.batch_size)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+        # 还原为输入顺序
+        matrix = np.empty_like(vectors)
+        matrix[order] = vectors
+        return matrix
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed search docs."""
 
-        embeddings = [self.model.encode(x) for x in texts]
-        return embeddings
+        if not texts:
+            return []
+        return self.encode(texts).tolist()
 
     def embed_query(self, text: str) -> List[float]:
         """Embed query text."""
-        return self.embed_documents([text])[0]
+
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                return vector
+
+        # 查询使用 encode_queries，配置了检索指令时会自动加上
+        encode = getattr(self.model, "encode_queries", self.model.encode)
+        vector = self.encode([text], encode)[0].tolist()
+        if self.query_cache_size > 0:
+            with self._lock:
+                self._query_cache[text] = vector
+                if len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return vector
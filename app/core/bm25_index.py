@@ -0,0 +1,515 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+
+"""
+BM25 关键词索引，持久化在 SQLite 中，与向量数据库使用相同的文本块 id。
+
+- 分词：英文、数字按单词切分（型号、错误码等带 - _ . : / 的整体也作为一个词），
+  中文按相邻两个字（bigram）切分，不依赖分词词典
+- 倒排表按「词 + 段」存储为紧凑的数组，每次写入生成新的段；
+  段数过多时把较小的段合并为一个，并清理已删除的文本块，避免反复重写很长的倒排表
+- 文本块长度和删除标记常驻内存，查询时只读取查询词的倒排表；最近使用的倒排表按内部 id 排序，
+  连同每个文本块的得分和最高得分一起缓存，查询时按 MaxScore 剪枝，常见词的长倒排表只在候选中查找
+"""
+
+
+_WORD_PATTERN = re.compile(
+    r"[0-9a-z]+(?:[-_.:/][0-9a-z]+)*"
+    r"|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+"
+)
+_PART_PATTERN = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """中英文混合分词，中文使用字 bigram，英文数字保留完整的型号、错误码"""
+
+    tokens = []
+    text = unicodedata.normalize("NFKC", text).lower()
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        if word[0].isascii():
+            tokens.append(word)
+            # 带连接符的词同时拆出各部分，搜 "E1024" 也能命中 "ERR-E1024"
+            parts = _PART_PATTERN.findall(word)
+            if len(parts) > 1:
+                tokens.extend(parts)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    可增量更新的 BM25 索引
+    - add / delete 先写入内存缓冲区，flush 后持久化并可被检索
+    - 同一 id 重复 add 会覆盖旧内容，中断后重新写入是安全的
+    - max_df_ratio: 出现在超过该比例文本块中的词（如“的是”）区分度低且倒排表很长，查询时跳过
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_size: int = 4096,
+        flush_size: int = 5000,
+        max_segments: int = 8,
+        max_df_ratio: float = 0.2,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.cache_size = cache_size
+        self.flush_size = flush_size
+        self.max_segments = max_segments
+        self.max_df_ratio = max_df_ratio
+        self.k1 = k1
+        self.b = b
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA cache_size=-65536")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunk (
+                id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS term (
+                term TEXT PRIMARY KEY, df INTEGER NOT NULL, segments INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS posting (
+                term TEXT NOT NULL, seg INTEGER NOT NULL, chunks BLOB NOT NULL, tfs BLOB NOT NULL,
+                PRIMARY KEY (term, seg)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._conn.commit()
+
+        self._lock = threading.RLock()
+        # 最近使用的词 -> (版本, 未删除的文本块, 各文本块的 BM25 得分)
+        self._postings: OrderedDict[str, tuple[int, np.ndarray, np.ndarray]] = OrderedDict()
+        # 每次写入后加一：文本块数、平均长度和删除标记变化，缓存的得分需要重新计算
+        self._version = 0
+        # 未持久化的写入：id -> 文本，值为 None 表示删除
+        self._buffer: dict[str, str | None] = {}
+        # 查询时累加各个词得分的数组，下标为内部 id，查询结束后恢复为 0
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._load()
+
+    def _load(self):
+        """加载文本块长度，数组下标为内部 id，长度为 0 表示已删除"""
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self._next_id = meta.get("next_id", 1)
+        self._next_seg = meta.get("next_seg", 1)
+        self._lengths = np.zeros(self._next_id, dtype=np.float32)
+        cursor = self._conn.execute("SELECT id, length FROM chunk")
+        while rows := cursor.fetchmany(100000):
+            data = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            self._lengths[data[:, 0]] = data[:, 1]
+        self._count = int(np.count_nonzero(self._lengths))
+        self._total_length = float(self._lengths.sum())
+        self._version += 1
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def version(self) -> int:
+        """每次写入（flush、clear）后增加，可用于判断索引内容是否变化"""
+
+        return self._version
+
+    def add(self, ids: list[str], texts: list[str]):
+        """写入（或覆盖）文本块，缓冲区超过 flush_size 时自动持久化"""
+
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                self._buffer[doc_id] = text
+            if len(self._buffer) >= self.flush_size:
+                self.flush()
+
+    def delete(self, ids: list[str]):
+        """删除文本块"""
+
+        with self._lock:
+            for doc_id in ids:
+                self._buffer[doc_id] = None
+            if len(self._buffer) >= self.flush_size:
+                self.flush()
+
+    def clear(self):
+        """清空索引"""
+
+        with self._lock:
+            self._buffer.clear()
+            self._postings.clear()
+            for table in ("meta", "chunk", "term", "posting"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+            self._load()
+
+    def flush(self):
+        """
+        把缓冲区的写入持久化，写入的词生成新的倒排段
+        先在副本上修改文本块长度等统计，提交成功后才替换；写入失败时回滚，缓冲区保留以便重试
+        """
+
+        with self._lock:
+            if not self._buffer:
+                return
+            buffer, self._buffer = self._buffer, {}
+            try:
+                state = self._write(buffer)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                # 失败期间不会有新的写入（持有锁），直接放回缓冲区
+                self._buffer = {**buffer, **self._buffer}
+                raise
+            self._lengths, self._count, self._total_length, self._next_id, self._next_seg = state
+            self._version += 1
+
+    def _write(self, buffer: dict[str, str | None]) -> tuple:
+        """写入缓冲区的内容（不提交），返回新的 (长度数组, 文本块数, 总长度, next_id, next_seg)"""
+
+        lengths = self._lengths.copy()
+        count, total_length = self._count, self._total_length
+
+        # 1. 删除旧版本的文本块，倒排表中的旧记录在合并时清理
+        doc_ids = list(buffer)
+        for start in range(0, len(doc_ids), 500):
+            batch = doc_ids[start : start + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT id, length FROM chunk WHERE doc_id IN ({marks})", batch
+            ).fetchall()
+            for chunk_id, length in rows:
+                lengths[chunk_id] = 0
+                count -= 1
+                total_length -= length
+            self._conn.execute(f"DELETE FROM chunk WHERE doc_id IN ({marks})", batch)
+
+        # 2. 写入新的文本块，按词汇总成倒排段
+        added = [(doc_id, text) for doc_id, text in buffer.items() if text is not None]
+        first_id = self._next_id
+        next_id = first_id + len(added)
+        if len(lengths) < next_id:
+            grown = np.zeros(max(next_id, len(lengths) * 2), dtype=np.float32)
+            grown[: len(lengths)] = lengths
+            lengths = grown
+
+        chunk_rows = []
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        for offset, (doc_id, text) in enumerate(added):
+            chunk_id = first_id + offset
+            tokens = tokenize(text)
+            # 空文本块长度记为 1，与删除标记区分
+            length = max(len(tokens), 1)
+            chunk_rows.append((chunk_id, doc_id, length))
+            lengths[chunk_id] = length
+            count += 1
+            total_length += length
+            for term, tf in Counter(tokens).items():
+                chunks, tfs = postings.setdefault(term, ([], []))
+                chunks.append(chunk_id)
+                tfs.append(tf)
+        self._conn.executemany(
+            "INSERT INTO chunk (id, doc_id, length) VALUES (?, ?, ?)", chunk_rows
+        )
+
+        # 按词排序后写入，B 树顺序插入比随机插入快得多
+        terms = sorted(postings)
+        seg = self._next_seg
+        posting_rows, term_rows = [], []
+        for term in terms:
+            chunks, tfs = postings[term]
+            posting_rows.append(
+                (
+                    term,
+                    seg,
+                    array("i", chunks).tobytes(),
+                    array("H", [min(tf, 65535) for tf in tfs]).tobytes(),
+                )
+            )
+            term_rows.append((term, len(chunks)))
+        self._conn.executemany(
+            "INSERT INTO posting (term, seg, chunks, tfs) VALUES (?, ?, ?, ?)",
+            posting_rows,
+        )
+        self._conn.executemany(
+            "INSERT INTO term (term, df, segments) VALUES (?, ?, 1) "
+            "ON CONFLICT (term) DO UPDATE SET df = df + excluded.df, segments = segments + 1",
+            term_rows,
+        )
+        for term in terms:
+            self._postings.pop(term, None)
+
+        # 3. 合并段数过多的词
+        for start in range(0, len(terms), 500):
+            batch = terms[start : start + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT term FROM term WHERE term IN ({marks}) AND segments > ?",
+                [*batch, self.max_segments],
+            ).fetchall()
+            for (term,) in rows:
+                self._merge(term, lengths)
+
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("next_id", next_id), ("next_seg", seg + 1)],
+        )
+        return lengths, count, total_length, next_id, seg + 1
+
+    def optimize(self):
+        """合并所有词的倒排段并清理已删除的文本块，删除大量文档后调用"""
+
+        with self._lock:
+            self.flush()
+            terms = [row[0] for row in self._conn.execute("SELECT term FROM term")]
+            for term in terms:
+                self._merge(term, self._lengths, full=True)
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def _merge(self, term: str, lengths: np.ndarray, full: bool = False):
+        """
+        合并词的倒排段，合并时去掉已删除（lengths 中长度为 0）的文本块
+        默认只合并比最大段小得多的段（分层合并），常见词很长的倒排表不会在每次合并时重写
+        """
+
+        rows = self._conn.execute(
+            "SELECT seg, chunks, tfs FROM posting WHERE term = ?", (term,)
+        ).fetchall()
+        if not full:
+            largest = max(len(chunks) for _, chunks, _ in rows)
+            small = [row for row in rows if len(row[1]) * 4 <= largest]
+            rows = small if len(small) > 1 else rows
+        if not rows:
+            return
+
+        chunks = np.concatenate([np.frombuffer(c, dtype=np.int32) for _, c, _ in rows])
+        tfs = np.concatenate([np.frombuffer(t, dtype=np.uint16) for _, _, t in rows])
+        alive = lengths[chunks] > 0
+        chunks, tfs = chunks[alive], tfs[alive]
+
+        segs = [seg for seg, _, _ in rows]
+        marks = ",".join("?" * len(segs))
+        self._conn.execute(
+            f"DELETE FROM posting WHERE term = ? AND seg IN ({marks})", [term, *segs]
+        )
+        self._postings.pop(term, None)
+        removed_segments = len(segs)
+        if len(chunks):
+            # 沿用被合并的段号之一，保证同一个词的段号不重复
+            self._conn.execute(
+                "INSERT INTO posting (term, seg, chunks, tfs) VALUES (?, ?, ?, ?)",
+                (term, max(segs), chunks.tobytes(), tfs.tobytes()),
+            )
+            removed_segments -= 1
+        self._conn.execute(
+            "UPDATE term SET df = df - ?, segments = segments - ? WHERE term = ?",
+            (int(alive.size - alive.sum()), removed_segments, term),
+        )
+        self._conn.execute("DELETE FROM term WHERE term = ? AND segments = 0", (term,))
+
+    def _read(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        rows = self._conn.execute(
+            "SELECT chunks, tfs FROM posting WHERE term = ?", (term,)
+        ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16)
+        chunks = np.concatenate([np.frombuffer(c, dtype=np.int32) for c, _ in rows])
+        tfs = np.concatenate([np.frombuffer(t, dtype=np.uint16) for _, t in rows])
+        return chunks, tfs
+
+    def _cached_postings(self, term: str) -> tuple[np.ndarray, np.ndarray, float]:
+        """
+        词的倒排表（未删除的文本块，按内部 id 排序）、每个文本块的 BM25 得分（不含查询中的词频）及最高得分
+        得分只与写入有关，缓存后查询时不再逐个计算；写入后重新读取和计算
+        """
+
+        cached = self._postings.get(term)
+        if cached is not None and cached[0] == self._version:
+            self._postings.move_to_end(term)
+            return cached[1:]
+
+        chunks, tfs = self._read(term)
+        lengths = self._lengths[chunks]
+        alive = lengths > 0
+        chunks, tfs, lengths = chunks[alive], tfs[alive].astype(np.float32), lengths[alive]
+        # 合并后的段不一定按 id 递增，排序后才能用二分查找
+        order = np.argsort(chunks, kind="stable")
+        chunks, tfs, lengths = chunks[order], tfs[order], lengths[order]
+        df = len(chunks)
+        idf = math.log(1 + (self._count - df + 0.5) / (df + 0.5))
+        avgdl = self._total_length / max(self._count, 1)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+        weights = (idf * (self.k1 + 1)) * tfs / (tfs + norm)
+        bound = float(weights.max()) if df else 0.0
+
+        self._postings[term] = (self._version, chunks, weights, bound)
+        self._postings.move_to_end(term)
+        if len(self._postings) > self.cache_size:
+            self._postings.popitem(last=False)
+        return chunks, weights, bound
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """
+        返回 BM25 得分最高的 k 个文本块 [(id, score)]
+        按 MaxScore 剪枝：倒排表按最高得分从高到低累加，同时维护第 k 高得分的下界（阈值），
+        阈值超过剩余各词最高得分之和后，没出现过的文本块不可能进入前 k 个；
+        剩余的倒排表只计入追得上阈值的候选，候选较少时二分查找，不再遍历整个倒排表
+        """
+
+        query_terms = Counter(tokenize(query))
+        if not query_terms or k <= 0:
+            return []
+
+        with self._lock:
+            if self._count == 0:
+                return []
+            marks = ",".join("?" * len(query_terms))
+            dfs = self._conn.execute(
+                f"SELECT term, df FROM term WHERE term IN ({marks})", list(query_terms)
+            ).fetchall()
+            if not dfs:
+                return []
+
+            # 跳过过于常见的词；全部都常见时只保留最少见的一个
+            dfs.sort(key=lambda row: row[1])
+            max_df = max(1, self.max_df_ratio * self._count)
+            terms = [term for term, df in dfs if df <= max_df] or [dfs[0][0]]
+
+            lists = []
+            for term in terms:
+                chunks, weights, bound = self._cached_postings(term)
+                if len(chunks) == 0:
+                    continue
+                count = query_terms[term]
+                if count > 1:
+                    weights, bound = weights * count, bound * count
+                lists.append((bound, chunks, weights))
+            if not lists:
+                return []
+            lists.sort(key=lambda item: -item[0])
+            # rest[i]：第 i 个及之后的倒排表最高得分之和，即只出现在这些倒排表中的文本块的得分上限
+            rest = np.cumsum([bound for bound, _, _ in lists][::-1])[::-1].tolist() + [0.0]
+
+            # 各个词的得分累加到与内部 id 对应的数组中，同一个词的倒排表中内部 id 不重复；
+            # 用 np.add.at 累加，比先取值相加再写回快约一倍
+            if len(self._scores) < len(self._lengths):
+                self._scores = np.zeros(len(self._lengths), dtype=np.float32)
+            acc = self._scores
+            added = []
+            try:
+                essential = self._accumulate(acc, lists, rest, k, added)
+                return self._top(acc, lists, rest, essential, k, added)
+            finally:
+                # 累加数组恢复为 0，供下次查询使用；累加过的文本块较多时整体清零比按下标清零快
+                if sum(len(chunks) for chunks in added) * 8 > len(acc):
+                    acc.fill(0)
+                else:
+                    for chunks in added:
+                        acc[chunks] = 0
+
+    def _accumulate(self, acc: np.ndarray, lists: list, rest: list, k: int, added: list) -> tuple[int, float]:
+        """
+        依次累加倒排表，直到没出现过的文本块不可能进入前 k 个，返回 (累加的倒排表数, 阈值)
+        阈值取若干个不同文本块当前得分中第 k 高的（当前得分只会增加，是最终第 k 高得分的下界）：
+        这些文本块为刚累加的倒排表中的文本块，加上上一次得分最高的 k 个
+        """
+
+        pool = np.empty(0, dtype=np.int32)
+        theta = 0.0
+        for i, (_, chunks, weights) in enumerate(lists):
+            added.append(chunks)
+            np.add.at(acc, chunks, weights)
+            # 已累加的最高得分之和不超过剩余上限时，阈值不可能超过剩余上限，不必计算
+            if i + 1 == len(lists) or rest[0] - rest[i + 1] <= rest[i + 1]:
+                continue
+            if len(pool):
+                pos = np.minimum(np.searchsorted(chunks, pool), len(chunks) - 1)
+                ids = np.concatenate([chunks, pool[chunks[pos] != pool]])
+            elif sum(len(c) for c in added) <= 65536:
+                # 第一次计算，之前的倒排表都不长时去重后一起计算
+                ids = np.unique(np.concatenate(added))
+            else:
+                ids = chunks
+            values = acc[ids]
+            if len(ids) > k:
+                top = np.argpartition(values, len(ids) - k)[len(ids) - k :]
+                ids, values = ids[top], values[top]
+            pool = ids
+            if len(ids) == k:
+                theta = max(theta, float(values.min()))
+                if theta > rest[i + 1]:
+                    return i + 1, theta
+        return len(lists), theta
+
+    def _top(self, acc: np.ndarray, lists: list, rest: list, cut: tuple[int, float], k: int, added: list):
+        """
+        计入剩余的倒排表，取得分最高的 k 个
+        候选（出现在已累加的倒排表中的文本块）远多于倒排表长度时直接累加整个倒排表；
+        否则先去掉追不上阈值的候选，剩余的倒排表只对候选二分查找
+        """
+
+        essential, theta = cut
+        total = sum(len(chunks) for chunks in added)
+        i = essential
+        while i < len(lists) and total > len(lists[i][1]):
+            added.append(lists[i][1])
+            np.add.at(acc, lists[i][1], lists[i][2])
+            i += 1
+
+        touched = np.concatenate(added[:essential])
+        scores = acc[touched]
+        extra = None
+        for i in range(i, len(lists)):
+            keep = scores + rest[i] >= theta
+            touched, scores = touched[keep], scores[keep]
+            if extra is not None:
+                extra = extra[keep]
+            _, chunks, weights = lists[i]
+            if len(touched) * 8 > len(chunks):
+                added.append(chunks)
+                np.add.at(acc, chunks, weights)
+            else:
+                if extra is None:
+                    extra = np.zeros(len(touched), dtype=np.float32)
+                pos = np.minimum(np.searchsorted(chunks, touched), len(chunks) - 1)
+                found = chunks[pos] == touched
+                extra[found] += weights[pos[found]]
+            scores = acc[touched] if extra is None else acc[touched] + extra
+
+        # 取前 k 个：每个文本块最多出现 essential 次，得分最高的 k * essential 个中至少有 k 个不同的文本块
+        limit = k * essential
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            touched, scores = touched[top], scores[top]
+        chunks, first = np.unique(touched, return_index=True)
+        scores = scores[first]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        top_ids = [int(chunks[i]) for i in top]
+        marks = ",".join("?" * len(top_ids))
+        id_map = dict(
+            self._conn.execute(f"SELECT id, doc_id FROM chunk WHERE id IN ({marks})", top_ids)
+        )
+        return [(id_map[i], float(scores[j])) for i, j in zip(top_ids, top)]
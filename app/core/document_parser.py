@@ -0,0 +1,276 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import forkserver, popen_forkserver, reduction, spawn, util
+from multiprocessing.context import ForkServerContext, ForkServerProcess, set_spawning_popen
+from pathlib import Path
+from langchain_community.document_loaders import (
+    TextLoader,
+    PyPDFLoader,
+    Docx2txtLoader,
+)
+
+
+"""
+文档解析，在子进程中执行。
+子进程由 forkserver 创建：forkserver 只预先导入本模块（文档加载器），子进程从它 fork 出来，
+并且不重新导入主模块（python main.py 启动时即 main.py，会导入全部路由、向量数据库和模型相关模块，约 3 秒）。
+进程池在连续的解析任务之间复用，空闲超过 idle_timeout 秒后关闭，只有解析超时或子进程崩溃时才重建。
+不支持 forkserver 的平台（Windows）使用 spawn，子进程仍会重新导入主模块。
+"""
+
+
+LOADER_MAPPING = {
+    ".txt": (TextLoader, {"autodetect_encoding": True}),
+    ".md": (TextLoader, {"autodetect_encoding": True}),
+    ".pdf": (PyPDFLoader, {}),
+    ".docx": (Docx2txtLoader, {}),
+}
+"""文件后缀与加载器（及其参数）的对应关系"""
+
+
+def clean_text(text: str) -> str:
+    """统一文本清洗函数"""
+
+    cleaned = ""
+    if not text.strip():
+        return cleaned
+    # 1. 标准化全角字符（字母、数字、标点）为半角
+    normalized = unicodedata.normalize("NFKC", text)
+    # 2. 删除所有空格（包括全角空格\u3000和普通空格）
+    cleaned = normalized.replace("\u3000", "").replace(" ", "")
+    # 3. 中文标点替换为英文标点（按需扩展）
+    replacements = {
+        "，": ",",
+        "。": ".",
+        "（": "(",
+        "）": ")",
+        "；": ";",
+        "：": ":",
+        "！": "!",
+        "？": "?",
+    }
+    for cn, en in replacements.items():
+        cleaned = cleaned.replace(cn, en)
+    return cleaned
+
+
+def load_file(path: str):
+    """按文件后缀选择加载器，加载单个文件"""
+
+    suffix = Path(path).suffix.lower()
+    loader_cls, loader_kwargs = LOADER_MAPPING[suffix]
+    docs = loader_cls(path, **loader_kwargs).load()
+
+    # 初步清洗 PDF 文档的文本，删除多余空格。
+    # TODO: 后续会修改，将单独优化 PDF 文档的分割。
+    if suffix == ".pdf":
+        for doc in docs:
+            doc.page_content = clean_text(doc.page_content)
+    return docs
+
+
+_executor: ProcessPoolExecutor | None = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+"""复用的进程池，同一时间只有一个 parse_files 使用"""
+
+_idle_timer: threading.Timer | None = None
+"""空闲后关闭进程池的定时器"""
+
+
+class _ParserPopen(popen_forkserver.Popen):
+    """与 forkserver 的 Popen 相同，只是子进程不重新导入主模块：解析只需要本模块，forkserver 已经导入"""
+
+    def _launch(self, process_obj):
+        prep_data = spawn.get_preparation_data(process_obj._name)
+        prep_data.pop("init_main_from_name", None)
+        prep_data.pop("init_main_from_path", None)
+        buf = io.BytesIO()
+        set_spawning_popen(self)
+        try:
+            reduction.dump(prep_data, buf)
+            reduction.dump(process_obj, buf)
+        finally:
+            set_spawning_popen(None)
+
+        self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+        parent_w = os.dup(w)
+        self.finalizer = util.Finalize(self, util.close_fds, (parent_w, self.sentinel))
+        with open(w, "wb", closefd=True) as f:
+            f.write(buf.getbuffer())
+        self.pid = forkserver.read_signed(self.sentinel)
+
+
+class _ParserProcess(ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        return _ParserPopen(process_obj)
+
+
+class _ParserContext(ForkServerContext):
+    Process = _ParserProcess
+
+
+def _new_executor(max_workers: int):
+    # 不使用 fork 直接复制主进程，避免复制主进程里的线程和数据库连接
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = _ParserContext()
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """返回复用的进程池，尚未创建或进程数变化时新建"""
+
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != max_workers:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = _new_executor(max_workers)
+        _executor_workers = max_workers
+    return _executor
+
+
+def _discard_executor():
+    """强制关闭复用的进程池，下次使用时重建"""
+
+    global _executor
+    if _executor is not None:
+        _shutdown_executor(_executor)
+        _executor = None
+
+
+def _shutdown_executor(executor: ProcessPoolExecutor):
+    """关闭进程池，并强制结束仍在解析（可能已卡死）的子进程"""
+
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def _shutdown_idle(timer: threading.Timer):
+    """空闲超时后关闭进程池；正在解析或定时器已被取消时不处理"""
+
+    global _executor
+    if not _executor_lock.acquire(blocking=False):
+        return
+    try:
+        if _idle_timer is timer and _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+    finally:
+        _executor_lock.release()
+
+
+def _schedule_idle_shutdown(idle_timeout: float | None):
+    global _idle_timer
+    if idle_timeout is None:
+        return
+    timer = threading.Timer(idle_timeout, lambda: _shutdown_idle(timer))
+    # 不阻止进程退出
+    timer.daemon = True
+    _idle_timer = timer
+    timer.start()
+
+
+def parse_files(
+    paths: list[str],
+    max_workers: int | None = None,
+    timeout: float = 300,
+    idle_timeout: float | None = 60,
+):
+    """
+    多进程并行解析文件，按完成顺序逐个返回 (path, docs, error)
+    - max_workers: 进程数，默认为 CPU 核数
+    - timeout: 单个文件的解析超时时间（秒）
+    - idle_timeout: 解析结束后进程池空闲多少秒后关闭，None 表示不关闭
+
+    单个文件解析失败或超时不影响其他文件，error 为失败原因，docs 为空列表。
+    超时的子进程会被强制结束，并重建进程池继续解析剩余文件；
+    子进程崩溃时，同时在解析的文件逐个重新解析，只有单独解析仍然崩溃的文件记为失败。
+    进程池在多次调用之间复用，同时只有一个调用在解析，其余调用等待。
+    """
+
+    global _idle_timer
+    max_workers = max_workers or os.cpu_count() or 1
+    with _executor_lock:
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+        try:
+            yield from _parse_files(paths, max_workers, timeout)
+        finally:
+            _schedule_idle_shutdown(idle_timeout)
+
+
+def _parse_files(paths: list[str], max_workers: int, timeout: float):
+    pending = list(reversed(paths))
+    # 进程池崩溃时正在解析的文件：无法确定是哪一个导致的，之后逐个单独解析
+    suspects = []
+    running = {}  # future -> (path, deadline, 是否单独解析)
+    executor = _get_executor(max_workers)
+    try:
+        while pending or suspects or running:
+            # 同时提交的文件数不超过进程数，提交后立即开始解析，超时时间从提交时算起；
+            # 有待确认的文件时，等正在解析的文件完成后再单独提交
+            while len(running) < max_workers and (pending or suspects):
+                if suspects:
+                    if running:
+                        break
+                    path, alone = suspects.pop(), True
+                elif any(alone for _, _, alone in running.values()):
+                    break
+                else:
+                    path, alone = pending.pop(), False
+                future = executor.submit(load_file, path)
+                running[future] = (path, time.monotonic() + timeout, alone)
+
+            next_deadline = min(deadline for _, deadline, _ in running.values())
+            done, _ = wait(
+                running,
+                timeout=max(0, next_deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+
+            broken = False
+            for future in done:
+                path, _, alone = running.pop(future)
+                try:
+                    yield path, future.result(), None
+                except BrokenProcessPool:
+                    # 子进程异常退出（如解析器崩溃），进程池已不可用
+                    broken = True
+                    if alone:
+                        yield path, [], "解析进程异常退出"
+                    else:
+                        suspects.append(path)
+                except Exception as e:
+                    yield path, [], str(e)
+
+            now = time.monotonic()
+            expired = [f for f, (_, deadline, _) in running.items() if deadline <= now]
+            for future in expired:
+                path, _, _ = running.pop(future)
+                yield path, [], f"解析超时（超过 {timeout} 秒）"
+
+            if broken or expired:
+                # 结束卡住的子进程，其余未完成的文件重新提交到新的进程池
+                unfinished = [path for path, _, _ in running.values()]
+                (suspects if broken else pending).extend(unfinished)
+                running.clear()
+                _discard_executor()
+                executor = _get_executor(max_workers)
+    finally:
+        # 正常结束时保留子进程供下次使用；提前中止（如任务取消）时强制结束仍在解析的子进程
+        if running:
+            _discard_executor()
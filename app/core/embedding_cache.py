@@ -0,0 +1,162 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    """获取 embedding 模型名称，作为缓存 key 的一部分，切换模型后互不干扰"""
+
+    for attr in ("model", "model_name"):
+        name = getattr(embeddings, attr, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(embeddings).__name__
+
+
+def normalize_text(text: str) -> str:
+    """缓存 key 使用的文本标准化：统一全角半角并去掉首尾空白"""
+
+    return unicodedata.normalize("NFKC", text).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带本地缓存的 Embedding 包装
+    - 文档向量按「模型名称 + 标准化文本哈希」缓存在 SQLite 中，以 float32 存储
+    - 超过 max_entries 后按最近访问时间淘汰
+    - 查询向量只在内存中缓存最近 query_cache_size 条
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str,
+        max_entries: int,
+        model_name: str | None = None,
+        query_cache_size: int = 256,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name or embedding_model_name(embeddings)
+        self.max_entries = max_entries
+        self.query_cache_size = query_cache_size
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embedding_accessed ON embedding (accessed)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embedding").fetchone()[0]
+        self._lock = threading.Lock()
+        self._query_cache: OrderedDict[str, List[float]] = OrderedDict()
+
+    def _key(self, text: str) -> str:
+        data = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    def _get_many(self, keys: list[str]) -> dict[str, List[float]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite 单条语句的参数个数有限制，分批查询
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embedding SET accessed = ? WHERE key IN ({marks})",
+                        [now, *batch],
+                    )
+            self._conn.commit()
+        return found
+
+    def _put_many(self, items: dict[str, np.ndarray]):
+        now = time.time()
+        rows = [(key, vector.tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding (key, vector, accessed) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._count += cursor.rowcount
+            if self._count > self.max_entries:
+                # 淘汰最久未访问的记录，一次多删 10%，避免每次写入都触发淘汰
+                evict = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embedding WHERE key IN "
+                    "(SELECT key FROM embedding ORDER BY accessed LIMIT ?)",
+                    (evict,),
+                )
+                self._count -= evict
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+
+        keys = [self._key(text) for text in texts]
+        found = self._get_many(list(dict.fromkeys(keys)))
+
+        # 相同文本只计算一次
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            # 统一转为 float32，保证命中缓存与新计算的结果完全一致
+            matrix = np.asarray(vectors, dtype=np.float32)
+            computed = dict(zip(missing.keys(), matrix))
+            self._put_many(computed)
+            found.update(zip(missing.keys(), matrix.tolist()))
+
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
+
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                return vector
+
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "entries": self._count,
+        }
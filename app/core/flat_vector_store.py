@@ -0,0 +1,644 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from .mmr import mmr_select, normalize_rows
+
+SEARCH_BLOCK_ROWS = 16384
+"""精确检索时每次参与矩阵乘的行数"""
+
+CONVERT_BLOCK_ROWS = 1024
+"""需要先转为 float32 的数据（float16 向量、int8 编码）每次转换的行数，转换结果留在 CPU 缓存中，比大块转换快得多"""
+
+QUANTIZATIONS = ("none", "int8", "binary")
+"""候选检索的量化方式"""
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+"""每个字节中为 1 的位数，numpy 没有 bitwise_count（2.0 以下）时使用"""
+
+CHUNK_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE,
+    document TEXT NOT NULL, metadata TEXT NOT NULL, list INTEGER NOT NULL DEFAULT -1
+)
+"""
+
+
+def kmeans(sample: np.ndarray, k: int, iterations: int = 8, seed: int = 0) -> np.ndarray:
+    """球面 k-means：样本已按行归一化，按余弦相似度分配，返回归一化的质心"""
+
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        clusters = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[clusters])[:-1]])
+        # 空簇保留原来的质心
+        centroids[clusters] = normalize_rows(np.add.reduceat(sample[order], starts, axis=0))
+    return centroids
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    把已归一化的向量量化为候选检索使用的编码，返回 (编码, 每行的缩放系数)
+    - int8：每行按最大绝对值缩放到 [-127, 127]，编码 * 缩放系数 ≈ 原始向量
+    - binary：每一维只保留符号位，每 8 维打包为一个字节，没有缩放系数
+    """
+
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return np.packbits(vectors > 0, axis=1), None
+
+
+def hamming(codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """二值编码与查询编码不同的位数，字节数为 8 的倍数时按 uint64 计算"""
+
+    if hasattr(np, "bitwise_count"):
+        if codes.shape[1] % 8 == 0:
+            codes, query = codes.view(np.uint64), query.view(np.uint64)
+        counts = np.bitwise_count(codes ^ query)
+        # 每行只有几列，逐列相加比 sum(axis=1) 快一倍
+        total = counts[:, 0].astype(np.int32)
+        for column in range(1, counts.shape[1]):
+            total += counts[:, column]
+        return total
+    return POPCOUNT[codes ^ query].sum(axis=1, dtype=np.int32)
+
+
+class FlatVectorStore(VectorStore):
+    """
+    内存映射的向量存储，用于只读为主、数据量大的场景
+    - 向量按行归一化后存放在向量文件（float32 或 float16）中，通过 np.memmap 读取，
+      多个工作进程映射同一文件，共享操作系统的页缓存，不会各自加载一份
+    - 文本块 id、文本、元数据和所在行存放在 SQLite（meta.db）中，删除后空出的行由之后写入的文本块复用
+    - 精确检索：分块做矩阵乘（float32 直接使用 BLAS）
+    - IVF：ivf_lists 大于 0 且文本块数达到 ivf_min_rows 后，用 k-means 把向量划分为 ivf_lists 个簇，
+      并按簇重新排列写入新一代向量文件，每个簇是文件中连续的一段；检索时只计算与查询最近的 nprobe 个簇。
+      之后写入的文本块分配到最近的簇，数据量翻倍后重新划分
+    - 量化：quantization 为 int8（占用为 float32 的 1/4）或 binary（1/32）时，另存一份量化编码，
+      候选检索（精确或 IVF）只扫描编码，取前 k * rescore 个候选后再从向量文件读取这些行，
+      按原始向量重新计算相似度排序。数据量超出内存时，常驻页缓存的只有编码
+    - 写入只在一个进程中进行（向量化任务），进程内加锁；
+      其他进程在检索前通过 SQLite 的 data_version 发现变化并重新加载
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embedding_function: Embeddings,
+        dtype: str = "float32",
+        ivf_lists: int = 0,
+        ivf_min_rows: int = 1000000,
+        nprobe: int = 32,
+        quantization: str = "none",
+        rescore: int = 10,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"不支持的量化方式：{quantization}，可选 {', '.join(QUANTIZATIONS)}")
+        self.directory = directory
+        self._embedding = embedding_function
+        self.ivf_lists = ivf_lists
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.rescore = rescore
+        # 创建时的存储格式，已有数据按 meta 中记录的格式读取，reset 后使用
+        self._format = [("dtype", np.dtype(dtype).name), ("quantization", quantization)]
+
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "meta.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(CHUNK_TABLE.format(name="chunk"))
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = 'dtype'").fetchone() is None:
+            self._conn.executemany("INSERT INTO meta VALUES (?, ?)", self._format)
+        self._conn.commit()
+
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---------- 加载与刷新 ----------
+
+    def _load(self):
+        """从 SQLite 和向量文件加载当前状态"""
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self.dtype = np.dtype(meta["dtype"])
+        self.quantization = meta.get("quantization", "none")
+        self.dim = int(meta.get("dim", 0))
+        self._generation = int(meta.get("generation", 0))
+        capacity = int(meta.get("capacity", 0))
+        self._matrix, self._codes, self._scales = self._map(capacity)
+
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._lists = np.full(capacity, -1, dtype=np.int32)
+        cursor = self._conn.execute("SELECT row, list FROM chunk")
+        while rows := cursor.fetchmany(100000):
+            data = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            self._alive[data[:, 0]] = True
+            self._lists[data[:, 0]] = data[:, 1]
+        self._count = int(self._alive.sum())
+
+        self._ivf_rows = int(meta.get("ivf_rows", 0))
+        self._centroids = self._offsets = None
+        if self._ivf_rows:
+            with np.load(self._path("ivf", "npz")) as ivf:
+                self._centroids, self._offsets = ivf["centroids"], ivf["offsets"]
+        self._extra_rows = self._end = None
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self):
+        """其他进程写入后重新加载，本进程的写入已直接更新内存状态"""
+
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._load()
+
+    def _path(self, name: str, suffix: str, generation: int | None = None) -> str:
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.directory, f"{name}-{generation}.{suffix}")
+
+    def _files(self) -> list[tuple[str, np.dtype, tuple]]:
+        """每一代的数据文件：(文件名, 元素类型, 每行的形状)，依次为向量、量化编码、int8 的缩放系数"""
+
+        files = [("vectors", self.dtype, (self.dim,))]
+        if self.quantization == "int8":
+            files += [("codes", np.dtype(np.int8), (self.dim,)), ("scales", np.dtype(np.float32), ())]
+        elif self.quantization == "binary":
+            files.append(("codes", np.dtype(np.uint8), ((self.dim + 7) // 8,)))
+        return files
+
+    def _map(self, capacity: int, generation: int | None = None) -> list:
+        """映射各数据文件，返回 [向量, 量化编码, 缩放系数]，不存在的为 None"""
+
+        arrays = [None, None, None]
+        if capacity == 0 or not self.dim:
+            return arrays
+        for i, (name, dtype, shape) in enumerate(self._files()):
+            path = self._path(name, dtype.name, generation)
+            arrays[i] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity, *shape))
+        return arrays
+
+    def _flush(self):
+        for array in (self._matrix, self._codes, self._scales):
+            if array is not None:
+                array.flush()
+
+    def _grow(self, rows: int):
+        """向量文件至少容纳 rows 行，容量按倍数增长；文件只增不减，其他进程已有的映射仍然有效"""
+
+        capacity = len(self._alive)
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        self._flush()
+        for name, dtype, shape in self._files():
+            with open(self._path(name, dtype.name), "ab") as f:
+                f.truncate(new_capacity * int(np.prod(shape)) * dtype.itemsize)
+        self._matrix, self._codes, self._scales = self._map(new_capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(new_capacity - capacity, dtype=bool)])
+        self._lists = np.concatenate([self._lists, np.full(new_capacity - capacity, -1, dtype=np.int32)])
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('capacity', ?)", (str(new_capacity),))
+
+    # ---------- 写入 ----------
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = normalize_rows(self._embedding.embed_documents(texts))
+        self.add_vectors(ids, vectors, texts, metadatas)
+        return ids
+
+    def add_vectors(self, ids: list[str], vectors: np.ndarray, texts: list[str], metadatas: list[dict]):
+        """写入（或覆盖）已归一化的向量，同一 id 重复写入时覆盖原来的行"""
+
+        with self._lock:
+            self._refresh()
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与已有数据 {self.dim} 不一致，请清空后重新向量化")
+
+            # 已存在的 id 写回原来的行，其余的先使用空出的行，再追加到末尾
+            existing = dict(self._select("SELECT id, row FROM chunk WHERE id IN ({})", ids))
+            new_count = sum(1 for doc_id in dict.fromkeys(ids) if doc_id not in existing)
+            free = np.flatnonzero(~self._alive)[:new_count].tolist()
+            end = len(self._alive)
+            if len(free) < new_count:
+                self._grow(end + new_count - len(free))
+                free += list(range(end, end + new_count - len(free)))
+            free = iter(free)
+            rows = []
+            for doc_id in ids:
+                if doc_id not in existing:
+                    existing[doc_id] = next(free)
+                rows.append(existing[doc_id])
+            rows = np.array(rows, dtype=np.int64)
+
+            lists = self._assign(vectors) if self._centroids is not None else np.full(len(rows), -1)
+            # 先写向量再提交元数据，其他进程只会检索已提交的行
+            self._matrix[rows] = vectors.astype(self.dtype)
+            if self.quantization != "none":
+                codes, scales = quantize(vectors, self.quantization)
+                self._codes[rows] = codes
+                if scales is not None:
+                    self._scales[rows] = scales
+            self._flush()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk (row, id, document, metadata, list) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (int(row), doc_id, text, json.dumps(metadata or {}, ensure_ascii=False), int(lst))
+                    for row, doc_id, text, metadata, lst in zip(rows, ids, texts, metadatas, lists)
+                ],
+            )
+            self._conn.commit()
+            self._alive[rows] = True
+            self._lists[rows] = lists
+            self._count = int(self._alive.sum())
+            self._extra_rows = self._end = None
+
+            if self.ivf_lists and self._count >= max(self.ivf_min_rows, self._ivf_rows * 2, self.ivf_lists):
+                self.train_ivf()
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        with self._lock:
+            self._refresh()
+            rows = [row for (row,) in self._select("SELECT row FROM chunk WHERE id IN ({})", ids)]
+            if rows:
+                self._conn.executemany("DELETE FROM chunk WHERE row = ?", [(row,) for row in rows])
+                self._conn.commit()
+                self._alive[rows] = False
+                self._count = int(self._alive.sum())
+                self._extra_rows = self._end = None
+        return True
+
+    def reset(self):
+        """清空全部数据，按创建时传入的 dtype 和量化方式重新开始，存储格式配置变化后重新向量化时使用"""
+
+        with self._lock:
+            self._refresh()
+            old = [self._path(name, dtype.name) for name, dtype, _ in self._files()] + [self._path("ivf", "npz")]
+            generation = self._generation + 1
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM chunk")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.executemany(
+                "INSERT INTO meta VALUES (?, ?)", self._format + [("generation", str(generation))]
+            )
+            self._conn.commit()
+            self._load()
+            for path in old:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _select(self, sql: str, values: list, batch: int = 500) -> list[tuple]:
+        """IN 查询按批执行，避免超出 SQLite 的参数个数限制"""
+
+        result = []
+        for start in range(0, len(values), batch):
+            part = values[start : start + batch]
+            result += self._conn.execute(sql.format(",".join("?" * len(part))), part).fetchall()
+        return result
+
+    # ---------- IVF ----------
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def train_ivf(self, sample_per_list: int = 32):
+        """
+        用 k-means 重新划分簇，按簇重新排列写入新一代向量文件，并更新 SQLite 中的行号
+        新文件和新行号在同一个事务中生效，其他进程提交前仍使用旧文件
+        """
+
+        with self._lock:
+            self._refresh()
+            rows = np.flatnonzero(self._alive)
+            lists = min(self.ivf_lists, len(rows))
+            if lists == 0:
+                return
+            print(f"划分向量索引：{len(rows)} 个文本块，{lists} 个簇")
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, min(len(rows), lists * sample_per_list), replace=False))
+            centroids = kmeans(np.asarray(self._matrix[sample], dtype=np.float32), lists)
+
+            assign = np.empty(len(rows), dtype=np.int32)
+            for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                block = np.asarray(self._matrix[rows[start : start + SEARCH_BLOCK_ROWS]], dtype=np.float32)
+                assign[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            order = np.argsort(assign, kind="stable")
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=lists))])
+
+            # 按簇排列写入新文件，原来的空行不再保留
+            generation = self._generation + 1
+            capacity = max(len(rows), 1024)
+            for name, dtype, shape in self._files():
+                with open(self._path(name, dtype.name, generation), "wb") as f:
+                    f.truncate(capacity * int(np.prod(shape)) * dtype.itemsize)
+            arrays = self._map(capacity, generation)
+            for new, current in zip(arrays, (self._matrix, self._codes, self._scales)):
+                if new is None:
+                    continue
+                for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                    part = order[start : start + SEARCH_BLOCK_ROWS]
+                    new[start : start + len(part)] = current[rows[part]]
+                new.flush()
+            np.savez(self._path("ivf", "npz", generation), centroids=centroids, offsets=offsets)
+
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "CREATE TEMP TABLE remap (old INTEGER PRIMARY KEY, new INTEGER NOT NULL, list INTEGER NOT NULL)"
+            )
+            self._conn.executemany(
+                "INSERT INTO remap VALUES (?, ?, ?)",
+                zip(rows[order].tolist(), range(len(rows)), assign[order].tolist()),
+            )
+            self._conn.execute(CHUNK_TABLE.format(name="chunk_new"))
+            self._conn.execute(
+                "INSERT INTO chunk_new SELECT r.new, c.id, c.document, c.metadata, r.list "
+                "FROM chunk c JOIN remap r ON r.old = c.row"
+            )
+            self._conn.execute("DROP TABLE chunk")
+            self._conn.execute("ALTER TABLE chunk_new RENAME TO chunk")
+            self._conn.execute("DROP TABLE remap")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                [("generation", str(generation)), ("capacity", str(capacity)), ("ivf_rows", str(len(rows)))],
+            )
+            self._conn.commit()
+
+            old = [self._path(name, dtype.name) for name, dtype, _ in self._files()] + [self._path("ivf", "npz")]
+            self._load()
+            # 其他进程已映射的旧文件在 Linux 上删除后仍然可以读取，重新加载后释放
+            for path in old:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _ivf_extra_rows(self) -> tuple[np.ndarray, list[np.ndarray]]:
+        """
+        不在所属簇连续区间内的行（划分后写入的文本块）按簇分组，以及未分配簇的行
+        划分后写入或删除时重新计算
+        """
+
+        if self._extra_rows is None:
+            rows = np.flatnonzero(self._alive)
+            lists = self._lists[rows]
+            assigned = lists >= 0
+            inside = np.zeros(len(rows), dtype=bool)
+            inside[assigned] = (rows[assigned] >= self._offsets[lists[assigned]]) & (
+                rows[assigned] < self._offsets[lists[assigned] + 1]
+            )
+            extra, extra_lists = rows[assigned & ~inside], lists[assigned & ~inside]
+            order = np.argsort(extra_lists, kind="stable")
+            counts = np.bincount(extra_lists, minlength=len(self._centroids))
+            self._extra_rows = (rows[~assigned], np.split(extra[order], np.cumsum(counts)[:-1]))
+        return self._extra_rows
+
+    def _alive_end(self) -> int:
+        """最后一个有效行的下一行，精确检索只扫描到这里；写入或删除时重新计算"""
+
+        if self._end is None:
+            rows = np.flatnonzero(self._alive)
+            self._end = int(rows[-1]) + 1 if len(rows) else 0
+        return self._end
+
+    # ---------- 检索 ----------
+
+    def _block_scores(self, arrays, index, probe) -> np.ndarray:
+        """
+        候选检索的得分，index 为连续区间（slice）或行号数组
+        未量化时为余弦相似度；int8 为近似的余弦相似度；binary 为汉明距离取负
+        """
+
+        matrix, codes, scales = arrays
+        quantization, query, bits = probe
+        if quantization == "int8":
+            return (np.asarray(codes[index], dtype=np.float32) @ query) * scales[index]
+        if quantization == "binary":
+            return -hamming(np.asarray(codes[index]), bits).astype(np.float32)
+        return np.asarray(matrix[index], dtype=np.float32) @ query
+
+    def _scores(self, arrays, start: int, stop: int, probe) -> np.ndarray:
+        """连续行的候选检索得分，分块计算，float32 向量和二值编码直接在映射的内存上计算，不复制"""
+
+        quantization = probe[0]
+        direct = quantization == "binary" or (quantization == "none" and arrays[0].dtype == np.float32)
+        step = SEARCH_BLOCK_ROWS if direct else CONVERT_BLOCK_ROWS
+        scores = np.empty(stop - start, dtype=np.float32)
+        for begin in range(start, stop, step):
+            end = min(begin + step, stop)
+            scores[begin - start : end - start] = self._block_scores(arrays, slice(begin, end), probe)
+        return scores
+
+    def _search(self, query: np.ndarray, k: int):
+        """
+        检索最相似的 k 行，返回 (向量矩阵, 文件代数, 行号, 相似度)，相似度从高到低
+        量化时先按编码取前 k * rescore 个候选，再按原始向量重新计算相似度
+        """
+
+        with self._lock:
+            self._refresh()
+            # 引用当前状态后释放锁，矩阵乘不阻塞写入和其他检索
+            arrays, quantization = (self._matrix, self._codes, self._scales), self.quantization
+            generation, alive, lists, count = self._generation, self._alive, self._lists, self._count
+            centroids, offsets = self._centroids, self._offsets
+            ivf = centroids is not None and self.nprobe < len(centroids)
+            extra = self._ivf_extra_rows() if ivf else None
+            end = self._alive_end()
+        matrix = arrays[0]
+        if count == 0 or k <= 0:
+            return matrix, generation, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        probe = (quantization, query, np.packbits(query > 0) if quantization == "binary" else None)
+        if ivf:
+            nearest = np.argpartition(-(centroids @ query), self.nprobe - 1)[: self.nprobe]
+            unassigned, extra_rows = extra
+            gathered = np.concatenate([unassigned] + [extra_rows[i] for i in nearest])
+            parts = [(gathered, self._block_scores(arrays, gathered, probe))]
+            for i in nearest:
+                start, stop = int(offsets[i]), int(offsets[i + 1])
+                scores = self._scores(arrays, start, stop, probe)
+                # 簇区间内被复用为其他簇的行在所属簇的 extra_rows 中计算，这里排除，避免重复返回
+                scores[lists[start:stop] != i] = -np.inf
+                parts.append((np.arange(start, stop), scores))
+            rows = np.concatenate([part[0] for part in parts])
+            scores = np.concatenate([part[1] for part in parts])
+            # 已删除的行排除
+            scores[~alive[rows]] = -np.inf
+        else:
+            scores = self._scores(arrays, 0, end, probe)
+            scores[~alive[:end]] = -np.inf
+            rows = np.arange(end)
+
+        k = min(k, count, len(scores))
+        candidates = k if quantization == "none" else min(k * self.rescore, len(scores))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.isfinite(scores[top])]
+        rows, scores = rows[top], scores[top]
+        if quantization != "none":
+            # 只从向量文件读取候选行，按行号顺序读取
+            rows = np.sort(rows)
+            scores = np.asarray(matrix[rows], dtype=np.float32) @ query
+        top = np.argsort(-scores)[:k]
+        return matrix, generation, rows[top], scores[top]
+
+    def _search_documents(self, query: np.ndarray, k: int):
+        """
+        检索并读取文本块，返回 (向量矩阵, 行号, 相似度, {行号: Document})
+        检索期间重新划分了 IVF（行号已变化）时重新检索；检索期间被删除的行不返回
+        """
+
+        while True:
+            matrix, generation, rows, scores = self._search(query, k)
+            with self._lock:
+                self._refresh()
+                if generation != self._generation:
+                    continue
+                found = self._select(
+                    "SELECT row, id, document, metadata FROM chunk WHERE row IN ({})",
+                    [int(row) for row in rows],
+                )
+            docs = {
+                row: Document(page_content=document, metadata=json.loads(metadata), id=doc_id)
+                for row, doc_id, document, metadata in found
+            }
+            return matrix, rows, scores, docs
+
+    def search_vector(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """按余弦相似度检索最相似的 k 行，query 需已归一化，返回 (行号, 相似度)"""
+
+        _, _, rows, scores = self._search(query, k)
+        return rows, scores
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4
+    ) -> list[tuple[Document, float]]:
+        _, rows, scores, docs = self._search_documents(normalize_rows(embedding)[0], k)
+        return [(docs[row], float(score)) for row, score in zip(rows, scores) if row in docs]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # 余弦相似度映射到 [0, 1]
+        return lambda score: (score + 1) / 2
+
+    def query_candidates(self, embedding: list[float], n: int):
+        """MMR 使用：最相似的 n 个候选，返回 (ids, 文本, 元数据, 按行归一化的 float32 向量矩阵)"""
+
+        matrix, rows, _, docs = self._search_documents(normalize_rows(embedding)[0], n)
+        rows = np.array([row for row in rows if row in docs], dtype=np.int64)
+        found = [docs[row] for row in rows]
+        vectors = np.asarray(matrix[rows], dtype=np.float32) if len(rows) else np.empty((0, self.dim))
+        return [doc.id for doc in found], [doc.page_content for doc in found], [doc.metadata for doc in found], vectors
+
+    def max_marginal_relevance_search_by_vector(
+        self, embedding: list[float], k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, **kwargs: Any
+    ) -> list[Document]:
+        ids, documents, metadatas, vectors = self.query_candidates(embedding, max(fetch_k, k))
+        order = mmr_select(normalize_rows(embedding)[0], vectors, k, lambda_mult)
+        return [Document(page_content=documents[i], metadata=metadatas[i], id=ids[i]) for i in order]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, **kwargs: Any
+    ) -> list[Document]:
+        embedding = self._embedding.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(embedding, k, fetch_k, lambda_mult)
+
+    # ---------- 读取 ----------
+
+    def get_by_ids(self, ids: list[str], /) -> list[Document]:
+        with self._lock:
+            self._refresh()
+            found = self._select("SELECT id, document, metadata FROM chunk WHERE id IN ({})", list(ids))
+        docs = {
+            doc_id: Document(page_content=document, metadata=json.loads(metadata), id=doc_id)
+            for doc_id, document, metadata in found
+        }
+        return [docs[doc_id] for doc_id in ids if doc_id in docs]
+
+    def get(
+        self,
+        ids: Optional[list[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> dict:
+        """与 Chroma.get 相同的返回格式：{"ids", "documents", "metadatas"}，不指定 ids 时按 id 排序分页"""
+
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = self._select("SELECT id, document, metadata FROM chunk WHERE id IN ({})", list(ids))
+            else:
+                rows = self._conn.execute(
+                    "SELECT id, document, metadata FROM chunk ORDER BY id LIMIT ? OFFSET ?",
+                    (-1 if limit is None else limit, offset or 0),
+                ).fetchall()
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows] if "documents" in include else None,
+            "metadatas": [json.loads(row[2]) for row in rows] if "metadatas" in include else None,
+        }
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        directory: str = "flat_vector_store",
+        **kwargs: Any,
+    ) -> "FlatVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -0,0 +1,58 @@
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """倒数排名融合：每个结果得分为各路排名的 1 / (k + rank) 之和，按得分从高到低返回"""
+
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    混合检索：向量检索与 BM25 关键词检索的结果按倒数排名融合
+    向量检索擅长语义相近的问题，关键词检索擅长型号、错误码、接口名等需要精确匹配的问题
+    - vector_retriever: 向量检索器，返回的文档需要带 id
+    - keyword_index: BM25Index
+    - vector_store: 用于按 id 读取只被关键词检索命中的文本块
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_retriever: BaseRetriever
+    keyword_index: Any
+    vector_store: Any
+    k: int = 3
+    """返回的文档数量"""
+    keyword_k: int = 10
+    """关键词检索的候选数量"""
+    rrf_k: int = 60
+    """倒数排名融合的平滑常数"""
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        vector_docs = self.vector_retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        keyword_ids = [doc_id for doc_id, _ in self.keyword_index.search(query, self.keyword_k)]
+
+        docs = {doc.id: doc for doc in vector_docs if doc.id}
+        ranking = reciprocal_rank_fusion([list(docs), keyword_ids], self.rrf_k)
+
+        missing = [doc_id for doc_id in ranking[: self.k] if doc_id not in docs]
+        if missing:
+            # 多读取排在后面的关键词结果，以便补足个别已不存在的文本块
+            missing += [doc_id for doc_id in ranking[self.k :] if doc_id not in docs]
+            for doc in self.vector_store.get_by_ids(missing):
+                docs[doc.id] = doc
+        # 关键词索引与向量数据库不一致（如正在向量化）时，忽略向量数据库中不存在的文本块
+        return [docs[doc_id] for doc_id in ranking if doc_id in docs][: self.k]
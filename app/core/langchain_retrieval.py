@@ -1,45 +1,188 @@
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+import threading
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 
 from models.chat_history_model import ChatHistory
-from .base import chat_llm, chroma_vector_store
+from .base import (
+    HISTORY_MAX_TOKENS,
+    HISTORY_SUMMARY_TOKENS,
+    RETRIEVAL_CANDIDATES,
+    RETRIEVAL_FETCH_K,
+    RETRIEVAL_K,
+    RETRIEVAL_LAMBDA_MULT,
+    RRF_K,
+    bm25_index,
+    chat_llm,
+    open_vector_store,
+)
+from .hybrid_retriever import HybridRetriever
+from .metrics import retrieval_seconds
+from .mmr import MMRRetriever
+from .tracing import current_trace
 
 
-def build_history_template(chat_history_list: list[ChatHistory]):
-    """构建聊天历史模板"""
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数，不依赖具体模型的分词器
+    中文等宽字符约 1 个字 1 个 token，其他字符约 4 个字符 1 个 token
+    """
+
+    wide = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """按估算的 token 数截断文本，保留开头部分"""
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) < max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+
+def build_history_template(
+    chat_history_list: list[ChatHistory],
+    max_tokens: int = HISTORY_MAX_TOKENS,
+    summary_tokens: int = HISTORY_SUMMARY_TOKENS,
+):
+    """
+    构建聊天历史模板
+    从最近的对话往前保留，直到用完 max_tokens 预算；
+    超出预算的较早对话不再保留原文，只把用户提问整理成一条摘要，摘要不超过 summary_tokens
+    """
 
     if type(chat_history_list) != list or len(chat_history_list) == 0:
         return []
 
+    history = [h for h in chat_history_list if h.role in ("user", "assistant")]
+
+    # 从最近的一条往前累计，超出预算后停止；最近一条过长时截断
+    kept: list[ChatHistory] = []
+    used = 0
+    for history_item in reversed(history):
+        tokens = estimate_tokens(history_item.content)
+        if used + tokens > max_tokens:
+            if not kept:
+                content = truncate_tokens(history_item.content, max_tokens)
+                kept.append(ChatHistory(role=history_item.role, content=content))
+            break
+        kept.append(history_item)
+        used += tokens
+    kept.reverse()
+    # 保留的第一条是回答时，对应的提问已被丢弃，回答也一并丢弃
+    while kept and kept[0].role == "assistant" and len(kept) < len(history):
+        kept.pop(0)
+    dropped = history[: len(history) - len(kept)]
+
     history_messages: list[BaseMessage] = []
+    # 较早的对话只保留用户的提问作为摘要，从最近的提问开始保留
+    questions = []
+    used = 0
+    for history_item in reversed(dropped):
+        if history_item.role != "user":
+            continue
+        question = truncate_tokens(history_item.content, 50)
+        tokens = estimate_tokens(question)
+        if used + tokens > summary_tokens:
+            break
+        questions.append(question)
+        used += tokens
+    if questions:
+        summary = "\n".join(f"- {q}" for q in reversed(questions))
+        history_messages.append(
+            SystemMessage(content=f"更早的对话中，用户提过以下问题：\n{summary}")
+        )
+
     # 历史记录转换为 LangChain 消息对象数组
-    for history in chat_history_list:
-        if history.role == "user":
-            history_messages.append(HumanMessage(content=history.content))
-        elif history.role == "assistant":
-            history_messages.append(AIMessage(content=history.content))
+    for history_item in kept:
+        if history_item.role == "user":
+            history_messages.append(HumanMessage(content=history_item.content))
+        elif history_item.role == "assistant":
+            history_messages.append(AIMessage(content=history_item.content))
     return history_messages
 
 
-def build_qa_chain():
+def build_retriever(
+    vector_store=None,
+    keyword_index=None,
+    k: int = RETRIEVAL_K,
+    candidates: int = RETRIEVAL_CANDIDATES,
+    fetch_k: int = RETRIEVAL_FETCH_K,
+    lambda_mult: float = RETRIEVAL_LAMBDA_MULT,
+):
+    """
+    初始化检索器：向量检索（MMR 重排）与 BM25 关键词检索混合
+    两路结果按倒数排名融合，返回 k 个文档
+    参数默认使用配置，评估工具可以传入其他向量数据库、关键词索引和检索参数
+    """
 
-    # 初始化 Chroma 向量数据库
-    vector_store = chroma_vector_store()
+    if vector_store is None:
+        vector_store = open_vector_store()
+    if keyword_index is None:
+        keyword_index = bm25_index()
 
-    # 初始化 deepseek 模型
-    llm = chat_llm()
+    # 初始化向量检索（进程内 MMR 重排），并配置。多返回一些候选，与关键词检索结果融合后再取前 k 个
+    vector_retriever = MMRRetriever(
+        vector_store=vector_store,
+        embeddings=vector_store.embeddings,
+        k=candidates,  # 检索结果返回最相似的文档数量
+        fetch_k=max(fetch_k, candidates),  # 要传递给 MMR 算法的文档量
+        lambda_mult=lambda_mult,  # MMR 返回的结果多样性，1 表示最小多样性，0 表示最大值。（默认值：0.5）
+    )
 
-    # 初始化检索，并配置
-    retriever = vector_store.as_retriever(
-        search_type="mmr",
-        search_kwargs={
-            "k": 3,  # 检索结果返回最相似的文档数量
-            "fetch_k": 20,  # 要传递给 MMR 算法的文档量
-            "lambda_mult": 0.5,  # MMR 返回的结果多样性，1 表示最小多样性，0 表示最大值。（默认值：0.5）
-        },
+    return HybridRetriever(
+        vector_retriever=vector_retriever,
+        keyword_index=keyword_index,
+        vector_store=vector_store,
+        k=k,
+        keyword_k=candidates,
+        rrf_k=RRF_K,
     )
 
+
+def retrieve(retriever, question: str):
+    """检索文档，并记录检索耗时"""
+
+    with retrieval_seconds.time():
+        return retriever.invoke(question)
+
+
+def trace_prompt(prompt_value):
+    """记录提示词渲染耗时和提示词大小，原样返回提示词"""
+
+    trace = current_trace()
+    if trace is not None:
+        messages = prompt_value.to_messages()
+        text = "".join(str(message.content) for message in messages)
+        now = trace.mark("prompt_ready")
+        trace.add(
+            "prompt",
+            trace.marks.get("llm_start", now),
+            now,
+            messages=len(messages),
+            chars=len(text),
+            tokens=estimate_tokens(text),
+        )
+    return prompt_value
+
+
+def build_qa_chain(retriever=None):
+    """构建检索链，包括 LLM、检索器和提示词模板"""
+
+    # 初始化检索器
+    retriever = retriever or build_retriever()
+
+    # 初始化 deepseek 模型
+    llm = chat_llm()
+
     # system 提示词模板
     system_template = """
         您是超级牛逼哄哄的小天才助手，专注于文档知识的问答，是一个设计用于査询文档来回答问题的代理。
@@ -58,15 +201,65 @@ def build_qa_chain():
     )
 
     # 构建检索链管道 Runnable
-    # retriever.invoke() 作用是根据用户问题检索匹配最相关的文档
+    # retriever.invoke() 作用是根据用户问题检索匹配最相关的文档，参数里已带有 context 时不再检索
     # x 值是管道里的参数，包括 question，chat_history，还要其他有关langchain的参数
     return (
         {
-            "context": lambda x: retriever.invoke(x["question"]),
+            "context": lambda x: (
+                x["context"] if "context" in x else retrieve(retriever, x["question"])
+            ),
             "chat_history": lambda x: x["chat_history"],
             "question": lambda x: x["question"],
         }
         | prompt
+        | RunnableLambda(trace_prompt)
         | llm
         | StrOutputParser()
     )
+
+
+class QAComponents:
+    """进程内共享的检索器与检索链，version 在每次刷新后递增"""
+
+    def __init__(self, version: int, retriever, chain):
+        self.version = version
+        self.retriever = retriever
+        self.chain = chain
+
+
+_qa: QAComponents | None = None
+_qa_lock = threading.Lock()
+
+
+def get_qa() -> QAComponents:
+    """获取进程内共享的检索器与检索链，首次调用时创建"""
+
+    global _qa
+    qa = _qa
+    if qa is None:
+        with _qa_lock:
+            if _qa is None:
+                retriever = build_retriever()
+                _qa = QAComponents(1, retriever, build_qa_chain(retriever))
+            qa = _qa
+    return qa
+
+
+def get_qa_chain():
+    """获取进程内共享的检索链"""
+
+    return get_qa().chain
+
+
+def invalidate_qa_chain():
+    """
+    重新创建检索器与检索链并整体替换，向量化完成后调用。
+    正在输出的流持有旧检索链的引用，不受影响；之后的请求使用新的检索链。
+    """
+
+    global _qa
+    retriever = build_retriever()
+    chain = build_qa_chain(retriever)
+    with _qa_lock:
+        version = _qa.version + 1 if _qa else 1
+        _qa = QAComponents(version, retriever, chain)
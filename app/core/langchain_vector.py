@@ -1,159 +1,486 @@
-import unicodedata
+import hashlib
+import json
+import os
+import queue
+import threading
+from pathlib import Path
 from fastapi import HTTPException
-from langchain_community.document_loaders import (
-    DirectoryLoader,
-    TextLoader,
-    PyPDFLoader,
-    Docx2txtLoader,
-)
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import time
 
-from .base import LOAD_PATH, VECTOR_DIR, chroma_vector_store
-
-
-def clean_text(text: str) -> str:
-    """统一文本清洗函数"""
-
-    cleaned = ""
-    if not text.strip():
-        return cleaned
-    # 1. 标准化全角字符（字母、数字、标点）为半角
-    normalized = unicodedata.normalize("NFKC", text)
-    # 2. 删除所有空格（包括全角空格\u3000和普通空格）
-    cleaned = normalized.replace("\u3000", "").replace(" ", "")
-    # 3. 中文标点替换为英文标点（按需扩展）
-    replacements = {
-        "，": ",",
-        "。": ".",
-        "（": "(",
-        "）": ")",
-        "；": ";",
-        "：": ":",
-        "！": "!",
-        "？": "?",
-    }
-    for cn, en in replacements.items():
-        cleaned = cleaned.replace(cn, en)
-    return cleaned
+from . import base
+from .base import (
+    CHECKPOINT_INTERVAL,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    LOAD_PATH,
+    PARSE_IDLE_TIMEOUT,
+    PARSE_TIMEOUT,
+    PARSE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    bm25_index,
+    open_vector_store,
+    vector_store_format,
+)
+from .metrics import embedding_batch_size, embedding_chunks, embedding_seconds
+from .document_parser import LOADER_MAPPING, parse_files
+
+
+def discover_files(source_dir=LOAD_PATH):
+    """递归查找目录下所有支持格式的文件，按路径排序返回"""
+
+    paths = []
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            if Path(name).suffix.lower() in LOADER_MAPPING:
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def file_hash(path: str) -> str:
+    """计算文件内容的 sha256 哈希，分块读取避免大文件占用内存"""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 def load_documents(source_dir=LOAD_PATH):
     """
     加载指定目录下的所有文档
     支持格式：.txt, .pdf, .docx, .md
+    多进程并行解析，单个文件解析失败时跳过该文件
     """
 
-    try:
-        # 分别加载不同格式
-        text_loader = DirectoryLoader(
-            path=source_dir,  # 指定读取文件的父目录
-            glob=["**/*.txt", "**/*.md"],  # 指定读取文件的格式
-            show_progress=True,  # 显示加载进度
-            use_multithreading=True,  # 使用多线程
-            loader_cls=TextLoader,  # 指定加载器
-            loader_kwargs={"autodetect_encoding": True},  # 自动检测文件编码
-        )
+    docs = []
+    failed = 0
+    for path, file_docs, error in parse_files(
+        discover_files(source_dir), PARSE_WORKERS, PARSE_TIMEOUT, PARSE_IDLE_TIMEOUT
+    ):
+        if error:
+            failed += 1
+            print(f"加载文档失败：{path}，{error}")
+            continue
+        docs.extend(file_docs)
+    print(f"成功加载 {len(docs)} 份文档，失败 {failed} 个文件")
+    return docs
 
-        pdf_loader = DirectoryLoader(
-            path=source_dir,
-            glob="**/*.pdf",
-            show_progress=True,
-            use_multithreading=True,
-            loader_cls=PyPDFLoader,
-        )
 
-        docx_loader = DirectoryLoader(
-            path=source_dir,
-            glob="**/*.docx",
-            show_progress=True,
-            use_multithreading=True,
-            loader_cls=Docx2txtLoader,
-            loader_kwargs={"autodetect_encoding": True},
-        )
+SPLITTER_SEPARATORS = ["\n\n", "\n", ".", "。", "!", "?", "？", "！", "；", ";"]
+"""递归字符分割器的分隔符，按优先级排列"""
 
-        # 初步清洗 PDF 文档的文本，删除多余空格。
-        # TODO: 后续会修改，将单独优化 PDF 文档的分割。
-        pdf_docs = pdf_loader.load()
-        for doc in pdf_docs:
-            doc.page_content = clean_text(doc.page_content)
-
-        # 合并文档列表
-        docs = []
-        docs.extend(text_loader.load())
-        docs.extend(pdf_docs)
-        docs.extend(docx_loader.load())
-        print(f"成功加载 {len(docs)} 份文档")
-        return docs
-    except Exception as e:
-        print(f"加载文档失败：{str(e)}")
-        raise HTTPException(status_code=500, detail=f"加载文档失败：{str(e)}")
 
+def text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """递归字符分割器"""
 
-def split_documents(documents, chunk_size=800, chunk_overlap=150):
+    return RecursiveCharacterTextSplitter(
+        separators=SPLITTER_SEPARATORS,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=True,  # 保留原始文档中的位置信息
+    )
+
+
+def split_documents(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
     """
     使用递归字符分割器处理文本
     参数说明：
     - chunk_size：每个文本块的最大字符数，推荐 500-1000
     - chunk_overlap：相邻块之间的重叠字符数（保持上下文连贯），推荐 100-200
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        separators=["\n\n", "\n", ".", "。", "!", "?", "？", "！", "；", ";"],
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        add_start_index=True,  # 保留原始文档中的位置信息
-    )
 
-    split_docs = text_splitter.split_documents(documents)
+    split_docs = text_splitter(chunk_size, chunk_overlap).split_documents(documents)
     print(f"原始文档数：{len(documents)}")
     print(f"分割后文本块数：{len(split_docs)}")
 
     return split_docs
 
 
-def create_vector_store(split_docs, persist_dir=VECTOR_DIR):
+def splitter_config(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP) -> str:
+    """分割参数（分隔符、块大小、重叠）的哈希，记录在索引清单中，并作为文本块 id 的一部分"""
+
+    config = json.dumps([SPLITTER_SEPARATORS, chunk_size, chunk_overlap], ensure_ascii=False)
+    return hashlib.sha1(config.encode("utf-8")).hexdigest()[:12]
+
+
+def chunk_ids(source: str, digest: str, config: str | None, count: int):
+    """
+    生成文本块 id，由文件路径、内容哈希、分割参数和块序号决定。
+    同一文件内容和分割参数不变时 id 保持不变，可以直接推导出需要删除的旧 id；
+    分割参数变更后 id 随之改变，重新分割的文本块不会覆盖旧文本块，中断后也不会新旧混杂。
+    """
+
+    prefix = _chunk_id_prefix(source, digest, config)
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def _chunk_id_prefix(source: str, digest: str, config: str | None) -> str:
+    # 旧版本的清单和元数据没有记录分割参数，id 不包含分割参数
+    key = f"{source}:{digest}" if config is None else f"{source}:{digest}:{config}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def document_id(doc) -> str | None:
+    """获取文本块 id，检索结果没有带 id 时根据元数据推导"""
+
+    if doc.id:
+        return doc.id
+    metadata = doc.metadata
+    if "file_hash" in metadata and "chunk_index" in metadata:
+        prefix = _chunk_id_prefix(
+            metadata.get("source", ""), metadata["file_hash"], metadata.get("splitter")
+        )
+        return f"{prefix}-{metadata['chunk_index']}"
+    return None
+
+
+def load_manifest(path=None):
+    """读取索引清单，不存在时返回 None；path 默认为调用时的 base.INDEX_MANIFEST_PATH"""
+
+    path = path or base.INDEX_MANIFEST_PATH
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path=None):
+    """写入索引清单，先写临时文件再替换，避免中途失败留下损坏的清单"""
+
+    path = path or base.INDEX_MANIFEST_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class VectorizeCancelled(Exception):
+    """向量化任务被取消"""
+
+
+def split_batches(parsed, digests: dict, splitter, config: str, batch_size=None):
+    """
+    分割阶段：把解析结果分割成文本块，多个文件的文本块合并成固定大小的批次
+    - parsed: parse_files 返回的 (path, docs, error) 迭代器
+    - digests: 文件路径与内容哈希的对应关系
+    - config: splitter 的分割参数哈希（splitter_config）
+    - batch_size: 每批的文本块数，默认为调用时的 base.EMBED_BATCH_SIZE
+
+    返回 ("failed", path, error) 或 ("batch", docs, ids, keys, finished)：
+    keys 为每个文本块所属的 (path, digest, index)，
+    finished 为最后一个文本块在该批次（或之前批次）中的文件 [(path, digest, chunks)]，
+    该批次写入后这些文件即全部完成。
+    """
+
+    batch_size = batch_size or base.EMBED_BATCH_SIZE
+    docs, ids, keys, finished = [], [], [], []
+    try:
+        for path, file_docs, error in parsed:
+            if error:
+                yield ("failed", path, error)
+                continue
+
+            digest = digests[path]
+            split_docs = splitter.split_documents(file_docs)
+            file_ids = chunk_ids(path, digest, config, len(split_docs))
+            for i, (doc, chunk_id) in enumerate(zip(split_docs, file_ids)):
+                doc.metadata["file_hash"] = digest
+                doc.metadata["splitter"] = config
+                doc.metadata["chunk_index"] = i
+                docs.append(doc)
+                ids.append(chunk_id)
+                keys.append((path, digest, i))
+                if len(docs) >= batch_size:
+                    yield ("batch", docs, ids, keys, finished)
+                    docs, ids, keys, finished = [], [], [], []
+            finished.append((path, digest, len(split_docs)))
+
+        if docs or finished:
+            yield ("batch", docs, ids, keys, finished)
+    finally:
+        # 提前结束时同时结束解析子进程
+        parsed.close()
+
+
+def run_in_thread(iterable, maxsize: int):
+    """
+    在后台线程中迭代 iterable，通过有界队列把结果交给调用方。
+    队列满时后台线程等待，前后阶段并行执行的同时内存占用有上限。
+    """
+
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    threading.Thread(target=produce, name="vector-split", daemon=True).start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        # 调用方提前结束时通知后台线程退出，由后台线程负责关闭 iterable
+        stop.set()
+
+
+def scan_files(paths: list[str], indexed: dict, report):
     """
-    创建持久化向量数据库
-    - split_docs: 经过分割的文档列表
-    - persist_dir: 向量数据库存储路径（建议使用WSL原生路径）
+    扫描阶段：计算文件内容哈希。
+    文件大小和修改时间与清单记录一致时直接沿用记录的哈希，不再读取文件内容。
+    返回 {path: (digest, size, mtime)}
     """
 
-    # 初始化 Chroma 向量数据库
-    vector_store = chroma_vector_store()
+    result = {}
+    for path in paths:
+        report()
+        stat = os.stat(path)
+        entry = indexed.get(path)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            digest = entry["hash"]
+        else:
+            digest = file_hash(path)
+        result[path] = (digest, stat.st_size, stat.st_mtime)
+    return result
 
-    # 向量化文档之前，先把原来集合里的数据清空
-    ids = vector_store._collection.get()["ids"]
-    if len(ids):
-        vector_store.delete(ids=vector_store._collection.get()["ids"])
 
-    # 如果分割文档为空，不做向量化操作
-    if not split_docs or len(split_docs) == 0:
-        return
+def rebuild_keyword_index(vector_store, keyword_index, batch_size=1000):
+    """从向量数据库读取全部文本块，重建 BM25 关键词索引"""
+
+    keyword_index.clear()
+    offset = 0
+    while True:
+        result = vector_store.get(include=["documents"], limit=batch_size, offset=offset)
+        if not result["ids"]:
+            break
+        keyword_index.add(result["ids"], result["documents"])
+        offset += len(result["ids"])
+    keyword_index.flush()
+    print(f"重建关键词索引，共 {offset} 个文本块")
+
+
+def create_vector_store(
+    source_dir=LOAD_PATH,
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    job=None,
+    on_committed=None,
+):
+    """
+    增量创建持久化向量数据库
+    - source_dir: 文档目录
+    - chunk_size, chunk_overlap: 分割参数，变更后对应文件会重新向量化
+    - job: 后台任务，用于上报进度和响应取消，可为空
+    - on_committed: 文件的文本块写入向量数据库后回调，参数为文件名列表
+
+    向量存储、关键词索引和索引清单的路径由 base.py 中 VECTOR_DIR 等配置决定。
+
+    根据索引清单里记录的内容哈希和分割参数，只向量化新增或变更的文件，
+    并删除已不存在文件的向量。返回 added/updated/skipped/removed/failed 统计。
+
+    流水线：扫描 → 多进程解析清洗 → 分割成批（后台线程）→ 向量化并写入，
+    阶段之间通过有界队列连接，内存占用与语料总量无关。
+    清单每隔 CHECKPOINT_INTERVAL 秒保存一次，中断后重新执行会从断点继续。
+    """
+
+    def report(stage=None, files=0, chunks=0):
+        if job:
+            job.check_cancelled()
+            job.update(stage=stage, files=files, chunks=chunks)
+
+    def committed(paths):
+        if on_committed and paths:
+            on_committed([os.path.basename(p) for p in paths])
+
+    def delete_chunks(path, digest, config, count, keep=()):
+        ids = [i for i in chunk_ids(path, digest, config, count) if i not in keep]
+        if ids:
+            vector_store.delete(ids=ids)
+            keyword_index.delete(ids)
+
+    def checkpoint():
+        # 先持久化关键词索引再保存清单，清单中记录完成的文件在两个索引中都已写入
+        keyword_index.flush()
+        save_manifest(manifest)
+
+    # 初始化向量存储与 BM25 关键词索引
+    vector_store = open_vector_store()
+    keyword_index = bm25_index()
+
+    manifest = load_manifest()
+    storage_format = vector_store_format()
+    if manifest is None or manifest.get("backend", "chroma") != storage_format:
+        # 旧版本全量重建的数据没有清单，无法对应到文件；切换向量存储后端或存储格式后，已有数据不可用。
+        # 两种情况都先清空，再全部重新向量化（embedding 缓存命中时不需要重新计算向量）
+        if hasattr(vector_store, "reset"):
+            vector_store.reset()
+        else:
+            ids = vector_store.get(include=[])["ids"]
+            if len(ids):
+                vector_store.delete(ids=ids)
+        keyword_index.clear()
+        manifest = {"backend": storage_format, "files": {}}
+    elif len(keyword_index) == 0:
+        # 关键词索引是后加入的，已有的向量数据从向量数据库中补建
+        rebuild_keyword_index(vector_store, keyword_index)
+    indexed: dict = manifest["files"]
+    # 已写入部分文本块、但还没有全部完成的文件，用于中断后清理
+    pending: dict = manifest.setdefault("pending", {})
+    config = splitter_config(chunk_size, chunk_overlap)
+
+    stats = {
+        "added": 0,
+        "updated": 0,
+        "skipped": 0,
+        "removed": 0,
+        "chunks": 0,
+        "failed": [],
+    }
+    start_time = time.time()
+    print(f"\n开始向量化====>")
 
     try:
-        start_time = time.time()
-        print(f"\n开始向量化====>")
+        # 1. 扫描文件，根据内容哈希和分割参数找出新增或变更的文件
+        report(stage="scanning")
+        paths = discover_files(source_dir)
+        scanned = scan_files(paths, indexed, report)
+        changed = {}
+        unchanged = []
+        for path, (digest, size, mtime) in scanned.items():
+            entry = indexed.get(path)
+            if entry and entry["hash"] == digest and entry.get("splitter") == config:
+                entry["size"], entry["mtime"] = size, mtime
+                unchanged.append(path)
+            else:
+                changed[path] = digest
+        stats["skipped"] = len(unchanged)
+        committed(unchanged)
 
-        # 向量化文档到向量数据库
-        vector_store.add_documents(split_docs)
+        # 2. 删除已不存在的文件，以及上次中断时只写入了一部分的文件对应的向量
+        report(stage="removing")
+        for path in [p for p in indexed if p not in scanned]:
+            entry = indexed.pop(path)
+            delete_chunks(path, entry["hash"], entry.get("splitter"), entry["chunks"])
+            stats["removed"] += 1
+        for path, info in list(pending.items()):
+            entry = indexed.get(path)
+            keep = (
+                set(chunk_ids(path, entry["hash"], entry.get("splitter"), entry["chunks"]))
+                if entry
+                else ()
+            )
+            delete_chunks(path, info["hash"], info.get("splitter"), info["chunks"], keep)
+            del pending[path]
+        checkpoint()
 
-        print(f"\n向量化完成！耗时 {time.time()-start_time:.2f} 秒")
-        print(f"数据库存储路径：{persist_dir}")
-        print(f"总文档块数：{vector_store._collection.count()}")
+        # 3. 解析、分割、向量化并分批写入
+        if job:
+            job.files_total = len(changed)
+        report(stage="embedding")
+        splitter = text_splitter(chunk_size, chunk_overlap)
+        parsed = parse_files(list(changed), PARSE_WORKERS, PARSE_TIMEOUT, PARSE_IDLE_TIMEOUT)
+        batches = run_in_thread(
+            split_batches(parsed, changed, splitter, config), PIPELINE_QUEUE_SIZE
+        )
+        last_checkpoint = time.time()
+        for item in batches:
+            if item[0] == "failed":
+                # 解析失败的文件不写入清单，下次向量化时重试
+                _, path, error = item
+                print(f"解析文件失败：{path}，{error}")
+                stats["failed"].append({"file": path, "error": error})
+                report(files=1)
+                continue
 
+            _, docs, ids, keys, finished = item
+            if docs:
+                embed_start = time.perf_counter()
+                vector_store.add_documents(docs, ids=ids)
+                embedding_seconds.inc(time.perf_counter() - embed_start)
+                embedding_chunks.inc(len(docs))
+                embedding_batch_size.observe(len(docs))
+                keyword_index.add(ids, [doc.page_content for doc in docs])
+                for path, digest, index in keys:
+                    pending[path] = {"hash": digest, "splitter": config, "chunks": index + 1}
+                stats["chunks"] += len(docs)
+                report(chunks=len(docs))
+
+            # 文件的文本块已全部写入：删除旧版本的向量，更新清单
+            for path, digest, count in finished:
+                entry = indexed.get(path)
+                if entry:
+                    keep = set(chunk_ids(path, digest, config, count))
+                    delete_chunks(path, entry["hash"], entry.get("splitter"), entry["chunks"], keep)
+                size, mtime = scanned[path][1:]
+                indexed[path] = {
+                    "hash": digest,
+                    "splitter": config,
+                    "chunk_size": chunk_size,
+                    "chunk_overlap": chunk_overlap,
+                    "chunks": count,
+                    "size": size,
+                    "mtime": mtime,
+                }
+                pending.pop(path, None)
+                stats["updated" if entry else "added"] += 1
+            committed([path for path, _, _ in finished])
+            report(files=len(finished))
+
+            if time.time() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                checkpoint()
+                last_checkpoint = time.time()
+
+    except VectorizeCancelled:
+        print("向量化已取消")
+        raise
     except Exception as e:
         print(f"向量化失败：{str(e)}")
         raise HTTPException(status_code=500, detail=f"向量化失败：{str(e)}")
+    finally:
+        # 已完成的文件写入清单，中断后重新执行会跳过这些文件
+        checkpoint()
+
+    print(f"\n向量化完成！耗时 {time.time()-start_time:.2f} 秒")
+    print(
+        f"新增 {stats['added']} 个文件，更新 {stats['updated']} 个，"
+        f"跳过 {stats['skipped']} 个，删除 {stats['removed']} 个，"
+        f"失败 {len(stats['failed'])} 个"
+    )
+    count = vector_store.count() if hasattr(vector_store, "count") else vector_store._collection.count()
+    print(f"总文档块数：{count}，关键词索引：{len(keyword_index)}")
+    if hasattr(vector_store.embeddings, "stats"):
+        print(f"embedding 缓存：{vector_store.embeddings.stats()}")
+    return stats
 
 
-def vector_documents():
+def vector_documents(job=None, on_committed=None):
     """
-    启动文档向量化，并保存数据库
+    启动文档增量向量化，并保存数据库
     """
-    # 加载本地文档
-    documents = load_documents()
-    # 执行分割
-    split_docs = split_documents(documents)
-    # 执行向量化（使用之前分割好的split_docs）
-    create_vector_store(split_docs)
+    return create_vector_store(job=job, on_committed=on_committed)
@@ -0,0 +1,171 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+from fastapi import HTTPException
+
+from .base import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE
+from .metrics import llm_queue_seconds
+
+
+class Ticket:
+    """一次 LLM 调用的排队凭证"""
+
+    def __init__(self, key: str, granted: asyncio.Future):
+        self.key = key
+        self.granted = granted
+        self.enqueued_at = time.monotonic()
+        self.started_at: float | None = None
+        self.released = False
+
+    @property
+    def waited(self) -> float:
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+
+class LLMScheduler:
+    """
+    LLM 调用准入控制
+    - 同时调用 LLM 的数量不超过 max_concurrency，其余请求排队
+    - 排队按会话轮询：每个会话轮流获得一个名额，单个会话的连续提问不会挤占其他会话
+    - 排队数超过 max_queue 时拒绝请求（429），并根据平均耗时估算 Retry-After
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiting = 0
+        # 会话 -> 该会话排队中的凭证，按轮询顺序排列
+        self._queues: OrderedDict[str, deque[Ticket]] = OrderedDict()
+        # LLM 调用平均耗时（秒），用于估算 Retry-After
+        self._avg_duration = 10.0
+        self._avg_wait = 0.0
+        self.rejected = 0
+
+    def acquire(self, key: str) -> Ticket:
+        """
+        申请调用 LLM，返回排队凭证，通过 wait 等待获得名额
+        排队已满时抛出 429
+        """
+
+        ticket = Ticket(key, asyncio.get_running_loop().create_future())
+        if self._active < self.max_concurrency and not self._waiting:
+            self._grant(ticket)
+            return ticket
+
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="当前提问人数较多，请稍后重试。",
+                headers={"Retry-After": str(self.retry_after())},
+            )
+        self._queues.setdefault(key, deque()).append(ticket)
+        self._waiting += 1
+        return ticket
+
+    async def wait(self, ticket: Ticket, timeout: float | None = None) -> bool:
+        """等待获得名额，timeout 秒内未获得时返回 False"""
+
+        if ticket.granted.done():
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.granted), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        排队位置，从 1 开始，已获得名额时为 0
+        按轮询顺序：凭证是本会话排队中的第 r 个（从 0 开始）时，排在它前面的是每个会话的前 r 个，
+        以及轮询顺序在本会话之前、排队数超过 r 的会话的第 r 个。
+        不需要模拟出队，耗时与排队的会话数成正比（排队总数不超过 max_queue）
+        """
+
+        if ticket.granted.done():
+            return 0
+        queue = self._queues.get(ticket.key)
+        if not queue:
+            return 0
+        try:
+            rank = queue.index(ticket)
+        except ValueError:
+            return 0
+
+        position = 1
+        before = True
+        for key, other in self._queues.items():
+            if key == ticket.key:
+                before = False
+            position += min(len(other), rank)
+            if before and len(other) > rank:
+                position += 1
+        return position
+
+    def release(self, ticket: Ticket, used: bool = True):
+        """
+        LLM 调用结束或放弃排队时调用，重复调用只生效一次
+        used=False 表示获得名额后没有调用 LLM（命中回答缓存、检索出错），不计入平均耗时
+        """
+
+        if ticket.released:
+            return
+        ticket.released = True
+        if not ticket.granted.done():
+            # 还在排队：从队列中移除
+            queue = self._queues.get(ticket.key)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                self._waiting -= 1
+                if not queue:
+                    del self._queues[ticket.key]
+            ticket.granted.cancel()
+            return
+
+        self._active -= 1
+        if used:
+            duration = time.monotonic() - ticket.started_at
+            self._avg_duration = self._avg_duration * 0.9 + duration * 0.1
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        """估算排队中的请求全部开始所需的秒数"""
+
+        return max(1, math.ceil(self._avg_duration * (self._waiting + 1) / self.max_concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "avg_wait": round(self._avg_wait, 3),
+            "avg_duration": round(self._avg_duration, 3),
+            "rejected": self.rejected,
+        }
+
+    def _grant(self, ticket: Ticket):
+        self._active += 1
+        ticket.started_at = time.monotonic()
+        self._avg_wait = self._avg_wait * 0.9 + ticket.waited * 0.1
+        llm_queue_seconds.observe(ticket.waited)
+        ticket.granted.set_result(None)
+
+    def _dispatch(self):
+        """按会话轮询，把空出的名额分配给排队中的请求"""
+
+        while self._active < self.max_concurrency and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._grant(ticket)
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,206 @@
+import bisect
+import threading
+import time
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # 没有标签的指标从 0 开始输出
+        self._values: dict[tuple, float] = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """采集时调用 callback 读取当前值，callback 返回数值，或 {标签值元组: 数值}"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for label_values, v in value.items():
+            yield self.name, _format_labels(self.labels, label_values), v
+
+
+class CallbackCounter(Gauge):
+    """由其他组件自行计数、采集时读取的计数器（如缓存命中次数）"""
+
+    type = "counter"
+
+
+class Histogram:
+    """
+    直方图，记录观测值落在各个区间的次数
+    observe 只做一次二分查找和几次加法，可以放在请求路径上
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 标签值元组 -> [各区间计数..., 总和]
+        self._values: dict[tuple, list] = {} if labels else {(): [0] * (len(self.buckets) + 1)}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *label_values):
+        """计时上下文：with histogram.time(): ..."""
+
+        return _Timer(self, label_values)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, counts in items:
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket", labels, total
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, total
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Registry:
+    """指标注册表，render 输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"采集指标失败：{metric.name}，{str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+"""检索、LLM 首 token 等耗时的区间（秒）"""
+
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+"""SQLite 查询耗时的区间（秒）"""
+
+registry = Registry()
+
+retrieval_seconds = registry.register(
+    Histogram("docqa_retrieval_seconds", "文档检索耗时（秒）", LATENCY_BUCKETS)
+)
+llm_first_token_seconds = registry.register(
+    Histogram(
+        "docqa_llm_time_to_first_token_seconds",
+        "开始调用 LLM 到输出第一个 chunk 的耗时（秒），不含排队时间",
+        LATENCY_BUCKETS,
+    )
+)
+llm_tokens_per_second = registry.register(
+    Histogram(
+        "docqa_llm_tokens_per_second",
+        "每次回答第一个 chunk 之后的输出速度（chunk/秒）",
+        (1, 2, 5, 10, 20, 30, 50, 75, 100, 200),
+    )
+)
+llm_queue_seconds = registry.register(
+    Histogram("docqa_llm_queue_seconds", "等待调用 LLM 的排队时间（秒）", LATENCY_BUCKETS)
+)
+llm_tokens = registry.register(
+    Counter("docqa_llm_tokens_total", "LLM 输出的 chunk 总数")
+)
+llm_streams = registry.register(
+    Counter("docqa_llm_streams_total", "LLM 流式回答次数", ("status",))
+)
+embedding_chunks = registry.register(
+    Counter("docqa_embedding_chunks_total", "向量化写入的文本块总数")
+)
+embedding_seconds = registry.register(
+    Counter("docqa_embedding_seconds_total", "向量化写入文本块的总耗时（秒）")
+)
+embedding_batch_size = registry.register(
+    Histogram(
+        "docqa_embedding_batch_size",
+        "向量化每批写入的文本块数",
+        (1, 8, 16, 32, 64, 128, 256, 512, 1024),
+    )
+)
+sqlite_query_seconds = registry.register(
+    Histogram(
+        "docqa_sqlite_query_seconds", "SQLite 语句执行耗时（秒）", QUERY_BUCKETS, ("statement",)
+    )
+)
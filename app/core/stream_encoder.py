@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+from json.encoder import encode_basestring
+
+try:
+    # 可选依赖：安装 orjson 后使用更快的序列化
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _encode_string(value: str) -> bytes:
+    """序列化 JSON 字符串（含引号），不转义中文，与 json.dumps(ensure_ascii=False) 一致"""
+
+    if orjson is not None:
+        return orjson.dumps(value)
+    return encode_basestring(value).encode("utf-8")
+
+
+class StreamEncoder:
+    """
+    NDJSON 流式响应编码器
+    每一行的结构固定，只有 created_at 和 content 会变化，其余部分预先生成，
+    输出与 ChatStreamResponse 经 json.dumps 序列化的结果逐字节一致
+    """
+
+    def __init__(self, model: str):
+        self._prefix = b'{"model": ' + _encode_string(model) + b', "created_at": '
+        self._message = b', "message": {"role": "assistant", "content": '
+        self._thinking = b', "message": {"role": "assistant", "content": "", "thinking": '
+        self._suffix = b'}, "done": false}\n'
+        self._done_suffix = b'}, "done": true, "done_reason": "stop"}\n'
+
+    def encode(self, content: str, done: bool = False) -> bytes:
+        """assistant 消息转换成一行 JSON"""
+
+        return b"".join(
+            (
+                self._prefix,
+                str(int(round(time.time() * 1000))).encode("ascii"),
+                self._message,
+                _encode_string(content),
+                self._done_suffix if done else self._suffix,
+            )
+        )
+
+    def encode_queued(self, position: int, waited: float) -> bytes:
+        """排队状态：content 为空，queued 中为排队位置和已等待的毫秒数"""
+
+        return b"".join(
+            (
+                self._prefix,
+                str(int(round(time.time() * 1000))).encode("ascii"),
+                self._message,
+                b'""}, "done": false, "queued": {"position": ',
+                str(position).encode("ascii"),
+                b', "waited_ms": ',
+                str(int(waited * 1000)).encode("ascii"),
+                b"}}\n",
+            )
+        )
+
+    def encode_timings(self, timings: dict) -> bytes:
+        """调试用的各阶段耗时，在完成标记之后作为最后一行输出"""
+
+        return b"".join(
+            (
+                self._prefix,
+                str(int(round(time.time() * 1000))).encode("ascii"),
+                b', "timings": ',
+                json.dumps(timings, ensure_ascii=False).encode("utf-8"),
+                b"}\n",
+            )
+        )
+
+    def encode_thinking(self, thinking: str) -> bytes:
+        """推理过程单独输出时，放在 message.thinking 中（与 Ollama 的格式一致），content 为空"""
+
+        return b"".join(
+            (
+                self._prefix,
+                str(int(round(time.time() * 1000))).encode("ascii"),
+                self._thinking,
+                _encode_string(thinking),
+                self._suffix,
+            )
+        )
+
+
+async def coalesce(frames, interval_ms: float, max_bytes: int, max_pending: int = 64):
+    """
+    合并流式响应的多行输出，减少 HTTP 分块数量
+    缓冲的第一行输出后 interval_ms 毫秒，或缓冲超过 max_bytes 字节时发送。
+    只在行之间合并，每行仍然是完整的 JSON，按行解析的前端不受影响。
+    最多预先读取 max_pending 行，发送跟不上时暂停读取上游，不丢失背压。
+    """
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+    end = object()
+
+    async def pump():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+            await queue.put(end)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            # 提前结束时关闭上游，上游在 finally 中释放资源
+            await frames.aclose()
+
+    task = asyncio.create_task(pump())
+    buffer: list[bytes] = []
+    size = 0
+    deadline = None
+    try:
+        while True:
+            if buffer:
+                timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield b"".join(buffer)
+                    buffer, size = [], 0
+                    continue
+            else:
+                item = await queue.get()
+
+            if item is end:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            if not buffer:
+                deadline = time.monotonic() + interval_ms / 1000
+            buffer.append(item)
+            size += len(item)
+            if size >= max_bytes:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        # 客户端断开等提前结束时，停止读取上游
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
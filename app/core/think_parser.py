@@ -0,0 +1,114 @@
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag(text: str, tag: str, start: int = 0) -> int:
+    """text[start:] 末尾可能是 tag 的前半部分时，返回该部分的长度"""
+
+    # 标签只有开头一个 "<"，前半部分只可能从最后一个 "<" 开始
+    index = text.rfind("<", start)
+    if index < 0 or not tag.startswith(text[index:]):
+        return 0
+    return len(text) - index
+
+
+class ThinkParser:
+    """
+    增量解析 LLM 流式输出中的 <think>...</think> 推理过程
+    - 标签可以被拆分在任意两个 chunk 之间，一个 chunk 中也可以同时包含标签和文本
+    - 推理过程与回答分别保存在列表中，结束时再拼接，避免长回答反复拼接字符串
+    - feed：原样转发 chunk 时使用，只暂存 chunk，finish 时拼接后用 str.find 一次解析，每个 chunk 只有一次列表追加
+    - split：推理过程与回答分开输出时使用，每个 chunk 返回可以确定归属的片段；不含 "<" 的 chunk 不做其他处理
+    """
+
+    def __init__(self):
+        self.thinking = False
+        self._pending = ""
+        # feed 暂存的 chunk，finish 时统一解析
+        self._chunks: list[str] = []
+        self._think: list[str] = []
+        self._content: list[str] = []
+        # 当前部分的类型和保存列表，标签切换时更新
+        self._kind = "content"
+        self._current = self._content
+
+    def feed(self, chunk: str):
+        """输入一个 chunk，只暂存，finish 时再解析"""
+
+        self._chunks.append(chunk)
+
+    def split(self, chunk: str) -> list[tuple[str, str]]:
+        """
+        输入一个 chunk，返回可以确定归属的文本片段 [("think" | "content", text)]
+        末尾可能是标签一部分的文本暂存，等下一个 chunk 到达后再判断
+        """
+
+        if self._chunks:
+            self._flush()
+        if not self._pending and "<" not in chunk:
+            if chunk:
+                self._current.append(chunk)
+                return [(self._kind, chunk)]
+            return []
+        text = self._pending + chunk
+        tag = THINK_CLOSE if self.thinking else THINK_OPEN
+        if tag in text:
+            self._pending = ""
+            return self._split_tags(text)
+        # 没有完整的标签：末尾可能是标签前半部分的文本暂存，其余归入当前部分
+        keep = _partial_tag(text, tag)
+        if keep:
+            text, self._pending = text[:-keep], text[-keep:]
+        else:
+            self._pending = ""
+        if not text:
+            return []
+        self._current.append(text)
+        return [(self._kind, text)]
+
+    def _flush(self):
+        """解析 feed 暂存的 chunk"""
+
+        text = "".join(self._chunks)
+        self._chunks.clear()
+        self.split(text)
+
+    def _split_tags(self, text: str) -> list[tuple[str, str]]:
+        """text 中有完整的标签：从上次的位置继续用 str.find 查找下一个标签，不逐字符处理"""
+
+        segments = []
+        start = 0
+        while True:
+            tag = THINK_CLOSE if self.thinking else THINK_OPEN
+            index = text.find(tag, start)
+            if index < 0:
+                end = len(text) - _partial_tag(text, tag, start)
+                self._pending = text[end:]
+                self._append(segments, text[start:end])
+                return segments
+            self._append(segments, text[start:index])
+            self.thinking = not self.thinking
+            self._kind = "think" if self.thinking else "content"
+            self._current = self._think if self.thinking else self._content
+            start = index + len(tag)
+
+    def finish(self) -> list[tuple[str, str]]:
+        """输出结束，暂存的文本不再可能组成标签，按当前状态输出"""
+
+        segments = self.split("") if self._chunks else []
+        self._append(segments, self._pending)
+        self._pending = ""
+        return segments
+
+    def _append(self, segments: list, text: str):
+        if text:
+            self._current.append(text)
+            segments.append((self._kind, text))
+
+    @property
+    def think(self) -> str:
+        return "".join(self._think)
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content)
@@ -0,0 +1,101 @@
+import json
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .base import TRACE_SAMPLE_RATE
+
+
+class Trace:
+    """
+    一次请求的分阶段耗时
+    - 未采样的请求不记录任何阶段，span 只多一次函数调用
+    - 采样的请求结束时输出一行 JSON 日志
+    - debug 为 True 时（请求带调试请求头）必定采样，timings 会在响应流的最后一行返回
+    """
+
+    def __init__(self, name: str, sampled: bool, debug: bool = False):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled
+        self.debug = debug
+        self.start = time.perf_counter()
+        self.spans: list[dict] = []
+        self.marks: dict[str, float] = {}
+        self.attrs: dict = {}
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """记录 with 语句块的耗时，yield 的 dict 中可以补充阶段信息（如文本块数）"""
+
+        if not self.sampled:
+            yield attrs
+            return
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.add(name, start, time.perf_counter(), **attrs)
+
+    def add(self, name: str, start: float, end: float, **attrs):
+        """记录一个已知起止时间的阶段"""
+
+        if not self.sampled:
+            return
+        self.spans.append(
+            {
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 2),
+                "duration_ms": round((end - start) * 1000, 2),
+                **attrs,
+            }
+        )
+
+    def mark(self, name: str) -> float:
+        """记录一个时间点，用于之后计算跨函数的阶段耗时"""
+
+        now = time.perf_counter()
+        self.marks[name] = now
+        return now
+
+    def timings(self) -> dict:
+        return {
+            "trace_id": self.id,
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "spans": self.spans,
+            **self.attrs,
+        }
+
+    def finish(self, **attrs):
+        """请求结束，采样时输出结构化日志"""
+
+        if not self.sampled:
+            return
+        self.attrs.update(attrs)
+        print(json.dumps({"event": "trace", "name": self.name, **self.timings()}, ensure_ascii=False))
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+def start_trace(name: str, debug: bool = False, sample_rate: float = TRACE_SAMPLE_RATE) -> Trace:
+    """开始记录请求的耗时，按 sample_rate 采样"""
+
+    trace = Trace(name, debug or random.random() < sample_rate, debug)
+    _current_trace.set(trace)
+    return trace
+
+
+def use_trace(trace: Trace | None):
+    """在其他任务（如响应流）中继续使用同一个 trace"""
+
+    _current_trace.set(trace)
+
+
+def current_trace() -> Trace | None:
+    """当前请求已采样的 trace，未采样时返回 None"""
+
+    trace = _current_trace.get()
+    return trace if trace is not None and trace.sampled else None
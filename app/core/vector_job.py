@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .base import bm25_index
+from .langchain_retrieval import invalidate_qa_chain
+from .langchain_vector import VectorizeCancelled, vector_documents
+
+
+class VectorJob:
+    """向量化后台任务，记录执行阶段与进度"""
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        # 执行阶段：queued / scanning / removing / embedding / done / failed / cancelled
+        self.stage = "queued"
+        self.files_total = 0
+        self.files_processed = 0
+        self.chunks_processed = 0
+        self.result: dict | None = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.embedding_started_at: float | None = None
+        self.finished_at: float | None = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.finished_at is None
+
+    def update(self, stage=None, files=0, chunks=0):
+        """更新执行阶段与进度，由向量化线程调用"""
+        if stage:
+            self.stage = stage
+            if stage == "embedding":
+                self.embedding_started_at = time.time()
+        self.files_processed += files
+        self.chunks_processed += chunks
+
+    def cancel(self):
+        """请求取消任务，向量化线程会在下一个检查点退出"""
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise VectorizeCancelled()
+
+    def finish(self, stage: str):
+        self.stage = stage
+        self.finished_at = time.time()
+
+    def to_dict(self):
+        """任务状态，吞吐量为每秒向量化的文本块数，ETA 按已处理文件的平均耗时估算"""
+
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        throughput = None
+        eta = None
+        if self.embedding_started_at:
+            embedding_elapsed = end - self.embedding_started_at
+            if embedding_elapsed > 0:
+                throughput = round(self.chunks_processed / embedding_elapsed, 2)
+            if self.running and self.files_processed:
+                remaining = self.files_total - self.files_processed
+                eta = round(embedding_elapsed / self.files_processed * remaining, 1)
+        return {
+            "id": self.id,
+            "stage": self.stage,
+            "files_total": self.files_total,
+            "files_processed": self.files_processed,
+            "chunks_processed": self.chunks_processed,
+            "throughput": throughput,
+            "eta": eta,
+            "elapsed": round(elapsed, 1),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class VectorJobManager:
+    """向量化任务管理，在独立线程池中执行，避免阻塞事件循环"""
+
+    def __init__(self, max_history: int = 20):
+        # 同一时间只运行一个向量化任务，重复提交返回正在运行的任务
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="vector-job"
+        )
+        self._jobs: dict[str, VectorJob] = {}
+        self._lock = threading.Lock()
+        self._max_history = max_history
+
+    def submit(self, on_committed=None) -> VectorJob:
+        """提交向量化任务，立即返回任务对象"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.running:
+                    return job
+
+            job = VectorJob()
+            self._jobs[job.id] = job
+            # 只保留最近的任务记录
+            overflow = max(0, len(self._jobs) - self._max_history)
+            finished = [j.id for j in self._jobs.values() if not j.running]
+            for job_id in finished[:overflow]:
+                del self._jobs[job_id]
+
+        self._executor.submit(self._run, job, on_committed)
+        return job
+
+    def get(self, job_id: str) -> VectorJob | None:
+        return self._jobs.get(job_id)
+
+    def _run(self, job: VectorJob, on_committed):
+        job.started_at = time.time()
+        # 向量数据库的每次写入和删除都同时写入关键词索引，版本不变说明索引内容没有变化
+        version = bm25_index().version
+        try:
+            job.result = vector_documents(job=job, on_committed=on_committed)
+            stage = "done"
+        except VectorizeCancelled:
+            stage = "cancelled"
+        except Exception as e:
+            job.error = str(getattr(e, "detail", e))
+            stage = "failed"
+
+        # 取消或失败时也可能已写入部分文件，同样需要切换到新的检索链；
+        # 没有任何变化时保留原检索链，也不清空回答缓存
+        if job.chunks_processed or bm25_index().version != version:
+            try:
+                invalidate_qa_chain()
+            except Exception as e:
+                print(f"刷新检索链失败：{str(e)}")
+        job.finish(stage)
+
+
+vector_job_manager = VectorJobManager()
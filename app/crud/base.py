@@ -1,27 +1,156 @@
-from typing import Annotated
-from fastapi import Depends
-from sqlmodel import SQLModel, Session, create_engine
+import os
+import time
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from core.metrics import sqlite_query_seconds
 
 
 # 导入所有数据库表
 from models import document_model, chat_session_model, chat_history_model
 
-# 创建数据库
-sqlite_file_name = "document_qa.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+# 创建数据库，路径可通过环境变量 DOC_QA_DB_PATH 指定
+sqlite_file_name = os.getenv("DOC_QA_DB_PATH", "document_qa.db")
+
+SQL_ECHO = os.getenv("DOC_QA_SQL_ECHO", "") == "1"
+"""是否打印 SQL 语句，仅用于调试，打印日志会拖慢每次查询"""
+
+DB_POOL_SIZE = 5
+"""连接池保持的连接数"""
+
+DB_MAX_OVERFLOW = 10
+"""连接池在 DB_POOL_SIZE 之外最多临时创建的连接数"""
+
+HISTORY_FLUSH_MS = 5
+"""聊天记录批量写入的间隔（毫秒）"""
+
+HISTORY_BATCH_SIZE = 256
+"""聊天记录每批最多写入的条数"""
+
+HISTORY_QUEUE_SIZE = 10000
+"""聊天记录写入队列的容量，队列满时写入方等待"""
+
+HISTORY_READ_THREADS = 1
+"""
+查询会话全部聊天记录的线程数
+单核机器上多个线程同时构造结果会争抢 GIL，事件循环（流式输出）要等待线程切换，一个线程时延迟最平稳
+"""
+
+SQLITE_PRAGMAS = {
+    # WAL 模式下读写互不阻塞，聊天记录的写入不会阻塞历史记录查询
+    "journal_mode": "WAL",
+    # WAL 模式下 NORMAL 不会损坏数据库，只在断电时可能丢失最后几次提交
+    "synchronous": "NORMAL",
+    # 页缓存 64MB（负数单位为 KB）
+    "cache_size": -64000,
+    # 内存映射读取 256MB
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    # 数据库被锁定时等待 5 秒再报错
+    "busy_timeout": 5000,
+}
+"""每个新连接执行的 PRAGMA 设置"""
+
+
+def set_sqlite_pragmas(engine, pragmas: dict):
+    """在每个新建的连接上执行 PRAGMA 设置"""
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
-engine = create_engine(sqlite_url, echo=True)
+
+def record_query_latency(engine):
+    """记录每条 SQL 语句的执行耗时，按语句类型（SELECT、INSERT 等）统计"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start", None)
+        if start is not None:
+            kind = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+            sqlite_query_seconds.observe(time.perf_counter() - start, kind)
+
+
+def create_sqlite_engines(path: str, pragmas: dict = SQLITE_PRAGMAS, echo: bool = SQL_ECHO):
+    """
+    创建同步与异步引擎
+    - 同步引擎：用于建表，以及在后台线程（如向量化任务）中访问数据库
+    - 异步引擎：路由中访问数据库使用 aiosqlite，不阻塞事件循环
+    """
+
+    sync_engine = create_engine(
+        f"sqlite:///{path}",
+        echo=echo,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{path}",
+        echo=echo,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+    if pragmas:
+        set_sqlite_pragmas(sync_engine, pragmas)
+        set_sqlite_pragmas(async_engine.sync_engine, pragmas)
+    record_query_latency(sync_engine)
+    record_query_latency(async_engine.sync_engine)
+    return sync_engine, async_engine
+
+
+engine, async_engine = create_sqlite_engines(sqlite_file_name)
+
+
+def add_missing_columns(engine):
+    """
+    已有的表补建模型中新增的列（create_all 不会修改已有的表）
+    只支持可以直接 ADD COLUMN 的列：可为空，或有简单的默认值
+    """
+
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    ddl += f" NOT NULL DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+                elif not column.nullable:
+                    print(f"无法自动添加列 {table.name}.{column.name}：非空且没有默认值")
+                    continue
+                connection.execute(text(ddl))
+                print(f"已添加列 {table.name}.{column.name}")
 
 
 def create_db_and_tables():
     """创建数据库和所有表"""
     SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine)
+    # create_all 只为新建的表创建索引，已有的表补建缺少的索引
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 
-def get_session():
-    """依赖注入，将engine注册到FastApi session中"""
-    with Session(engine) as session:
-        yield session
-
+def async_session():
+    """
+    创建异步 session
+    提交后不让对象过期，提交后读取对象属性时不会再隐式查询数据库（异步 session 中不允许隐式 IO）
+    """
+    return AsyncSession(async_engine, expire_on_commit=False)
 
-SessionDep = Annotated[Session, Depends(get_session)]
@@ -1,40 +1,67 @@
-from sqlmodel import Session, desc, select
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import desc, select
 from models.chat_history_model import ChatHistory, ChatHistoryCreate
 
-from .base import engine
+from .base import HISTORY_READ_THREADS, async_session, engine
+from .history_writer import history_writer
+
+# 查询会话全部聊天记录的线程池
+_history_reader = ThreadPoolExecutor(max_workers=HISTORY_READ_THREADS, thread_name_prefix="history-read")
 
 
 class ChatHistoryCrud:
 
-    def add_item(slef, chat_history: ChatHistoryCreate):
-        """chat历史添加记录"""
+    async def add_item(slef, chat_history: ChatHistoryCreate):
+        """chat历史添加记录，加入写入队列后批量提交"""
         chat_history = chat_history.model_dump(exclude_unset=True)
 
-        with Session(engine) as session:
-            db_history = ChatHistory.model_validate(chat_history)
-            session.add(db_history)
-            session.commit()
-            session.refresh(db_history)
-            return db_history
+        db_history = ChatHistory.model_validate(chat_history)
+        return await history_writer.submit(db_history)
+
+    async def list_by_chat_session_id(self, chatSessionId: str):
+        """
+        查询会话的全部记录，按时间正序返回
+        会话的记录可能很多，查询和构造结果在单独的线程中进行，不占用事件循环（不影响正在输出的流式响应）；
+        只查询列、不构造 ORM 对象，返回的行可以像 ChatHistory 一样按属性读取
+        """
+        # 先等待该会话队列中的记录提交，保证能查询到刚写入的记录
+        await history_writer.wait_for(chatSessionId)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_history_reader, self._list_by_chat_session_id, chatSessionId)
+
+    def _list_by_chat_session_id(self, chatSessionId: str):
+        query = (
+            select(*ChatHistory.__table__.columns)
+            .where(ChatHistory.chat_session_id == chatSessionId)
+            .order_by(ChatHistory.date)
+        )
+        with engine.connect() as connection:
+            return connection.execute(query).all()
 
-    def list_by_chat_session_id(self, chatSessionId: str):
-        with Session(engine) as session:
+    async def list_recent_by_chat_session_id(self, chatSessionId: str, limit: int):
+        """查询会话最近的 limit 条记录，按时间正序返回"""
+        await history_writer.wait_for(chatSessionId)
+        async with async_session() as session:
             query = (
                 select(ChatHistory)
                 .where(ChatHistory.chat_session_id == chatSessionId)
-                .order_by(ChatHistory.date)
+                .order_by(desc(ChatHistory.date))
+                .limit(limit)
             )
-            result_list = session.exec(query).all()
-            return result_list
+            result_list = (await session.exec(query)).all()
+            return list(reversed(result_list))
 
-    def delete_by_chat_session_id(self, chatSessionId: str):
+    async def delete_by_chat_session_id(self, chatSessionId: str):
         """删除历史记录"""
-        with Session(engine) as session:
+        await history_writer.wait_for(chatSessionId)
+        async with async_session() as session:
             query = select(ChatHistory).where(
                 ChatHistory.chat_session_id == chatSessionId
             )
 
-            result_list = session.exec(query).all()
+            result_list = (await session.exec(query)).all()
             for db_chat in result_list:
-                session.delete(db_chat)
-            session.commit()
+                await session.delete(db_chat)
+            await session.commit()
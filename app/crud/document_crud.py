@@ -13,7 +13,7 @@ from models.document_model import (
     UpdateFormData,
     UploadFormData,
 )
-from .base import engine
+from .base import async_session, engine
 
 
 class DocumentCrud:
@@ -54,11 +54,11 @@ class DocumentCrud:
             vector="",
         )
 
-        with Session(engine) as session:
+        async with async_session() as session:
             db_document = Document.model_validate(doc)
             session.add(db_document)
-            session.commit()
-            session.refresh(db_document)
+            await session.commit()
+            await session.refresh(db_document)
             return db_document
 
     async def update(self, data: UpdateFormData):
@@ -71,8 +71,8 @@ class DocumentCrud:
             vector=data.vector,
         )
 
-        with Session(engine) as session:
-            db_document = session.get(Document, data.id)
+        async with async_session() as session:
+            db_document = await session.get(Document, data.id)
             if not db_document:
                 raise HTTPException(status_code=404, detail="找不到该记录。")
 
@@ -90,29 +90,29 @@ class DocumentCrud:
             doc = doc.model_dump(exclude_unset=True)
             db_document.sqlmodel_update(doc)
             session.add(db_document)
-            session.commit()
-            session.refresh(db_document)
+            await session.commit()
+            await session.refresh(db_document)
             return db_document
 
     async def delete(self, id: str):
         """删除文档记录，并删除文件"""
-        with Session(engine) as session:
-            document = session.get(Document, id)
+        async with async_session() as session:
+            document = await session.get(Document, id)
             if not document:
                 raise HTTPException(status_code=404, detail="文档未找到")
 
             path = Path(self.__BASE_PATH + document.file_path)
             await self.__delete_file(path)
 
-            session.delete(document)
-            session.commit()
+            await session.delete(document)
+            await session.commit()
 
-    def page(self, params: DocumentParams):
+    async def page(self, params: DocumentParams):
         """查询文档记录，分页"""
         offset = params.page_num * params.page_size
         limit = params.page_size
         name = params.name
-        with Session(engine) as session:
+        async with async_session() as session:
             count_query = select(func.count(Document.id))
             query = select(Document)
 
@@ -123,8 +123,8 @@ class DocumentCrud:
 
             query.order_by(desc(Document.date)).offset(offset).limit(limit)
 
-            total = session.exec(count_query).one()
-            items = session.exec(query).all()
+            total = (await session.exec(count_query)).one()
+            items = (await session.exec(query)).all()
             list = [DocumentFormat.model_validate(d) for d in items]
             return {
                 "total": total,
@@ -133,9 +133,9 @@ class DocumentCrud:
                 "list": list,
             }
 
-    def download(self, item_id: uuid.UUID):
-        with Session(engine) as session:
-            document = session.get(Document, item_id)
+    async def download(self, item_id: uuid.UUID):
+        async with async_session() as session:
+            document = await session.get(Document, item_id)
             if not document:
                 raise HTTPException(status_code=404, detail="文档未找到")
 
@@ -144,9 +144,13 @@ class DocumentCrud:
 
             return file_path, real_name
 
-    def vector_all_docs(self):
+    def vector_all_docs(self, file_names: list[str]):
+        """
+        标记文档已向量化，只标记文本块已写入向量数据库的文件
+        由向量化任务的后台线程调用，使用同步 session
+        """
         with Session(engine) as session:
-            query = select(Document)
+            query = select(Document).where(Document.file_name.in_(file_names))
             doc_list = session.exec(query).all()
             for doc in doc_list:
                 doc.vector = "yes"
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from models.chat_history_model import ChatHistory
+
+from .base import HISTORY_BATCH_SIZE, HISTORY_FLUSH_MS, HISTORY_QUEUE_SIZE, async_session
+
+
+class HistoryWriter:
+    """
+    聊天记录延迟批量写入
+    - 多个会话的聊天记录先放入有界队列，每隔 flush_ms 毫秒在一个事务中批量提交，减少提交（fsync）次数
+    - 队列满时写入方等待，内存占用有上限
+    - wait_for 等待会话已提交的写入全部落库，保证同一会话写入后立即查询能读到；写入失败（重试后仍失败）时抛出 500
+    - 关闭服务时调用 stop，提交队列中剩余的记录
+    """
+
+    def __init__(
+        self,
+        flush_ms: float = HISTORY_FLUSH_MS,
+        batch_size: int = HISTORY_BATCH_SIZE,
+        queue_size: int = HISTORY_QUEUE_SIZE,
+    ):
+        self.flush_ms = flush_ms
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._loop = None
+        # 会话 id -> 该会话最后一条记录提交完成的 Future
+        self._pending: dict = {}
+
+    def start(self):
+        """启动后台写入任务，需要在事件循环中调用"""
+
+        loop = asyncio.get_running_loop()
+        if self._task and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pending = {}
+        self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """提交队列中剩余的记录并停止后台任务"""
+
+        if not self._task or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, history: ChatHistory) -> ChatHistory:
+        """加入写入队列，返回的对象在提交前已带有 id 和时间"""
+
+        self.start()
+        future = self._loop.create_future()
+        self._pending[history.chat_session_id] = future
+        await self._queue.put((history, future))
+        return history
+
+    async def wait_for(self, chat_session_id):
+        """
+        等待会话已加入队列的记录全部提交
+        最近的记录写入失败时抛出 500，只报告一次
+        """
+
+        future = self._pending.get(chat_session_id)
+        if future is None:
+            return
+        if not future.done():
+            if future.get_loop() is not asyncio.get_running_loop():
+                # 后台任务所在的事件循环已更换（如测试时每次请求使用新的事件循环）
+                return
+            await asyncio.wait([future])
+        error = future.exception()
+        if error is not None:
+            if self._pending.get(chat_session_id) is future:
+                del self._pending[chat_session_id]
+            raise HTTPException(status_code=500, detail=f"保存聊天记录失败：{str(error)}")
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # 第一条记录到达后，再等待 flush_ms 毫秒收集同一批次的记录
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+
+    async def _commit(self, batch: list):
+        histories = [history for history, _ in batch]
+        error = None
+        for attempt in range(2):
+            try:
+                async with async_session() as session:
+                    session.add_all(histories)
+                    await session.commit()
+                error = None
+                break
+            except Exception as e:
+                error = e
+                print(f"保存聊天记录失败（第 {attempt + 1} 次）：{str(e)}")
+        else:
+            print(f"丢弃 {len(histories)} 条聊天记录")
+
+        for history, future in batch:
+            if error is None:
+                if not future.done():
+                    future.set_result(None)
+                if self._pending.get(history.chat_session_id) is future:
+                    del self._pending[history.chat_session_id]
+            elif not future.done():
+                # 写入失败：等待中的查询抛出异常；失败的 Future 留在 _pending 中，之后查询该会话时报告
+                future.set_exception(error)
+                # 没有等待方时不打印 "exception was never retrieved"
+                future.exception()
+
+
+history_writer = HistoryWriter()
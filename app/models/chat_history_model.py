@@ -1,16 +1,23 @@
 from datetime import datetime
 import uuid
 from pydantic import BaseModel, field_validator
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, Index, SQLModel
 
 
 class ChatHistory(SQLModel, table=True):
     """chathistory表"""
 
+    # 按会话查询最近的聊天记录
+    __table_args__ = (
+        Index("ix_chathistory_session_date", "chat_session_id", "date"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     role: str
     content: str
     think: str | None = None
+    # 客户端中途断开，回答不完整
+    truncated: bool = False
     chat_session_id: uuid.UUID | None = None
     date: datetime = Field(default_factory=datetime.now)
 
@@ -19,6 +26,7 @@ class ChatHistoryCreate(SQLModel):
     role: str
     content: str
     think: str | None = None
+    truncated: bool = False
     chat_session_id: uuid.UUID | None = None
 
 
@@ -29,6 +37,7 @@ class ChatHistoryFormat(SQLModel):
     role: str
     content: str
     think: str | None = None
+    truncated: bool = False
     chat_session_id: uuid.UUID | None = None
     date: str
 
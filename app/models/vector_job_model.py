@@ -0,0 +1,25 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class VectorJobFormat(BaseModel):
+    """向量化任务状态"""
+
+    id: str
+    stage: str
+    files_total: int
+    files_processed: int
+    chunks_processed: int
+    throughput: Optional[float] = None
+    eta: Optional[float] = None
+    elapsed: float
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+
+class VectorJobResponse(BaseModel):
+    """响应体"""
+
+    code: int
+    message: str
+    data: VectorJobFormat
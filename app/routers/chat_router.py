@@ -1,16 +1,33 @@
-import json
 import time
 from typing import Annotated
-from fastapi import APIRouter, Form, HTTPException, Query
-from fastapi.encoders import jsonable_encoder
+import anyio
+from fastapi import APIRouter, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from crud.chat_history_crud import ChatHistoryCrud
 from models.chat_history_model import ChatHistoryCreate, ChatHistoryResponse
 from models.chat_session_model import ChatSessionParams
-from models.chat_model import ChatParams, ChatStreamResponse, Chatting
-from core.base import MODEL_NAME
-from core.langchain_retrieval import build_history_template, build_qa_chain
+from models.chat_model import ChatParams
+from core.answer_cache import answer_cache
+from core.base import (
+    DISCONNECT_CHECK_INTERVAL,
+    HISTORY_MAX_TURNS,
+    LLM_QUEUE_REPORT_INTERVAL,
+    MODEL_NAME,
+    STREAM_COALESCE_BYTES,
+    STREAM_COALESCE_MS,
+    STREAM_COALESCE_QUEUE,
+    STREAM_SPLIT_THINK,
+    TRACE_DEBUG_HEADER,
+)
+from core.langchain_retrieval import build_history_template, estimate_tokens, get_qa, retrieve
+from core.llm_scheduler import llm_scheduler
+from core.metrics import llm_first_token_seconds, llm_streams, llm_tokens, llm_tokens_per_second
+from core.stream_encoder import StreamEncoder, coalesce
+from core.think_parser import ThinkParser
+from core.tracing import Trace, start_trace, use_trace
 from routers.base import success
 
 
@@ -21,103 +38,292 @@ router = APIRouter(
 )
 
 chat_history_crud = ChatHistoryCrud()
+stream_encoder = StreamEncoder(MODEL_NAME)
 
 
 @router.post("")
-async def chatting(data: ChatParams):
+async def chatting(data: ChatParams, request: Request):
     if not data.messages:
         raise HTTPException(status_code=500, detail="网络异常，请稍后重试！")
 
-    # 先获取历史记录
-    history_list = chat_history_crud.list_by_chat_session_id(data.chat_session_id)
-    # 再保存 user 消息到历史记录中
-    user_chat = ChatHistoryCreate(
-        role=data.messages.role,
-        content=data.messages.content,
-        chat_session_id=data.chat_session_id,
-    )
-    chat_history_crud.add_item(user_chat)
+    # 记录各阶段耗时，带调试请求头时在响应流最后返回
+    trace = start_trace("chat", debug=request.headers.get(TRACE_DEBUG_HEADER) == "1")
+    trace.attrs["chat_session_id"] = str(data.chat_session_id)
 
-    # 历史记录转换成LangChain提示词模板
-    history_message = build_history_template(history_list)
-    # LangChain 检索链 astream() 的参数
-    invoke_params = {"question": data.messages.content, "chat_history": history_message}
+    # 先申请调用 LLM，按会话公平排队，排队已满时返回 429，被拒绝的提问不保存、不检索；
+    # 排队期间继续读取历史记录和检索文档
+    try:
+        ticket = llm_scheduler.acquire(str(data.chat_session_id))
+    except HTTPException as e:
+        trace.finish(status=e.status_code)
+        raise
 
     try:
-        chain = build_qa_chain()
-        return StreamingResponse(
-            generate_stream(chain, invoke_params, data.chat_session_id),
-            media_type="application/x-ndjson",
+        # 先获取最近的历史记录
+        with trace.span("load_history") as span:
+            history_list = await chat_history_crud.list_recent_by_chat_session_id(
+                data.chat_session_id, HISTORY_MAX_TURNS * 2
+            )
+            span["messages"] = len(history_list)
+        # 再保存 user 消息到历史记录中
+        user_chat = ChatHistoryCreate(
+            role=data.messages.role,
+            content=data.messages.content,
+            chat_session_id=data.chat_session_id,
+        )
+        with trace.span("save_question"):
+            await chat_history_crud.add_item(user_chat)
+
+        # 历史记录转换成LangChain提示词模板
+        with trace.span("build_history") as span:
+            history_message = build_history_template(history_list)
+            if trace.sampled:
+                span["messages"] = len(history_message)
+                span["tokens"] = sum(estimate_tokens(str(m.content)) for m in history_message)
+        question = data.messages.content
+
+        with trace.span("load_chain"):
+            qa = get_qa()
+        # 先检索文档，检索结果同时用于校验缓存的回答是否仍然有效
+        with trace.span("retrieve") as span:
+            docs = await run_in_threadpool(retrieve, qa.retriever, question)
+            span["chunks"] = len(docs)
+            span["chars"] = sum(len(doc.page_content) for doc in docs)
+        # LangChain 检索链 astream() 的参数
+        invoke_params = {
+            "question": question,
+            "chat_history": history_message,
+            "context": docs,
+        }
+
+        # 只缓存没有历史记录的提问，追问的回答依赖上下文，不能复用
+        cache_params = None
+        if not history_list:
+            with trace.span("cache_lookup") as span:
+                cached, vector = await run_in_threadpool(
+                    answer_cache.lookup, question, docs, qa.version
+                )
+                span["hit"] = cached is not None
+            if cached:
+                # 命中缓存不调用 LLM，归还名额
+                llm_scheduler.release(ticket, used=False)
+                return stream_response(replay_stream(cached, data.chat_session_id, trace))
+            cache_params = (vector, docs, qa.version)
+
+        return stream_response(
+            generate_stream(
+                qa.chain, invoke_params, data.chat_session_id, ticket, cache_params, request, trace
+            ),
+            ticket,
         )
+    except HTTPException as e:
+        llm_scheduler.release(ticket, used=False)
+        trace.finish(status=e.status_code)
+        raise
     except Exception as e:
+        llm_scheduler.release(ticket, used=False)
+        trace.finish(status=500)
         raise HTTPException(status_code=500, detail=f"流式响应失败：{str(e)}")
 
 
+def stream_response(frames, ticket=None):
+    """NDJSON 流式响应，开启 STREAM_COALESCE_MS 时合并多个 token 后再发送"""
+
+    if STREAM_COALESCE_MS > 0:
+        frames = coalesce(frames, STREAM_COALESCE_MS, STREAM_COALESCE_BYTES, STREAM_COALESCE_QUEUE)
+    return StreamingResponse(
+        frames,
+        media_type="application/x-ndjson",
+        background=BackgroundTask(close_stream, frames, ticket),
+    )
+
+
+async def close_stream(frames, ticket=None):
+    """
+    响应结束后关闭响应流
+    客户端断开时 StreamingResponse 不会关闭响应流，这里主动关闭，立即停止调用 LLM；
+    响应流未开始就被中断时，也要归还 LLM 名额
+    """
+
+    await frames.aclose()
+    if ticket:
+        llm_scheduler.release(ticket)
+
+
+def encode_chunk(chunk: str, parser: ThinkParser):
+    """
+    LLM 输出的 chunk 交给解析器，并转换成流式响应的行
+    默认原样输出（包含 <think> 标签），解析器只收集推理过程与回答；
+    STREAM_SPLIT_THINK 时按解析结果分别输出推理过程和回答
+    """
+
+    if not STREAM_SPLIT_THINK:
+        parser.feed(chunk)
+        return [stream_encoder.encode(chunk)]
+    return encode_segments(parser.split(chunk))
+
+
+def encode_segments(segments: list[tuple[str, str]]):
+    return [
+        stream_encoder.encode_thinking(text) if kind == "think" else stream_encoder.encode(text)
+        for kind, text in segments
+    ]
+
+
 # chat 返回响应流
-async def generate_stream(chain, invoke_params, chat_session_id):
+async def generate_stream(
+    chain, invoke_params, chat_session_id, ticket, cache_params=None, request=None, trace=None
+):
     """LangChain 流响应转 JSON 字符串流响应"""
 
-    think = ""
-    content = ""
-    isThinking = False
-    # 一个跳过本次循环的标记，目的是剔除think标签
-    loop_continue = False
-
-    async for chunk in chain.astream(invoke_params):
-        # 收集 think 和 content
-        loop_continue = False
-        if "<think>" in chunk:
-            isThinking = True
-            loop_continue = True
-        if "</think>" in chunk:
-            isThinking = False
-            loop_continue = True
-        if not loop_continue:
-            if isThinking:
-                think += chunk
-            else:
-                content += chunk
-
-        json_chunk = json.dumps(
-            jsonable_encoder(
-                ChatStreamResponse(
-                    model=MODEL_NAME,
-                    created_at=int(round(time.time() * 1000)),
-                    message=Chatting(role="assistant", content=chunk),
-                    done=False,
-                ).model_dump(exclude_none=True)
-            ),
-            ensure_ascii=False,
-        )
-        # 换行符分隔JSON行
-        yield f"{json_chunk}\n"
-
-    # 流结束后发送完成标记
-    done = json.dumps(
-        jsonable_encoder(
-            ChatStreamResponse(
-                model=MODEL_NAME,
-                created_at=int(round(time.time() * 1000)),
-                message=Chatting(role="assistant", content=""),
-                done=True,
-                done_reason="stop",
-            )
-        ),
-        ensure_ascii=False,
-    )
-    yield f"{done}\n"
+    # 增量解析 think 和 content
+    parser = ThinkParser()
+    chunks = []
+    stream = None
+    completed = False
+    token_count = 0
+    first_token_at = None
+    # 响应流可能在其他任务中执行，检索链中记录提示词耗时需要同一个 trace
+    trace = trace or Trace("chat", sampled=False)
+    use_trace(trace)
+
+    try:
+        # 排队期间定时发送排队位置和已等待时间
+        queued_at = time.perf_counter()
+        position = 0
+        while not ticket.granted.done():
+            if request and await request.is_disconnected():
+                return
+            position = llm_scheduler.position(ticket)
+            yield stream_encoder.encode_queued(position, ticket.waited)
+            await llm_scheduler.wait(ticket, LLM_QUEUE_REPORT_INTERVAL)
+
+        stream = chain.astream(invoke_params)
+        started_at = trace.mark("llm_start")
+        trace.add("queue", queued_at, started_at, position=position)
+        check_at = time.monotonic() + DISCONNECT_CHECK_INTERVAL
+        async for chunk in stream:
+            # 只计数，结束后再记录指标，不增加每个 chunk 的开销
+            token_count += 1
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                llm_first_token_seconds.observe(first_token_at - started_at)
+                # 提示词渲染完成到第一个 chunk，主要是模型的 prefill 耗时
+                trace.add("prefill", trace.marks.get("prompt_ready", started_at), first_token_at)
+            if cache_params:
+                chunks.append(chunk)
+            for frame in encode_chunk(chunk, parser):
+                yield frame
+            # 按间隔检查客户端是否已断开，不在每个 chunk 上检查
+            if request and time.monotonic() >= check_at:
+                if await request.is_disconnected():
+                    return
+                check_at = time.monotonic() + DISCONNECT_CHECK_INTERVAL
+        completed = True
+        if first_token_at is not None:
+            trace.add("generate", first_token_at, time.perf_counter(), chunks=token_count)
+    finally:
+        # 客户端断开时任务已被取消，清理过程不能再被取消
+        with anyio.CancelScope(shield=True):
+            if stream is not None:
+                # 关闭 LLM 的流式输出，释放与 Ollama 的连接，Ollama 随之停止生成
+                await stream.aclose()
+            # LLM 输出结束、出错或客户端断开时归还名额
+            llm_scheduler.release(ticket)
+            if stream is not None:
+                record_stream_metrics(token_count, first_token_at, completed)
+            if stream is not None and not completed:
+                # 中断时保存已生成的部分回答，标记为不完整
+                parser.finish()
+                await chat_history_crud.add_item(
+                    ChatHistoryCreate(
+                        role="assistant",
+                        content=parser.content,
+                        think=parser.think,
+                        truncated=True,
+                        chat_session_id=chat_session_id,
+                    )
+                )
+            if not completed:
+                trace.finish(status="truncated", chunks=token_count)
+
+    # 流结束后发送剩余内容和完成标记
+    segments = parser.finish()
+    if STREAM_SPLIT_THINK:
+        for frame in encode_segments(segments):
+            yield frame
+    yield stream_encoder.encode("", done=True)
 
     # 流式响应完成后，assistant 消息保存到历史消息记录中
+    think, content = parser.think, parser.content
     assistantChat = ChatHistoryCreate(
         role="assistant",
         content=content,
         think=think,
         chat_session_id=chat_session_id,
     )
-    chat_history_crud.add_item(assistantChat)
+    with trace.span("save_answer"):
+        await chat_history_crud.add_item(assistantChat)
+
+    # 完整的回答保存到回答缓存
+    if cache_params:
+        vector, docs, version = cache_params
+        answer_cache.put(vector, docs, version, chunks, think, content)
+
+    trace.finish(status="completed", chunks=token_count)
+    if trace.debug:
+        yield stream_encoder.encode_timings(trace.timings())
+
+
+def record_stream_metrics(token_count: int, first_token_at: float | None, completed: bool):
+    """记录一次 LLM 回答的输出速度和结果"""
+
+    llm_tokens.inc(token_count)
+    llm_streams.inc(1, "completed" if completed else "truncated")
+    if first_token_at is not None and token_count > 1:
+        elapsed = time.perf_counter() - first_token_at
+        if elapsed > 0:
+            llm_tokens_per_second.observe((token_count - 1) / elapsed)
+
+
+async def replay_stream(cached, chat_session_id, trace=None):
+    """按流式响应的格式回放缓存的回答"""
+
+    trace = trace or Trace("chat", sampled=False)
+    parser = ThinkParser()
+    for chunk in cached.chunks:
+        for frame in encode_chunk(chunk, parser):
+            yield frame
+    if STREAM_SPLIT_THINK:
+        for frame in encode_segments(parser.finish()):
+            yield frame
+    yield stream_encoder.encode("", done=True)
+
+    assistantChat = ChatHistoryCreate(
+        role="assistant",
+        content=cached.content,
+        think=cached.think,
+        chat_session_id=chat_session_id,
+    )
+    with trace.span("save_answer"):
+        await chat_history_crud.add_item(assistantChat)
+
+    trace.finish(status="cached")
+    if trace.debug:
+        yield stream_encoder.encode_timings(trace.timings())
 
 
 @router.get("/history", response_model=ChatHistoryResponse)
 async def chat_history(params: Annotated[ChatSessionParams, Query()]):
-    results = chat_history_crud.list_by_chat_session_id(params.id)
+    results = await chat_history_crud.list_by_chat_session_id(params.id)
     return success(results)
+
+
+@router.get("/cache-stats")
+async def chat_cache_stats():
+    return success(answer_cache.stats())
+
+
+@router.get("/queue-stats")
+async def chat_queue_stats():
+    return success(llm_scheduler.stats())
@@ -1,8 +1,8 @@
 from typing import Annotated
 import uuid
-from fastapi import APIRouter, Form, Query
+from fastapi import APIRouter, Form, HTTPException, Query
 from fastapi.responses import FileResponse
-from core.langchain_vector import vector_documents
+from core.vector_job import vector_job_manager
 from crud.document_crud import DocumentCrud
 from models.document_model import (
     DocumentParams,
@@ -10,6 +10,7 @@ from models.document_model import (
     UpdateFormData,
     UploadFormData,
 )
+from models.vector_job_model import VectorJobResponse
 from urllib.parse import quote
 from routers.base import success
 
@@ -37,7 +38,7 @@ async def update_doc(data: Annotated[UpdateFormData, Form()]):
 
 @router.get("/page", response_model=DocumentResponse)
 async def page_doc(params: Annotated[DocumentParams, Query()]):
-    result = document_crud.page(params)
+    result = await document_crud.page(params)
     return success(result)
 
 
@@ -49,14 +50,31 @@ async def del_doc(data: DocumentParams):
 
 @router.get("/read/{item_id}")
 async def read_doc_file(item_id: uuid.UUID):
-    file_path, real_name = document_crud.download(item_id)
+    file_path, real_name = await document_crud.download(item_id)
     header_file_name = quote(real_name, encoding="utf-8")
     headers = {"Content-Disposition": f"inline; filename*=UTF-8''{header_file_name}"}
     return FileResponse(path=file_path, headers=headers, media_type=None)
 
 
-@router.get("/vector-all")
+@router.get("/vector-all", response_model=VectorJobResponse)
 async def vector_docs():
-    vector_documents()
-    document_crud.vector_all_docs()
-    return success(None, "已全部向量化。")
+    # 向量化在后台线程执行，立即返回任务 id，通过 /jobs/{job_id} 查询进度
+    job = vector_job_manager.submit(on_committed=document_crud.vector_all_docs)
+    return success(job.to_dict(), "已开始向量化。")
+
+
+@router.get("/jobs/{job_id}", response_model=VectorJobResponse)
+async def vector_job(job_id: str):
+    job = vector_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="向量化任务不存在。")
+    return success(job.to_dict())
+
+
+@router.delete("/jobs/{job_id}", response_model=VectorJobResponse)
+async def cancel_vector_job(job_id: str):
+    job = vector_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="向量化任务不存在。")
+    job.cancel()
+    return success(job.to_dict(), "已请求取消。")
@@ -0,0 +1,61 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.answer_cache import answer_cache
+from core.base import embeddings_model
+from core.llm_scheduler import llm_scheduler
+from core.metrics import CallbackCounter, Gauge, registry
+
+
+router = APIRouter(
+    tags=["metrics"],
+    responses={404: {"message": "您所访问的资源不存在！"}},
+)
+
+
+def embedding_cache():
+    """已创建的 embedding 缓存，采集指标时不触发模型加载"""
+
+    cache_info = getattr(embeddings_model, "cache_info", None)
+    if cache_info is None or not cache_info().currsize:
+        return None
+    embeddings = embeddings_model()
+    return embeddings if hasattr(embeddings, "stats") else None
+
+
+def cache_counter(field: str):
+    def collect():
+        values = {("answer",): getattr(answer_cache, field)}
+        embeddings = embedding_cache()
+        if embeddings is not None:
+            values[("embedding",)] = getattr(embeddings, field)
+        return values
+
+    return collect
+
+
+# 以下指标由各组件自行统计，采集时读取
+registry.register(
+    Gauge("docqa_llm_active_streams", "正在调用 LLM 的请求数", lambda: llm_scheduler._active)
+)
+registry.register(
+    Gauge("docqa_llm_queued_streams", "等待调用 LLM 的请求数", lambda: llm_scheduler._waiting)
+)
+registry.register(
+    CallbackCounter(
+        "docqa_llm_rejected_total", "因排队已满被拒绝的请求数", lambda: llm_scheduler.rejected
+    )
+)
+registry.register(
+    CallbackCounter("docqa_cache_hits_total", "缓存命中次数", cache_counter("hits"), ("cache",))
+)
+registry.register(
+    CallbackCounter("docqa_cache_misses_total", "缓存未命中次数", cache_counter("misses"), ("cache",))
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式的指标"""
+
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
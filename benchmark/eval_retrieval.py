@@ -0,0 +1,226 @@
+"""
+检索效果评估
+
+对一组「问题 → 应命中的文档」逐个组合分割参数和检索参数，统计：
+- recall@k：应命中的文档中，出现在检索结果里的比例（按文档计，同一文档的多个文本块只算一次）
+- MRR：第一个命中文本块排名的倒数的平均值
+- 检索延迟 p50 / p95
+- 上下文 token 数：检索结果拼接后的估算 token 数，决定提示词长度和 prefill 耗时
+--min-recall 给出达到召回要求的配置中上下文最短、延迟最低的一个。
+
+评估集为 JSON 数组，expected 为文档相对 --docs-dir 的路径或文件名：
+    [{"question": "FFF团的会长是谁？", "expected": ["FFF团介绍.docx"]}, ...]
+不指定评估集时使用生成的语料和问题（问题取自文档中的句子），配合模拟 embedding 可离线运行，
+用于比较参数的相对效果；评估真实效果时使用 --embeddings model 和真实的文档与评估集。
+
+用法（在项目根目录执行）：
+    python benchmark/eval_retrieval.py
+    python benchmark/eval_retrieval.py --chunk-sizes 500 800 --k 3 5 --fetch-k 20 50 100 --min-recall 0.9
+    python benchmark/eval_retrieval.py --dataset qa.json --docs-dir /path/to/docs --embeddings model
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+import fakes
+
+
+def percentiles(values: list[float]) -> dict:
+    """毫秒为单位的 p50 / p95"""
+
+    ms = sorted(v * 1000 for v in values)
+    return {
+        "p50_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+    }
+
+
+def synthetic_dataset(docs_dir: str, files: int, questions: int, rng) -> list[dict]:
+    """生成语料，并从文档中随机抽取两个相邻句子作为问题，该文档即为应命中的文档"""
+
+    fakes.write_corpus(docs_dir, files, 3000, rng)
+    names = sorted(os.listdir(docs_dir))
+    dataset = []
+    for _ in range(questions):
+        name = rng.choice(names)
+        with open(os.path.join(docs_dir, name), "r", encoding="utf-8") as f:
+            sentences = [s for s in f.read().replace("\n", "").split("。") if s]
+        i = rng.randrange(len(sentences) - 1)
+        dataset.append({"question": "。".join(sentences[i : i + 2]), "expected": [name]})
+    return dataset
+
+
+def relative_source(doc, docs_dir: str) -> str:
+    return os.path.relpath(doc.metadata.get("source", ""), docs_dir)
+
+
+def matches(source: str, expected: str) -> bool:
+    return source == expected or os.path.basename(source) == expected
+
+
+def build_index(docs, chunk_size: int, chunk_overlap: int, directory: str, embeddings):
+    """按分割参数分割文档，写入单独的向量数据库和关键词索引"""
+
+    from langchain_chroma import Chroma
+
+    from core.bm25_index import BM25Index
+    from core.langchain_vector import split_documents
+
+    chunks = split_documents(docs, chunk_size, chunk_overlap)
+    store = Chroma(
+        persist_directory=directory,
+        collection_name=f"eval_{chunk_size}",
+        embedding_function=embeddings,
+    )
+    keyword_index = BM25Index(os.path.join(directory, "bm25_index.db"))
+    for offset in range(0, len(chunks), 1000):
+        batch = chunks[offset : offset + 1000]
+        ids = [f"{chunk_size}-{offset + i}" for i in range(len(batch))]
+        store.add_documents(batch, ids=ids)
+        keyword_index.add(ids, [doc.page_content for doc in batch])
+    keyword_index.flush()
+    return store, keyword_index, len(chunks)
+
+
+def evaluate(retrieve, dataset: list[dict], docs_dir: str) -> dict:
+    """对评估集逐个检索，统计 recall@k、MRR、延迟和上下文 token 数"""
+
+    from core.langchain_retrieval import estimate_tokens
+
+    recalls, reciprocal_ranks, latencies, tokens = [], [], [], []
+    for item in dataset:
+        start = time.perf_counter()
+        docs = retrieve(item["question"])
+        latencies.append(time.perf_counter() - start)
+
+        sources = [relative_source(doc, docs_dir) for doc in docs]
+        expected = item["expected"]
+        found = [e for e in expected if any(matches(s, e) for s in sources)]
+        recalls.append(len(found) / len(expected))
+        rank = next(
+            (i for i, s in enumerate(sources, 1) if any(matches(s, e) for e in expected)), None
+        )
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        tokens.append(estimate_tokens("".join(doc.page_content for doc in docs)))
+
+    return {
+        "recall": round(statistics.mean(recalls), 4),
+        "mrr": round(statistics.mean(reciprocal_ranks), 4),
+        **percentiles(latencies),
+        "context_tokens": round(statistics.mean(tokens), 1),
+    }
+
+
+def report(row: dict):
+    print(
+        f"{row['mode']:<6} chunk={row['chunk_size']:<5} k={row['k']:<3} fetch_k={row['fetch_k']:<4} "
+        f"lambda={row['lambda_mult']:<4} | recall@k={row['recall']:.3f} MRR={row['mrr']:.3f} "
+        f"| p50={row['p50_ms']}ms p95={row['p95_ms']}ms | 上下文 {row['context_tokens']} tokens"
+    )
+
+
+def main():
+    from core.base import CHUNK_OVERLAP, CHUNK_SIZE, RETRIEVAL_CANDIDATES
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", help="评估集 JSON 文件，不指定时使用生成的语料和问题")
+    parser.add_argument("--docs-dir", help="评估集对应的文档目录，默认为配置中的 LOAD_PATH")
+    parser.add_argument("--embeddings", choices=["fake", "model"], default="fake", help="模拟 embedding 或配置中的模型")
+    parser.add_argument("--files", type=int, default=60, help="生成的语料文件数")
+    parser.add_argument("--questions", type=int, default=100, help="生成的问题数")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[400, CHUNK_SIZE, 1200], help="分割的文本块大小")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="文本块重叠字符数，不超过块大小的一半")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5], help="返回的文档数量")
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[20, 50], help="传给 MMR 的候选数量")
+    parser.add_argument("--lambda-mult", type=float, nargs="+", default=[0.3, 0.5, 0.8], help="MMR 多样性参数")
+    parser.add_argument("--modes", nargs="+", choices=["hybrid", "vector"], default=["hybrid", "vector"], help="混合检索或只用向量检索")
+    parser.add_argument("--min-recall", type=float, help="召回要求，给出达到要求的最省配置")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    import core.base as base
+
+    docs_dir = args.docs_dir or base.LOAD_PATH
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="eval_retrieval_") as tmp_dir:
+        if args.embeddings == "fake":
+            fakes.setup(tmp_dir)
+        else:
+            fakes.use_temp_paths(tmp_dir)
+        embeddings = base.embeddings_model()
+
+        from core.langchain_retrieval import build_retriever
+        from core.langchain_vector import load_documents
+
+        if args.dataset:
+            with open(args.dataset, "r", encoding="utf-8") as f:
+                dataset = json.load(f)
+        else:
+            docs_dir = os.path.join(tmp_dir, "corpus")
+            dataset = synthetic_dataset(docs_dir, args.files, args.questions, rng)
+        docs = load_documents(docs_dir)
+        print(f"评估集 {len(dataset)} 个问题，{len(docs)} 份文档")
+
+        rows = []
+        for chunk_size in args.chunk_sizes:
+            overlap = min(args.chunk_overlap, chunk_size // 2)
+            directory = os.path.join(tmp_dir, f"index_{chunk_size}")
+            store, keyword_index, chunks = build_index(docs, chunk_size, overlap, directory, embeddings)
+            for k, fetch_k, lambda_mult in itertools.product(args.k, args.fetch_k, args.lambda_mult):
+                retriever = build_retriever(
+                    store,
+                    keyword_index,
+                    k=k,
+                    candidates=max(RETRIEVAL_CANDIDATES, k),
+                    fetch_k=fetch_k,
+                    lambda_mult=lambda_mult,
+                )
+                # MMR 逐个贪心选择，只用向量检索时取前 k 个与直接检索 k 个结果相同
+                retrievers = {
+                    "hybrid": retriever.invoke,
+                    "vector": lambda q: retriever.vector_retriever.invoke(q)[:k],
+                }
+                for mode in args.modes:
+                    row = {
+                        "mode": mode,
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": overlap,
+                        "chunks": chunks,
+                        "k": k,
+                        "fetch_k": fetch_k,
+                        "lambda_mult": lambda_mult,
+                        **evaluate(retrievers[mode], dataset, docs_dir),
+                    }
+                    report(row)
+                    rows.append(row)
+
+    best = None
+    if args.min_recall is not None:
+        qualified = [row for row in rows if row["recall"] >= args.min_recall]
+        if qualified:
+            best = min(qualified, key=lambda row: (row["context_tokens"], row["p50_ms"]))
+            print(f"\n达到 recall@k ≥ {args.min_recall} 的最省配置：")
+            report(best)
+        else:
+            print(f"\n没有配置达到 recall@k ≥ {args.min_recall}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows, "best": best}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+模拟 Ollama 服务
+
+实现 /api/chat（流式与非流式）和 /api/embed，服务使用 ChatOllama / OllamaEmbeddings 时
+通过环境变量 OLLAMA_HOST 指向本服务即可，不需要 GPU 和模型文件。
+- 输出先是 <think> 推理过程，再是回答，速度、prefill 延迟、token 数可配置
+- --parallel 限制同时生成的请求数（与 OLLAMA_NUM_PARALLEL 一致），其余请求排队
+- embedding 使用 fakes.FakeEmbeddings，结果确定
+
+用法（在项目根目录执行）：
+    python benchmark/fake_ollama.py --port 11435 --tokens-per-second 30 --prefill-ms 300
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from fakes import ANSWER_PIECES, FakeEmbeddings
+
+
+def create_app(
+    tokens_per_second: float = 30,
+    prefill_ms: float = 300,
+    think_tokens: int = 50,
+    answer_tokens: int = 150,
+    parallel: int = 2,
+    dim: int = 256,
+) -> Starlette:
+    embeddings = FakeEmbeddings(dim)
+    gate = asyncio.Semaphore(parallel)
+    interval = 1 / tokens_per_second if tokens_per_second > 0 else 0
+
+    def tokens() -> list[str]:
+        pieces = ["<think>"]
+        pieces += [ANSWER_PIECES[i % len(ANSWER_PIECES)] for i in range(think_tokens)]
+        pieces.append("</think>")
+        pieces += [ANSWER_PIECES[i % len(ANSWER_PIECES)] for i in range(answer_tokens)]
+        return pieces
+
+    def frame(model: str, content: str, done: bool = False, **extra) -> bytes:
+        data = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+            **extra,
+        }
+        return json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    async def generate(model: str):
+        async with gate:
+            start = time.perf_counter()
+            await asyncio.sleep(prefill_ms / 1000)
+            pieces = tokens()
+            next_at = time.perf_counter()
+            for piece in pieces:
+                yield frame(model, piece)
+                if interval:
+                    next_at += interval
+                    await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            yield frame(
+                model,
+                "",
+                True,
+                done_reason="stop",
+                total_duration=int((time.perf_counter() - start) * 1e9),
+                eval_count=len(pieces),
+            )
+
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        if body.get("stream", True):
+            return StreamingResponse(generate(model), media_type="application/x-ndjson")
+        last = b""
+        content = []
+        async for line in generate(model):
+            last = line
+            content.append(json.loads(line)["message"]["content"])
+        result = json.loads(last)
+        result["message"]["content"] = "".join(content)
+        return JSONResponse(result)
+
+    async def embed(request: Request):
+        body = await request.json()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return JSONResponse(
+            {"model": body.get("model", "fake"), "embeddings": embeddings.embed_documents(inputs)}
+        )
+
+    async def version(request: Request):
+        return JSONResponse({"version": "0.0.0-fake"})
+
+    return Starlette(
+        routes=[
+            Route("/api/chat", chat, methods=["POST"]),
+            Route("/api/embed", embed, methods=["POST"]),
+            Route("/api/version", version, methods=["GET"]),
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=11435, help="监听端口")
+    parser.add_argument("--tokens-per-second", type=float, default=30, help="每个请求的输出速度")
+    parser.add_argument("--prefill-ms", type=float, default=300, help="输出第一个 token 前的延迟（毫秒）")
+    parser.add_argument("--think-tokens", type=int, default=50, help="推理过程的 token 数")
+    parser.add_argument("--answer-tokens", type=int, default=150, help="回答的 token 数")
+    parser.add_argument("--parallel", type=int, default=2, help="同时生成的请求数")
+    args = parser.parse_args()
+
+    app = create_app(
+        args.tokens_per_second,
+        args.prefill_ms,
+        args.think_tokens,
+        args.answer_tokens,
+        args.parallel,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
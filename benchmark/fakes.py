@@ -0,0 +1,200 @@
+"""
+基准测试使用的模拟组件，不依赖 Ollama 和网络，结果可复现
+
+- FakeEmbeddings：按字符二元组哈希生成向量，内容相近的文本向量相近
+- FakeChatModel：按设定的速度流式输出 <think> 推理过程和回答
+- random_text / zipf_text：随机中文文本，前者只有几十个常用词，后者词频服从 Zipf 分布
+- use_temp_paths：把向量数据库、关键词索引、缓存等路径指向临时目录
+- setup：使用临时目录，并替换 LLM 与 embedding 模型
+  两者都必须在导入 core 下除 base 以外的模块之前调用
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    确定性的模拟 embedding
+    文本的字符二元组哈希到 dim 个维度上计数并归一化，相同的文本得到相同的向量，
+    共有词语越多的文本余弦相似度越高，可以用于检索效果的相对比较
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model_name = f"fake-embedding-{dim}"
+
+    def embed_vector(self, text: str) -> np.ndarray:
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(codes) < 2:
+            codes = np.concatenate([codes, np.zeros(2 - len(codes), dtype=np.uint64)])
+        bigrams = codes[:-1] * np.uint64(1000003) + codes[1:]
+        hashed = (bigrams * np.uint64(2654435761)) & np.uint64(0xFFFFFFFF)
+        vector = np.bincount((hashed % np.uint64(self.dim)).astype(np.int64), minlength=self.dim)
+        vector = vector.astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_vector(text).tolist()
+
+
+ANSWER_PIECES = ["根据", "文档", "内容", "，", "FFF", "团", "的", "会长", "是", "大靓仔", "。", "\n"]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    模拟流式输出的 LLM
+    - prefill_delay：输出第一个 token 前的等待时间（秒），模拟模型处理提示词
+    - tokens_per_second：输出速度，0 表示不等待
+    - think_tokens / answer_tokens：推理过程与回答的 token 数
+    """
+
+    prefill_delay: float = 0.0
+    tokens_per_second: float = 0.0
+    think_tokens: int = 20
+    answer_tokens: int = 50
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def tokens(self) -> list[str]:
+        pieces = ["<think>"]
+        pieces += [ANSWER_PIECES[i % len(ANSWER_PIECES)] for i in range(self.think_tokens)]
+        pieces.append("</think>")
+        pieces += [ANSWER_PIECES[i % len(ANSWER_PIECES)] for i in range(self.answer_tokens)]
+        return pieces
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.prefill_delay)
+        message = AIMessage(content="".join(self.tokens()))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if self.prefill_delay:
+            await asyncio.sleep(self.prefill_delay)
+        interval = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        next_at = time.perf_counter()
+        for token in self.tokens():
+            if interval:
+                next_at += interval
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+WORDS = (
+    "文档 检索 向量 数据库 模型 推理 回答 问题 会话 历史 记录 缓存 索引 分割 文本 段落 "
+    "配置 服务 接口 请求 响应 延迟 吞吐 并发 线程 进程 内存 磁盘 网络 日志 指标 部署 "
+    "版本 升级 备份 恢复 权限 用户 管理 安全 加密 证书 集群 节点 存储 队列 任务 调度"
+).split()
+
+
+def random_text(rng, chars: int) -> str:
+    """生成约 chars 个字符的中文文本，按句号和换行分句分段"""
+
+    parts = []
+    size = 0
+    while size < chars:
+        sentence = "".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        sentence += "。" if rng.random() < 0.85 else "。\n\n"
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+class ZipfVocabulary:
+    """
+    词频服从 Zipf 分布的词表，更接近真实文档：少数词非常常见，大部分词只出现在少量文本块中
+    词由 2 ~ 3 个随机汉字组成，词表由 seed 确定
+    """
+
+    def __init__(self, size: int = 20000, exponent: float = 1.0, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        chars = 0x4E00 + rng.choice(20000, 3000, replace=False)
+        lengths = rng.integers(2, 4, size)
+        codes = rng.choice(chars, (size, 3))
+        self.words = ["".join(map(chr, row[:n])) for row, n in zip(codes.tolist(), lengths)]
+        weights = 1 / np.arange(1, size + 1) ** exponent
+        self.cum_weights = np.cumsum(weights).tolist()
+
+
+_zipf_vocabulary = None
+
+
+def zipf_text(rng, chars: int) -> str:
+    """与 random_text 格式相同，词从 Zipf 分布的词表中抽取"""
+
+    global _zipf_vocabulary
+    if _zipf_vocabulary is None:
+        _zipf_vocabulary = ZipfVocabulary()
+    vocabulary = _zipf_vocabulary
+
+    parts = []
+    size = 0
+    while size < chars:
+        words = rng.choices(vocabulary.words, cum_weights=vocabulary.cum_weights, k=rng.randint(4, 12))
+        sentence = "".join(words) + ("。" if rng.random() < 0.85 else "。\n\n")
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def write_corpus(directory: str, files: int, chars: int, rng) -> int:
+    """生成 files 个 .txt / .md 文件，返回总字节数"""
+
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+    for i in range(files):
+        suffix = ".md" if i % 2 else ".txt"
+        path = os.path.join(directory, f"doc_{i:05d}{suffix}")
+        data = random_text(rng, chars).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+    return total
+
+
+def use_temp_paths(tmp_dir: str):
+    """
+    文档目录、向量数据库、关键词索引、缓存和数据库都使用临时目录，返回 core.base 模块
+    数据库路径通过环境变量设置，需要在导入 crud 之前调用
+    """
+
+    os.environ.setdefault("DOC_QA_DB_PATH", os.path.join(tmp_dir, "document_qa.db"))
+
+    import core.base as base
+
+    base.LOAD_PATH = os.path.join(tmp_dir, "fileStorage")
+    base.VECTOR_DIR = os.path.join(tmp_dir, "vector_store")
+    base.INDEX_MANIFEST_PATH = os.path.join(base.VECTOR_DIR, "index_manifest.json")
+    base.EMBEDDING_CACHE_PATH = os.path.join(base.VECTOR_DIR, "embedding_cache.db")
+    base.BM25_INDEX_PATH = os.path.join(base.VECTOR_DIR, "bm25_index.db")
+    base.FLAT_VECTOR_DIR = os.path.join(base.VECTOR_DIR, "flat")
+    os.makedirs(base.LOAD_PATH, exist_ok=True)
+    os.makedirs(base.VECTOR_DIR, exist_ok=True)
+    base.bm25_index.cache_clear()
+    base.flat_vector_store.cache_clear()
+    return base
+
+
+def setup(tmp_dir: str, embeddings: Embeddings | None = None, llm: BaseChatModel | None = None):
+    """使用临时目录，并把 LLM 与 embedding 模型替换为模拟组件，返回 core.base 模块"""
+
+    base = use_temp_paths(tmp_dir)
+    embeddings = embeddings or FakeEmbeddings()
+    llm = llm or FakeChatModel()
+    base.embeddings_model = lambda: embeddings
+    base.chat_llm = lambda: llm
+    return base
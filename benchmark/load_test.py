@@ -0,0 +1,311 @@
+"""
+并发聊天压力测试
+
+启动模拟 Ollama 服务（fake_ollama.py）和本项目服务（使用临时目录），服务中的 ChatOllama、
+OllamaEmbeddings、generate_stream、ChatHistoryCrud 均为真实代码，只有模型服务是模拟的。
+按 --ramp 逐级增加并发会话数，每个会话连续提问，每一级统计：
+- TTFT：发出请求到收到第一个回答 token 的时间（不含排队状态行）p50 / p95 / p99
+- 相邻 token 的间隔 p50 / p95 / p99
+- 服务进程 CPU 占用
+- SQLite 语句的平均耗时与 p95（读取服务的 /metrics）
+- 429 拒绝次数与错误次数
+
+用法（在项目根目录执行）：
+    python benchmark/load_test.py --ramp 1 2 4 8 16 --stage-seconds 30
+    python benchmark/load_test.py --ramp 4 8 --tokens-per-second 50 --prefill-ms 500 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCHMARK_DIR.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+import fakes
+
+
+def serve(args):
+    """服务进程：使用临时目录，可选先向量化生成的语料，再启动 uvicorn"""
+
+    base = fakes.use_temp_paths(args.tmp_dir)
+    from crud.base import create_db_and_tables
+
+    create_db_and_tables()
+    if args.seed_files:
+        from core.langchain_vector import vector_documents
+
+        fakes.write_corpus(base.LOAD_PATH, args.seed_files, 3000, random.Random(0))
+        vector_documents()
+
+    import uvicorn
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.app_port, log_level="warning")
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ms = sorted(v * 1000 for v in values)
+    pick = lambda q: round(ms[min(len(ms) - 1, int(len(ms) * q))], 2)
+    return {"p50_ms": round(statistics.median(ms), 2), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """进程已使用的 CPU 时间（用户态 + 内核态），只支持 Linux"""
+
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def sqlite_histogram(text: str) -> tuple[dict, float, float]:
+    """从 /metrics 中读取 SQLite 语句耗时直方图（所有语句类型合并）：({le: 累计次数}, 总耗时, 次数)"""
+
+    buckets, total, count = {}, 0.0, 0.0
+    for line in text.splitlines():
+        if not line.startswith("docqa_sqlite_query_seconds"):
+            continue
+        name, value = line.rsplit(" ", 1)
+        if name.startswith("docqa_sqlite_query_seconds_bucket"):
+            le = name.split('le="', 1)[1].split('"', 1)[0]
+            buckets[le] = buckets.get(le, 0) + float(value)
+        elif name.startswith("docqa_sqlite_query_seconds_sum"):
+            total += float(value)
+        elif name.startswith("docqa_sqlite_query_seconds_count"):
+            count += float(value)
+    return buckets, total, count
+
+
+def sqlite_delta(before: str, after: str) -> dict:
+    """两次采集之间 SQLite 语句的次数、平均耗时和 p95（所在区间的上界）"""
+
+    b_buckets, b_total, b_count = sqlite_histogram(before)
+    a_buckets, a_total, a_count = sqlite_histogram(after)
+    count = a_count - b_count
+    if count <= 0:
+        return {"queries": 0}
+    p95 = None
+    for le in sorted(a_buckets, key=lambda x: float("inf") if x == "+Inf" else float(x)):
+        if a_buckets[le] - b_buckets.get(le, 0) >= count * 0.95:
+            p95 = le
+            break
+    return {
+        "queries": int(count),
+        "mean_ms": round((a_total - b_total) / count * 1000, 3),
+        "p95_le_s": p95,
+    }
+
+
+class StageStats:
+    def __init__(self):
+        self.ttft: list[float] = []
+        self.gaps: list[float] = []
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+
+
+async def chat_session(client: httpx.AsyncClient, stats: StageStats, stop_at: float, args, rng):
+    """一个会话：连续提问，直到阶段结束"""
+
+    response = await client.post("/session/add", json={"title": "压力测试"})
+    session_id = response.json()["data"]["id"]
+    while time.monotonic() < stop_at:
+        body = {
+            "messages": {"role": "user", "content": fakes.random_text(rng, 30)},
+            "chat_session_id": session_id,
+        }
+        start = time.perf_counter()
+        first = last = None
+        gaps = []
+        try:
+            async with client.stream("POST", "/chat", json=body) as response:
+                if response.status_code == 429:
+                    stats.rejected += 1
+                    await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+                    continue
+                if response.status_code != 200:
+                    stats.errors += 1
+                    await response.aread()
+                    continue
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    frame = json.loads(line)
+                    if "queued" in frame or "timings" in frame or frame.get("done"):
+                        continue
+                    now = time.perf_counter()
+                    if first is None:
+                        first = now
+                        stats.ttft.append(now - start)
+                    else:
+                        gaps.append(now - last)
+                    last = now
+        except httpx.HTTPError:
+            stats.errors += 1
+            continue
+        stats.gaps.extend(gaps)
+        stats.completed += 1
+        await asyncio.sleep(args.think_time)
+
+
+async def run_stage(client: httpx.AsyncClient, sessions: int, args, app_pid: int, rng) -> dict:
+    stats = StageStats()
+    metrics_before = (await client.get("/metrics")).text
+    cpu_before = cpu_seconds(app_pid)
+    start = time.monotonic()
+    stop_at = start + args.stage_seconds
+    await asyncio.gather(*(chat_session(client, stats, stop_at, args, rng) for _ in range(sessions)))
+    elapsed = time.monotonic() - start
+    cpu_after = cpu_seconds(app_pid)
+    metrics_after = (await client.get("/metrics")).text
+
+    cpu = None
+    if cpu_before is not None and cpu_after is not None:
+        cpu = round((cpu_after - cpu_before) / elapsed * 100, 1)
+    return {
+        "sessions": sessions,
+        "completed": stats.completed,
+        "requests_per_s": round(stats.completed / elapsed, 2),
+        "rejected": stats.rejected,
+        "errors": stats.errors,
+        "ttft": percentiles(stats.ttft),
+        "inter_token": percentiles(stats.gaps),
+        "cpu_percent": cpu,
+        "sqlite": sqlite_delta(metrics_before, metrics_after),
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程已退出：{url}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时：{url}")
+
+
+def report(row: dict):
+    ttft, gap, sqlite = row["ttft"], row["inter_token"], row["sqlite"]
+    print(
+        f"会话 {row['sessions']:>3} | 完成 {row['completed']:>5} ({row['requests_per_s']}/s) "
+        f"| TTFT p50={ttft.get('p50_ms')} p95={ttft.get('p95_ms')} p99={ttft.get('p99_ms')}ms "
+        f"| token 间隔 p50={gap.get('p50_ms')} p99={gap.get('p99_ms')}ms "
+        f"| CPU {row['cpu_percent']}% | SQLite {sqlite.get('queries')} 次 "
+        f"平均 {sqlite.get('mean_ms')}ms p95≤{sqlite.get('p95_le_s')}s "
+        f"| 429 {row['rejected']} 错误 {row['errors']}"
+    )
+
+
+async def drive(args, app_pid: int) -> list[dict]:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=max(args.ramp) * 2 + 10)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{args.app_port}", timeout=None, limits=limits
+    ) as client:
+        rows = []
+        for sessions in args.ramp:
+            row = await run_stage(client, sessions, args, app_pid, rng)
+            report(row)
+            rows.append(row)
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ramp", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="每一级的并发会话数")
+    parser.add_argument("--stage-seconds", type=float, default=30, help="每一级的持续时间（秒）")
+    parser.add_argument("--think-time", type=float, default=0.5, help="每个会话两次提问之间的间隔（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=30, help="模拟模型的输出速度")
+    parser.add_argument("--prefill-ms", type=float, default=300, help="模拟模型的 prefill 延迟（毫秒）")
+    parser.add_argument("--think-tokens", type=int, default=50, help="推理过程的 token 数")
+    parser.add_argument("--answer-tokens", type=int, default=150, help="回答的 token 数")
+    parser.add_argument("--parallel", type=int, default=2, help="模拟模型同时生成的请求数")
+    parser.add_argument("--seed-files", type=int, default=20, help="启动前向量化的语料文件数")
+    parser.add_argument("--app-port", type=int, default=8092, help="本项目服务端口")
+    parser.add_argument("--ollama-port", type=int, default=11435, help="模拟 Ollama 服务端口")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--tmp-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="load_test_")
+    env = {**os.environ, "OLLAMA_HOST": f"http://127.0.0.1:{args.ollama_port}"}
+    log = open(os.path.join(tmp_dir, "server.log"), "w")
+    ollama = subprocess.Popen(
+        [
+            sys.executable,
+            str(BENCHMARK_DIR / "fake_ollama.py"),
+            f"--port={args.ollama_port}",
+            f"--tokens-per-second={args.tokens_per_second}",
+            f"--prefill-ms={args.prefill_ms}",
+            f"--think-tokens={args.think_tokens}",
+            f"--answer-tokens={args.answer_tokens}",
+            f"--parallel={args.parallel}",
+        ],
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    app = None
+    try:
+        wait_ready(f"http://127.0.0.1:{args.ollama_port}/api/version", ollama)
+        # ChatOllama 会把每个 token 打印到标准输出，输出到日志文件
+        app = subprocess.Popen(
+            [
+                sys.executable,
+                __file__,
+                "--serve",
+                f"--tmp-dir={tmp_dir}",
+                f"--app-port={args.app_port}",
+                f"--seed-files={args.seed_files}",
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        wait_ready(f"http://127.0.0.1:{args.app_port}/", app, timeout=600)
+        print(
+            f"模拟模型：{args.tokens_per_second} token/s，prefill {args.prefill_ms}ms，"
+            f"并行 {args.parallel}；每级 {args.stage_seconds} 秒；日志：{log.name}"
+        )
+        rows = asyncio.run(drive(args, app.pid))
+    finally:
+        for process in (app, ollama):
+            if process is not None:
+                process.terminate()
+                process.wait()
+        log.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "stages": rows}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
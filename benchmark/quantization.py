@@ -0,0 +1,162 @@
+"""
+量化检索基准测试
+
+用聚类分布的模拟向量分别建立未量化、int8、binary 三种 FlatVectorStore，对比：
+- recall@k：与内存中 float32 精确检索结果的重合比例
+- 检索延迟 p50 / p95（search_vector，不含 embedding 和读取文本）
+- 每个向量的存储字节数，以及每次检索扫描的数据量（候选检索的编码 + 重新排序读取的原始向量）
+--rescore 为重新排序的候选数倍数，1 即只按编码排序的召回。
+
+用法（在项目根目录执行）：
+    python benchmark/quantization.py --rows 200000 --dim 768 --rescore 1 4 10 20
+    python benchmark/quantization.py --rows 1000000 --ivf-lists 1024 --nprobe 32
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+import fakes
+from core.flat_vector_store import FlatVectorStore
+from core.mmr import normalize_rows
+
+
+def clustered_vectors(rng: np.random.Generator, rows: int, dim: int, clusters: int) -> np.ndarray:
+    """围绕若干中心分布的归一化向量，与文本 embedding 一样相似的向量成簇出现"""
+
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 50000):
+        stop = min(start + 50000, rows)
+        noise = rng.standard_normal((stop - start, dim)).astype(np.float32)
+        vectors[start:stop] = normalize_rows(centers[rng.integers(clusters, size=stop - start)] + 0.8 * noise)
+    return vectors
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> list[set]:
+    truth = []
+    for query in queries:
+        scores = vectors @ query
+        truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    return truth
+
+
+def build_store(directory: str, vectors: np.ndarray, quantization: str, args) -> FlatVectorStore:
+    store = FlatVectorStore(
+        directory,
+        fakes.FakeEmbeddings(args.dim),
+        dtype=args.dtype,
+        ivf_lists=args.ivf_lists,
+        ivf_min_rows=0,
+        nprobe=args.nprobe,
+        quantization=quantization,
+    )
+    # 先写入全部数据再划分 IVF，避免写入过程中按数据量翻倍反复划分
+    store.ivf_lists = 0
+    for start in range(0, len(vectors), 20000):
+        part = vectors[start : start + 20000]
+        ids = [str(start + i) for i in range(len(part))]
+        store.add_vectors(ids, part, [""] * len(part), [{}] * len(part))
+    if args.ivf_lists:
+        store.ivf_lists = args.ivf_lists
+        store.train_ivf()
+    return store
+
+
+def file_bytes(directory: str, prefix: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.startswith(prefix))
+
+
+def bench(store: FlatVectorStore, queries: np.ndarray, truth: list[set], k: int, rescore: int) -> dict:
+    store.rescore = rescore
+    for query in queries[:5]:
+        store.search_vector(query, k)
+
+    recalls, times = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        store.search_vector(query, k)
+        times.append(time.perf_counter() - start)
+        # search_vector 返回行号（IVF 划分后与写入顺序不同），召回按文本块 id（写入顺序）计算
+        ids = {int(doc.id) for doc in store.similarity_search_by_vector(query.tolist(), k)}
+        recalls.append(len(ids & expected) / k)
+    ms = sorted(t * 1000 for t in times)
+    return {
+        "recall": round(statistics.mean(recalls), 4),
+        "p50_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="向量数量")
+    parser.add_argument("--dim", type=int, default=768, help="向量维度")
+    parser.add_argument("--clusters", type=int, default=2000, help="模拟数据的中心数量")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--query-noise", type=float, default=0.8, help="查询与数据中向量的偏离程度，0.8 时余弦相似度约 0.78")
+    parser.add_argument("--k", type=int, default=10, help="返回的数量")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10, 20, 50], help="重新排序的候选数倍数")
+    parser.add_argument(
+        "--quantizations", nargs="+", choices=["none", "int8", "binary"], default=["none", "int8", "binary"]
+    )
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="原始向量的精度")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="IVF 簇数量，0 表示精确检索")
+    parser.add_argument("--nprobe", type=int, default=32, help="IVF 检索的簇数量")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = clustered_vectors(rng, args.rows, args.dim, args.clusters)
+    # 查询取自数据附近，与真实问题和文本块的关系相近
+    queries = vectors[rng.integers(args.rows, size=args.queries)]
+    noise = rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(args.dim)
+    queries = normalize_rows(queries + args.query_noise * noise)
+    truth = exact_top_k(vectors, queries, args.k)
+    vector_bytes = np.dtype(args.dtype).itemsize * args.dim
+    print(f"{args.rows} 个 {args.dim} 维向量，{args.queries} 个查询，k={args.k}，IVF {args.ivf_lists or '关闭'}")
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="bench_quantization_") as tmp_dir:
+        for quantization in args.quantizations:
+            directory = os.path.join(tmp_dir, quantization)
+            start = time.perf_counter()
+            store = build_store(directory, vectors, quantization, args)
+            build_s = time.perf_counter() - start
+            code_bytes = {"none": vector_bytes, "int8": args.dim + 4, "binary": (args.dim + 7) // 8}[quantization]
+            print(
+                f"\n{quantization}：写入 {build_s:.1f}s，向量文件 {file_bytes(directory, 'vectors') / 2**20:.1f}MB，"
+                f"编码文件 {(file_bytes(directory, 'codes') + file_bytes(directory, 'scales')) / 2**20:.1f}MB，"
+                f"候选检索每个向量 {code_bytes} 字节（原始向量的 {code_bytes / vector_bytes:.1%}）"
+            )
+            for rescore in args.rescore if quantization != "none" else [1]:
+                result = bench(store, queries, truth, args.k, rescore)
+                # 精确检索扫描全部编码；IVF 只扫描 nprobe 个簇，按平均簇大小估算
+                scanned = args.rows if not args.ivf_lists else args.rows * min(args.nprobe / args.ivf_lists, 1)
+                read_mb = (scanned * code_bytes + (args.k * rescore * vector_bytes if quantization != "none" else 0)) / 2**20
+                row = {"quantization": quantization, "rescore": rescore, "bytes_per_vector": code_bytes, "scan_mb": round(read_mb, 2), **result}
+                rows.append(row)
+                print(
+                    f"  rescore={rescore:<3} recall@{args.k}={row['recall']:.3f} "
+                    f"| p50={row['p50_ms']}ms p95={row['p95_ms']}ms | 每次检索读取 {row['scan_mb']}MB"
+                )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
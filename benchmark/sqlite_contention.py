@@ -0,0 +1,163 @@
+"""
+SQLite 读写竞争基准测试
+
+模拟聊天时的数据库访问：写入协程逐条保存聊天记录并提交（generate_stream 结束时的写入），
+读取协程并发查询会话最近的历史记录（chatting 开始时的查询），统计读写延迟与吞吐量。
+分别测试两种存储配置：
+- default: SQLite 默认配置（回滚日志，synchronous=FULL），不设置 PRAGMA
+- production: crud/base.py 中的 SQLITE_PRAGMAS（WAL 等）
+
+用法（在项目根目录执行）：
+    python benchmark/sqlite_contention.py --writers 4 --readers 8 --duration 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+# 使用临时目录中的数据库，避免写入项目数据库
+TMP_DIR = tempfile.mkdtemp(prefix="sqlite_contention_")
+os.environ["DOC_QA_DB_PATH"] = os.path.join(TMP_DIR, "document_qa.db")
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, desc, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from crud.base import SQLITE_PRAGMAS, create_sqlite_engines
+from models.chat_history_model import ChatHistory
+
+
+PROFILES = {"default": {}, "production": SQLITE_PRAGMAS}
+
+
+def seed(engine, rows: int, sessions: int) -> list[uuid.UUID]:
+    """写入测试数据，返回会话 id 列表"""
+
+    session_ids = [uuid.uuid4() for _ in range(sessions)]
+    with Session(engine) as session:
+        for i in range(rows):
+            session.add(
+                ChatHistory(
+                    role="user" if i % 2 == 0 else "assistant",
+                    content="测试内容" * 50,
+                    chat_session_id=session_ids[i % sessions],
+                )
+            )
+        session.commit()
+    return session_ids
+
+
+async def writer(async_engine, session_ids, stop: asyncio.Event, latencies, errors, n):
+    i = n
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                session.add(
+                    ChatHistory(
+                        role="assistant",
+                        content="回答内容" * 100,
+                        chat_session_id=session_ids[i % len(session_ids)],
+                    )
+                )
+                await session.commit()
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            # database is locked
+            errors.append(1)
+        i += 1
+
+
+async def reader(async_engine, session_ids, stop: asyncio.Event, latencies, errors, n):
+    i = n
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                query = (
+                    select(ChatHistory)
+                    .where(ChatHistory.chat_session_id == session_ids[i % len(session_ids)])
+                    .order_by(desc(ChatHistory.date))
+                    .limit(20)
+                )
+                (await session.exec(query)).all()
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            errors.append(1)
+        i += 1
+
+
+def summary(name: str, latencies: list[float], errors: list, duration: float):
+    if not latencies:
+        return f"{name}: 0 次，失败 {len(errors)} 次"
+    ms = sorted(t * 1000 for t in latencies)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    return (
+        f"{name} {len(ms) / duration:7.0f}/s p50={statistics.median(ms):6.2f}ms "
+        f"p99={p99:7.2f}ms 失败={len(errors)}"
+    )
+
+
+async def run(profile: str, args):
+    path = os.path.join(TMP_DIR, f"{profile}.db")
+    sync_engine, async_engine = create_sqlite_engines(
+        path, pragmas=PROFILES[profile], echo=False
+    )
+    SQLModel.metadata.create_all(sync_engine)
+    session_ids = seed(sync_engine, args.rows, args.sessions)
+    sync_engine.dispose()
+
+    stop = asyncio.Event()
+    write_latencies, write_errors = [], []
+    read_latencies, read_errors = [], []
+    tasks = [
+        asyncio.create_task(
+            writer(async_engine, session_ids, stop, write_latencies, write_errors, n)
+        )
+        for n in range(args.writers)
+    ] + [
+        asyncio.create_task(
+            reader(async_engine, session_ids, stop, read_latencies, read_errors, n)
+        )
+        for n in range(args.readers)
+    ]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    await async_engine.dispose()
+
+    print(f"[{profile}]")
+    print("  " + summary("写入", write_latencies, write_errors, args.duration))
+    print("  " + summary("读取", read_latencies, read_errors, args.duration))
+    # 读写在同一个事件循环中，CPU 用满时写入变快会占用读取的时间，合计吞吐量更能反映配置的效果
+    print(f"  合计 {(len(write_latencies) + len(read_latencies)) / args.duration:7.0f}/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000, help="预先写入的历史记录条数")
+    parser.add_argument("--sessions", type=int, default=50, help="会话数")
+    parser.add_argument("--writers", type=int, default=4, help="并发写入数")
+    parser.add_argument("--readers", type=int, default=8, help="并发读取数")
+    parser.add_argument("--duration", type=float, default=5, help="每种配置的测试时长（秒）")
+    args = parser.parse_args()
+
+    print(
+        f"历史记录 {args.rows} 条，写入并发 {args.writers}，读取并发 {args.readers}，"
+        f"每种配置 {args.duration} 秒"
+    )
+    for profile in PROFILES:
+        await run(profile, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
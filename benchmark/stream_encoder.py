@@ -0,0 +1,102 @@
+"""
+流式响应编码基准测试
+
+对比每个 token 构建 ChatStreamResponse 再经 jsonable_encoder、json.dumps 序列化的原实现，
+与 StreamEncoder 预先生成固定部分的实现，并校验两者输出一致（created_at 除外）。
+
+用法（在项目根目录执行）：
+    python benchmark/stream_encoder.py --tokens 200000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+from fastapi.encoders import jsonable_encoder
+
+from core import stream_encoder
+from core.stream_encoder import StreamEncoder
+from models.chat_model import ChatStreamResponse, Chatting
+
+
+MODEL = "deepseek-r1:7b"
+
+
+def pydantic_chunk(content: str, done: bool = False) -> bytes:
+    """原实现：每个 token 构建 pydantic 模型后序列化"""
+
+    json_chunk = json.dumps(
+        jsonable_encoder(
+            ChatStreamResponse(
+                model=MODEL,
+                created_at=int(round(time.time() * 1000)),
+                message=Chatting(role="assistant", content=content),
+                done=done,
+                done_reason="stop" if done else None,
+            ).model_dump(exclude_none=True)
+        ),
+        ensure_ascii=False,
+    )
+    return f"{json_chunk}\n".encode("utf-8")
+
+
+def sample_tokens(count: int) -> list[str]:
+    """模拟 LLM 输出的 token，包含中文、英文、换行、引号和控制字符"""
+
+    pieces = ["根据", "文档", "内容", "，", "FFF", "团", "的", "会长", " is", "\n\n", '"', "\\", "\t", " ", "😀"]
+    rng = random.Random(0)
+    return [rng.choice(pieces) for _ in range(count)]
+
+
+def without_timestamp(line: bytes) -> dict:
+    data = json.loads(line)
+    data.pop("created_at")
+    return data
+
+
+def check(encoder: StreamEncoder, tokens: list[str]):
+    """校验输出与原实现一致，时间戳可能相差 1 毫秒，单独比较其余部分"""
+
+    for token in tokens[:1000]:
+        for done in (False, True):
+            expected = pydantic_chunk(token, done)
+            actual = encoder.encode(token, done)
+            assert without_timestamp(expected) == without_timestamp(actual), (expected, actual)
+            # 除时间戳外逐字节一致
+            tail = expected.split(b', "message"', 1)[1]
+            assert actual.endswith(b', "message"' + tail), (expected, actual)
+
+
+def bench(name: str, encode, tokens: list[str]):
+    start = time.perf_counter()
+    for token in tokens:
+        encode(token)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {len(tokens) / elapsed:12,.0f} tokens/s  {elapsed / len(tokens) * 1e6:6.2f}µs/token")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=200000, help="编码的 token 数")
+    args = parser.parse_args()
+
+    tokens = sample_tokens(args.tokens)
+    bench("pydantic + json.dumps", pydantic_chunk, tokens)
+    if stream_encoder.orjson is not None:
+        encoder = StreamEncoder(MODEL)
+        check(encoder, tokens)
+        bench("StreamEncoder (orjson)", encoder.encode, tokens)
+        stream_encoder.orjson = None
+    encoder = StreamEncoder(MODEL)
+    check(encoder, tokens)
+    bench("StreamEncoder (json)", encoder.encode, tokens)
+
+
+if __name__ == "__main__":
+    main()
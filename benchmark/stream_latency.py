@@ -0,0 +1,146 @@
+"""
+流式响应延迟基准测试
+
+模拟一个每隔 interval 毫秒输出一个 token 的流式响应，同时并发查询聊天历史记录，
+统计 token 实际输出时间相对预期时间的延迟。分别测试：
+- idle: 没有数据库查询
+- sync: 在协程中直接使用同步 Session 查询（事件循环被阻塞）
+- async: 使用 ChatHistoryCrud 的异步查询
+
+用法（在项目根目录执行）：
+    python benchmark/stream_latency.py --rows 20000 --queries 400 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+# 使用临时目录中的数据库，避免写入项目数据库
+os.environ["DOC_QA_DB_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="stream_latency_"), "document_qa.db"
+)
+
+from sqlmodel import Session, select
+
+from crud.base import async_engine, create_db_and_tables, engine
+from crud.chat_history_crud import ChatHistoryCrud
+from models.chat_history_model import ChatHistory
+
+
+def seed(rows: int, sessions: int) -> list[uuid.UUID]:
+    """写入测试数据，返回会话 id 列表"""
+
+    session_ids = [uuid.uuid4() for _ in range(sessions)]
+    with Session(engine) as session:
+        for i in range(rows):
+            session.add(
+                ChatHistory(
+                    role="user" if i % 2 == 0 else "assistant",
+                    content="测试内容" * 50,
+                    chat_session_id=session_ids[i % sessions],
+                )
+            )
+        session.commit()
+    return session_ids
+
+
+def sync_query(session_id):
+    """改造前的查询方式：协程中直接使用同步 Session"""
+
+    with Session(engine) as session:
+        query = (
+            select(ChatHistory)
+            .where(ChatHistory.chat_session_id == session_id)
+            .order_by(ChatHistory.date)
+        )
+        return session.exec(query).all()
+
+
+async def ticker(interval: float, stop: asyncio.Event) -> list[float]:
+    """模拟流式输出，返回每个 token 的延迟（秒）"""
+
+    delays = []
+    next_tick = time.perf_counter() + interval
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+        delays.append(time.perf_counter() - next_tick)
+        next_tick += interval
+    return delays
+
+
+async def run(mode: str, session_ids, queries: int, concurrency: int, interval: float):
+    crud = ChatHistoryCrud()
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(interval, stop))
+    remaining = queries
+
+    async def worker(n: int):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            session_id = session_ids[(remaining + n) % len(session_ids)]
+            if mode == "sync":
+                sync_query(session_id)
+            else:
+                await crud.list_by_chat_session_id(session_id)
+            # 让出事件循环，模拟请求之间的间隔
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    if mode == "idle":
+        await asyncio.sleep(1.0)
+    else:
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    delays = await tick_task
+    return delays, elapsed
+
+
+def report(mode: str, delays: list[float], elapsed: float, queries: int):
+    ms = sorted(d * 1000 for d in delays)
+    p50 = statistics.median(ms)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    qps = "-" if mode == "idle" else f"{queries / elapsed:.0f}"
+    print(
+        f"{mode:<6} tokens={len(ms):<6} p50={p50:7.2f}ms p99={p99:7.2f}ms "
+        f"max={ms[-1]:7.2f}ms queries/s={qps}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000, help="历史记录条数")
+    parser.add_argument("--sessions", type=int, default=50, help="会话数")
+    parser.add_argument("--queries", type=int, default=400, help="查询次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发查询数")
+    parser.add_argument("--interval", type=float, default=10, help="token 间隔（毫秒）")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    session_ids = seed(args.rows, args.sessions)
+    # 与服务启动时（main.py 的 lifespan）相同
+    gc.freeze()
+    print(f"历史记录 {args.rows} 条，{args.sessions} 个会话，查询 {args.queries} 次，并发 {args.concurrency}")
+
+    for mode in ("idle", "sync", "async"):
+        delays, elapsed = await run(
+            mode, session_ids, args.queries, args.concurrency, args.interval / 1000
+        )
+        report(mode, delays, elapsed, args.queries)
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,381 @@
+"""
+离线基准测试套件
+
+使用模拟 embedding 和模拟 LLM（见 fakes.py），不需要 Ollama 和网络，相同参数下结果可复现。
+测试项：
+- parse: load_documents / split_documents 解析与分割生成语料的吞吐量
+- ingest: create_vector_store 增量向量化的写入速度
+- retrieval: 不同文本块数量下混合检索（及向量、关键词两路）的延迟
+- stream: generate_stream 相对直接迭代检索链的每 token 额外开销
+- crud: 聊天记录写入、历史记录查询、会话列表等数据库热点路径
+
+结果写入 JSON 文件，--compare 与之前的结果对比，便于发现不同提交之间的性能回退。
+
+用法（在项目根目录执行）：
+    python benchmark/suite.py --output bench.json
+    python benchmark/suite.py --only retrieval --retrieval-sizes 10000 100000 1000000
+    python benchmark/suite.py --output new.json --compare bench.json
+    python benchmark/suite.py --only ingest retrieval --vector-backend flat
+    python benchmark/suite.py --only retrieval --retrieval-sizes 1000000 --vector-backend flat --corpus zipf
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+import fakes
+
+
+def percentiles(values: list[float]) -> dict:
+    """毫秒为单位的 p50 / p95 / p99"""
+
+    ms = sorted(v * 1000 for v in values)
+    pick = lambda q: round(ms[min(len(ms) - 1, int(len(ms) * q))], 3)
+    return {"p50_ms": round(statistics.median(ms), 3), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def bench_parse(base, args, rng) -> dict:
+    from core.langchain_vector import load_documents, split_documents
+
+    total_bytes = fakes.write_corpus(base.LOAD_PATH, args.files, args.file_chars, rng)
+
+    start = time.perf_counter()
+    docs = load_documents(base.LOAD_PATH)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = split_documents(docs)
+    split_seconds = time.perf_counter() - start
+
+    return {
+        "files": args.files,
+        "mb": round(total_bytes / 1e6, 2),
+        "load_files_per_s": round(args.files / load_seconds, 1),
+        "load_mb_per_s": round(total_bytes / 1e6 / load_seconds, 2),
+        "split_chunks": len(chunks),
+        "split_chunks_per_s": round(len(chunks) / split_seconds, 1),
+    }
+
+
+def bench_ingest(base, args, rng) -> dict:
+    from core.langchain_vector import create_vector_store
+
+    if not os.listdir(base.LOAD_PATH):
+        fakes.write_corpus(base.LOAD_PATH, args.files, args.file_chars, rng)
+
+    start = time.perf_counter()
+    stats = create_vector_store(source_dir=base.LOAD_PATH)
+    seconds = time.perf_counter() - start
+
+    # 文件未变更时再次执行，只需扫描文件
+    start = time.perf_counter()
+    create_vector_store(source_dir=base.LOAD_PATH)
+    rescan_seconds = time.perf_counter() - start
+
+    return {
+        "files": stats["added"],
+        "chunks": stats["chunks"],
+        "seconds": round(seconds, 3),
+        "chunks_per_s": round(stats["chunks"] / seconds, 1),
+        "rescan_seconds": round(rescan_seconds, 3),
+    }
+
+
+CORPUS_TEXT = {"words": fakes.random_text, "zipf": fakes.zipf_text}
+
+
+def build_chunks(store, keyword_index, size: int, rng, batch: int = 5000, corpus: str = "words"):
+    """向向量数据库和关键词索引写入 size 个随机文本块"""
+
+    random_text = CORPUS_TEXT[corpus]
+    for offset in range(0, size, batch):
+        count = min(batch, size - offset)
+        ids = [f"chunk-{offset + i}" for i in range(count)]
+        texts = [random_text(rng, 200) for _ in range(count)]
+        store.add_texts(texts, metadatas=[{"source": f"doc_{offset // batch}"}] * count, ids=ids)
+        keyword_index.add(ids, texts)
+    keyword_index.flush()
+
+
+def bench_retrieval(base, args, rng) -> dict:
+    from langchain_chroma import Chroma
+
+    import core.langchain_retrieval as retrieval
+    from core.bm25_index import BM25Index
+    from core.flat_vector_store import FlatVectorStore
+
+    results = {}
+    queries = [CORPUS_TEXT[args.corpus](rng, 20) for _ in range(args.queries)]
+    for size in args.retrieval_sizes:
+        directory = os.path.join(base.VECTOR_DIR, f"retrieval_{size}")
+        if args.vector_backend == "flat":
+            store = FlatVectorStore(
+                directory,
+                base.embeddings_model(),
+                ivf_lists=base.FLAT_IVF_LISTS,
+                ivf_min_rows=base.FLAT_IVF_MIN_ROWS,
+                nprobe=base.FLAT_IVF_NPROBE,
+                quantization=base.FLAT_QUANTIZATION,
+                rescore=base.FLAT_RESCORE_FACTOR,
+            )
+        else:
+            store = Chroma(
+                persist_directory=directory,
+                collection_name="bench",
+                embedding_function=base.embeddings_model(),
+            )
+        keyword_index = BM25Index(os.path.join(directory, "bm25_index.db"))
+
+        start = time.perf_counter()
+        build_chunks(store, keyword_index, size, rng, corpus=args.corpus)
+        build_seconds = time.perf_counter() - start
+
+        retriever = retrieval.build_retriever(store, keyword_index)
+
+        hybrid, vector, keyword = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            retriever.invoke(query)
+            hybrid.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            retriever.vector_retriever.invoke(query)
+            vector.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            keyword_index.search(query, retriever.keyword_k)
+            keyword.append(time.perf_counter() - start)
+
+        results[str(size)] = {
+            "build_seconds": round(build_seconds, 2),
+            "hybrid": percentiles(hybrid),
+            "vector": percentiles(vector),
+            "keyword": percentiles(keyword),
+        }
+        print(f"检索 {size} 个文本块：{results[str(size)]}")
+    return results
+
+
+async def bench_stream(base, args) -> dict:
+    from core.langchain_retrieval import build_qa_chain
+    from core.llm_scheduler import llm_scheduler
+    from crud.history_writer import history_writer
+    from routers.chat_router import generate_stream
+
+    # 检索器不会被调用：参数中已经带有 context
+    chain = build_qa_chain(retriever=object())
+    llm = base.chat_llm()
+    llm.think_tokens, llm.answer_tokens = args.stream_tokens // 5, args.stream_tokens
+    tokens = len(llm.tokens())
+    params = {"question": "FFF团会长是谁？", "chat_history": [], "context": []}
+    history_writer.start()
+
+    async def raw():
+        async for _ in chain.astream(params):
+            pass
+
+    async def wrapped():
+        ticket = llm_scheduler.acquire("bench")
+        async for _ in generate_stream(chain, params, uuid.uuid4(), ticket):
+            pass
+
+    timings = {"raw": [], "generate_stream": []}
+    for _ in range(args.rounds):
+        for name, func in (("raw", raw), ("generate_stream", wrapped)):
+            start = time.perf_counter()
+            await func()
+            timings[name].append(time.perf_counter() - start)
+    await history_writer.stop()
+
+    raw_s = statistics.median(timings["raw"])
+    wrapped_s = statistics.median(timings["generate_stream"])
+    return {
+        "tokens": tokens,
+        "raw_ms": round(raw_s * 1000, 3),
+        "generate_stream_ms": round(wrapped_s * 1000, 3),
+        "overhead_us_per_token": round((wrapped_s - raw_s) / tokens * 1e6, 3),
+    }
+
+
+async def bench_crud(args) -> dict:
+    from crud.chat_history_crud import ChatHistoryCrud
+    from crud.chat_session_crud import ChatSessionCrud
+    from crud.history_writer import history_writer
+    from models.chat_history_model import ChatHistoryCreate
+    from models.chat_session_model import ChatSessionParams
+
+    history_crud = ChatHistoryCrud()
+    session_crud = ChatSessionCrud()
+    history_writer.start()
+
+    session_ids = []
+    start = time.perf_counter()
+    for i in range(args.sessions):
+        session = await session_crud.save(ChatSessionParams(title=f"会话{i}"))
+        session_ids.append(session.id)
+    session_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(args.history_rows):
+        await history_crud.add_item(
+            ChatHistoryCreate(
+                role="user" if i % 2 == 0 else "assistant",
+                content="测试内容" * 50,
+                chat_session_id=session_ids[i % len(session_ids)],
+            )
+        )
+    for session_id in session_ids:
+        await history_writer.wait_for(session_id)
+    add_seconds = time.perf_counter() - start
+
+    recent, full, listing = [], [], []
+    for i in range(args.queries):
+        session_id = session_ids[i % len(session_ids)]
+        start = time.perf_counter()
+        await history_crud.list_recent_by_chat_session_id(session_id, 20)
+        recent.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await history_crud.list_by_chat_session_id(session_id)
+        full.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await session_crud.list()
+        listing.append(time.perf_counter() - start)
+    await history_writer.stop()
+
+    return {
+        "session_save_per_s": round(args.sessions / session_seconds, 1),
+        "history_add_per_s": round(args.history_rows / add_seconds, 1),
+        "list_recent": percentiles(recent),
+        "list_by_session": percentiles(full),
+        "session_list": percentiles(listing),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=APP_DIR.parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    items = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[name] = value
+    return items
+
+
+def compare(current: dict, baseline_path: str):
+    """逐项对比两次结果，变化超过 10% 的项目标出"""
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n对比 {baseline_path}（{baseline['meta'].get('commit')} → {current['meta'].get('commit')}）")
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    for name in sorted(old.keys() & new.keys()):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        flag = " *" if abs(change) >= 0.1 else ""
+        print(f"  {name:<45} {old[name]:>12} → {new[name]:>12} {change:+7.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=["parse", "ingest", "retrieval", "stream", "crud"],
+        help="只执行部分测试项",
+    )
+    parser.add_argument("--files", type=int, default=200, help="生成的语料文件数")
+    parser.add_argument("--file-chars", type=int, default=5000, help="每个文件的字符数")
+    parser.add_argument(
+        "--retrieval-sizes", type=int, nargs="+", default=[10000, 100000], help="检索测试的文本块数量"
+    )
+    parser.add_argument("--queries", type=int, default=200, help="检索与查询的次数")
+    parser.add_argument(
+        "--corpus",
+        choices=list(CORPUS_TEXT),
+        default="words",
+        help="检索测试的语料：words 只有几十个常用词（关键词检索的最坏情况），zipf 词频服从 Zipf 分布",
+    )
+    parser.add_argument(
+        "--vector-backend", choices=["chroma", "flat"], default="chroma", help="向量化与检索测试使用的向量存储"
+    )
+    parser.add_argument("--stream-tokens", type=int, default=2000, help="每次回答的 token 数")
+    parser.add_argument("--rounds", type=int, default=5, help="流式输出测试的轮数")
+    parser.add_argument("--sessions", type=int, default=50, help="会话数")
+    parser.add_argument("--history-rows", type=int, default=5000, help="写入的聊天记录条数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    parser.add_argument("--compare", help="用于对比的历史结果 JSON 文件")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    base = fakes.setup(tmp_dir)
+    base.VECTOR_BACKEND = args.vector_backend
+    from crud.base import create_db_and_tables
+
+    create_db_and_tables()
+
+    only = set(args.only or ["parse", "ingest", "retrieval", "stream", "crud"])
+    rng = random.Random(args.seed)
+    results = {}
+    if "parse" in only:
+        results["parse"] = bench_parse(base, args, rng)
+    if "ingest" in only:
+        results["ingest"] = bench_ingest(base, args, rng)
+    if "retrieval" in only:
+        results["retrieval"] = bench_retrieval(base, args, rng)
+    if "stream" in only:
+        results["stream"] = asyncio.run(bench_stream(base, args))
+    if "crud" in only:
+        results["crud"] = asyncio.run(bench_crud(args))
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    if args.compare:
+        compare(output, args.compare)
+
+
+if __name__ == "__main__":
+    main()
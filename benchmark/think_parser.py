@@ -0,0 +1,140 @@
+"""
+<think> 流式解析基准测试
+
+模拟 10k token 的回答（推理过程 + 回答），对比原实现（按 chunk 判断标签、字符串 += 拼接）
+与 ThinkParser 的耗时（feed：原样转发时只收集；split：分开输出时同时返回片段），
+并校验在标签被任意拆分时 ThinkParser 的解析结果是否正确。
+
+用法（在项目根目录执行）：
+    python benchmark/think_parser.py --tokens 10000 --rounds 20
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+from core.think_parser import ThinkParser
+
+
+PIECES = ["根据", "文档", "内容", "，", "FFF", "团", "的", "会长", "是", "大靓仔", "。", "\n", "<", ">", "/"]
+
+
+def sample_tokens(tokens: int, rng: random.Random) -> tuple[list[str], list[str]]:
+    """生成 (推理过程, 回答) 的 token 列表，各占一半 token"""
+
+    think = [rng.choice(PIECES) for _ in range(tokens // 2)]
+    content = [rng.choice(PIECES) for _ in range(tokens // 2)]
+    return think, content
+
+
+def sample_answer(tokens: int, rng: random.Random) -> tuple[str, str]:
+    think, content = sample_tokens(tokens, rng)
+    return "".join(think), "".join(content)
+
+
+def split_chunks(text: str, rng: random.Random, max_size: int = 4) -> list[str]:
+    """把文本拆成随机长度的 chunk，标签会落在任意边界上"""
+
+    chunks = []
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, max_size)
+        chunks.append(text[i : i + size])
+        i += size
+    return chunks
+
+
+def legacy_parse(chunks: list[str]) -> tuple[str, str]:
+    """原实现：整个 chunk 包含标签时跳过该 chunk，字符串 += 拼接"""
+
+    think = ""
+    content = ""
+    is_thinking = False
+    for chunk in chunks:
+        loop_continue = False
+        if "<think>" in chunk:
+            is_thinking = True
+            loop_continue = True
+        if "</think>" in chunk:
+            is_thinking = False
+            loop_continue = True
+        if not loop_continue:
+            if is_thinking:
+                think += chunk
+            else:
+                content += chunk
+    return think, content
+
+
+def parse(chunks: list[str]) -> tuple[str, str]:
+    parser = ThinkParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.finish()
+    return parser.think, parser.content
+
+
+def parse_split(chunks: list[str]) -> tuple[str, str]:
+    """STREAM_SPLIT_THINK 时的用法：每个 chunk 都返回片段，片段拼接后应与 think / content 一致"""
+
+    parser = ThinkParser()
+    parts = {"think": [], "content": []}
+    for chunk in chunks:
+        for kind, text in parser.split(chunk):
+            parts[kind].append(text)
+    for kind, text in parser.finish():
+        parts[kind].append(text)
+    assert ("".join(parts["think"]), "".join(parts["content"])) == (parser.think, parser.content)
+    return parser.think, parser.content
+
+
+def check(rounds: int, rng: random.Random):
+    """随机拆分 chunk，校验解析结果与原文一致"""
+
+    legacy_errors = 0
+    for _ in range(rounds):
+        think, content = sample_answer(400, rng)
+        text = f"<think>{think}</think>{content}"
+        chunks = split_chunks(text, rng)
+        assert parse(chunks) == (think, content)
+        assert parse_split(chunks) == (think, content)
+        if legacy_parse(chunks) != (think, content):
+            legacy_errors += 1
+    print(f"正确性：ThinkParser {rounds}/{rounds}，原实现 {rounds - legacy_errors}/{rounds}")
+
+
+def bench(name: str, func, chunk_lists: list[list[str]]):
+    start = time.perf_counter()
+    for chunks in chunk_lists:
+        func(chunks)
+    elapsed = (time.perf_counter() - start) / len(chunk_lists)
+    print(f"{name:<12} {elapsed * 1000:8.2f}ms/回答")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=10000, help="每个回答的 token 数")
+    parser.add_argument("--rounds", type=int, default=20, help="回答数量")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    check(200, rng)
+
+    # 按 token 拆分：每个 chunk 为一个 token，标签单独作为 chunk（原实现能正确处理的情况）
+    chunk_lists = []
+    for _ in range(args.rounds):
+        think, content = sample_tokens(args.tokens, rng)
+        chunk_lists.append(["<think>", *think, "</think>", *content])
+    print(f"{args.rounds} 个回答，每个 {args.tokens} token")
+    bench("原实现", legacy_parse, chunk_lists)
+    bench("feed", parse, chunk_lists)
+    bench("split", parse_split, chunk_lists)
+
+
+if __name__ == "__main__":
+    main()
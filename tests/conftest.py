@@ -0,0 +1,61 @@
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# 与 app/main.py 相同，模块按 app 目录下的路径导入；模拟组件（fakes）放在 benchmark 目录
+sys.path.insert(0, str(ROOT / "app"))
+sys.path.insert(0, str(ROOT / "benchmark"))
+
+import fakes
+
+# 数据库、向量数据库等使用临时目录，LLM 与 embedding 使用模拟组件；
+# 需要在测试模块导入 core 下除 base 以外的模块之前完成
+TMP_DIR = tempfile.mkdtemp(prefix="doc_qa_test_")
+base = fakes.setup(TMP_DIR)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from crud.base import create_db_and_tables
+    from main import app
+
+    create_db_and_tables()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def session_id(client):
+    return client.post("/session/add", json={"title": "测试"}).json()["data"]["id"]
+
+
+@pytest.fixture
+def vector_dir(tmp_path, monkeypatch):
+    """flat 后端，向量存储、关键词索引和索引清单都使用单独的临时目录"""
+
+    monkeypatch.setattr(base, "VECTOR_BACKEND", "flat")
+    monkeypatch.setattr(base, "FLAT_VECTOR_DIR", str(tmp_path / "flat"))
+    monkeypatch.setattr(base, "BM25_INDEX_PATH", str(tmp_path / "bm25_index.db"))
+    monkeypatch.setattr(base, "INDEX_MANIFEST_PATH", str(tmp_path / "index_manifest.json"))
+    # 每批 10 个文本块，一个文件分多个批次写入
+    monkeypatch.setattr(base, "EMBED_BATCH_SIZE", 10)
+    base.bm25_index.cache_clear()
+    base.flat_vector_store.cache_clear()
+    yield tmp_path
+    base.bm25_index.cache_clear()
+    base.flat_vector_store.cache_clear()
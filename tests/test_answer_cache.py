@@ -0,0 +1,71 @@
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from core.answer_cache import AnswerCache
+
+QUESTION = "FFF团的会长是谁？"
+DOCS = [Document(page_content="FFF团的会长是大靓仔", id="doc-1")]
+
+
+def put(cache: AnswerCache, question: str, docs=DOCS, version: int = 1):
+    cache.put(cache.embed(question), docs, version, [question], "", f"回答：{question}")
+
+
+def hit(cache: AnswerCache, question: str, docs=DOCS, version: int = 1) -> str | None:
+    entry, _ = cache.lookup(question, docs, version)
+    return entry.content if entry else None
+
+
+@pytest.mark.parametrize("offset, expected", [(-0.01, True), (0.01, False)])
+def test_similarity_threshold(offset, expected):
+    """相似度不低于阈值时命中，低于阈值时不命中"""
+
+    similar = "FFF团的会长是谁"
+    cache = AnswerCache()
+    similarity = float(cache.embed(QUESTION) @ cache.embed(similar))
+    assert 0.5 < similarity < 1
+
+    cache.threshold = similarity + offset
+    put(cache, QUESTION)
+    assert hit(cache, QUESTION) == f"回答：{QUESTION}"
+    assert (hit(cache, similar) is not None) == expected
+    assert hit(cache, "向量数据库如何备份？") is None
+
+
+def test_docs_and_version_must_match():
+    """检索到的文本块或检索链版本不同（重新向量化后）时不命中"""
+
+    cache = AnswerCache()
+    put(cache, QUESTION)
+    assert hit(cache, QUESTION, docs=[Document(page_content="其他", id="doc-2")]) is None
+    assert hit(cache, QUESTION, docs=[]) is None
+    assert hit(cache, QUESTION, version=2) is None
+    assert hit(cache, QUESTION) is not None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+
+def test_ttl_expiry():
+    cache = AnswerCache(ttl=0.05)
+    put(cache, QUESTION)
+    assert hit(cache, QUESTION) is not None
+    time.sleep(0.1)
+    assert hit(cache, QUESTION) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction():
+    """超过容量时淘汰最久未使用（而不是最早写入）的回答"""
+
+    cache = AnswerCache(max_entries=2)
+    questions = ["FFF团的会长是谁？", "向量数据库如何备份？", "服务部署需要哪些配置？"]
+    put(cache, questions[0])
+    put(cache, questions[1])
+    assert hit(cache, questions[0]) is not None
+    put(cache, questions[2])
+
+    assert hit(cache, questions[1]) is None
+    assert hit(cache, questions[0]) is not None
+    assert hit(cache, questions[2]) is not None
+    assert cache.stats()["entries"] == 2
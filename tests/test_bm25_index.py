@@ -0,0 +1,117 @@
+import math
+import random
+import sqlite3
+from collections import Counter
+
+import pytest
+
+import fakes
+from core.bm25_index import BM25Index, tokenize
+
+
+def brute_force(texts: dict, query: str, k1: float = 1.2, b: float = 0.75) -> Counter:
+    """逐个文本块计算 BM25 得分，用于校验索引的查询结果"""
+
+    tokens = {doc_id: Counter(tokenize(text)) for doc_id, text in texts.items()}
+    lengths = {doc_id: max(sum(counter.values()), 1) for doc_id, counter in tokens.items()}
+    avgdl = sum(lengths.values()) / len(lengths)
+    scores = Counter()
+    for term, count in Counter(tokenize(query)).items():
+        df = sum(1 for counter in tokens.values() if term in counter)
+        if df == 0:
+            continue
+        idf = math.log(1 + (len(texts) - df + 0.5) / (df + 0.5))
+        for doc_id, counter in tokens.items():
+            tf = counter.get(term, 0)
+            if tf:
+                norm = k1 * (1 - b + b * lengths[doc_id] / avgdl)
+                scores[doc_id] += idf * tf * (k1 + 1) / (tf + norm) * count
+    return scores
+
+
+def assert_same(found, scores: Counter, k: int = 10):
+    """得分相同的文本块顺序不确定：比较前 k 个得分，并校验每个结果的得分"""
+
+    expected = [score for _, score in scores.most_common(k)]
+    assert [score for _, score in found] == pytest.approx(expected, rel=1e-4)
+    for doc_id, score in found:
+        assert score == pytest.approx(scores[doc_id], rel=1e-4)
+
+
+def test_search_matches_brute_force_after_updates(tmp_path):
+    """查询结果与逐个计算一致；写入、覆盖和删除后缓存的得分随之更新"""
+
+    rng = random.Random(0)
+    index = BM25Index(str(tmp_path / "bm25_index.db"), max_df_ratio=1.0)
+    texts = {f"c{i}": fakes.random_text(rng, 60) + f" ERR-E{i % 7}" for i in range(300)}
+    index.add(list(texts), list(texts.values()))
+    index.flush()
+    queries = [fakes.random_text(rng, 12) for _ in range(20)] + ["E3 部署", "err-e5"]
+    for query in queries:
+        assert_same(index.search(query, 10), brute_force(texts, query))
+
+    # 覆盖和删除部分文本块，再写入新的文本块
+    for doc_id in list(texts)[:50]:
+        texts[doc_id] = fakes.random_text(rng, 60)
+    index.add(list(texts)[:50], [texts[doc_id] for doc_id in list(texts)[:50]])
+    removed = list(texts)[50:120]
+    index.delete(removed)
+    for doc_id in removed:
+        del texts[doc_id]
+    new = {f"n{i}": fakes.random_text(rng, 60) for i in range(100)}
+    index.add(list(new), list(new.values()))
+    texts.update(new)
+    index.flush()
+    for query in queries:
+        found = index.search(query, 10)
+        assert not {doc_id for doc_id, _ in found} & set(removed)
+        assert_same(found, brute_force(texts, query))
+
+
+@pytest.mark.parametrize("k", [1, 10, 50])
+def test_pruned_search_matches_brute_force(tmp_path, k):
+    """词频服从 Zipf 分布时剪枝生效（常见词只在候选中查找），结果与逐个计算一致"""
+
+    rng = random.Random(0)
+    index = BM25Index(str(tmp_path / "bm25_index.db"), max_df_ratio=1.0, flush_size=400)
+    texts = {f"c{i}": fakes.zipf_text(rng, 60) for i in range(1000)}
+    index.add(list(texts), list(texts.values()))
+    index.flush()
+    for _ in range(15):
+        # 查询由一个较少见的文本块片段和几个常见词组成
+        query = rng.choice(list(texts.values()))[:8] + fakes.zipf_text(rng, 10)
+        assert_same(index.search(query, k), brute_force(texts, query), k)
+
+
+def test_failed_flush_keeps_state(tmp_path, monkeypatch):
+    """持久化失败时回滚：内存中的统计不变、缓冲区保留，重试成功后与逐个计算一致"""
+
+    rng = random.Random(0)
+    index = BM25Index(str(tmp_path / "bm25_index.db"), max_df_ratio=1.0, max_segments=1)
+    texts = {f"c{i}": fakes.random_text(rng, 60) for i in range(100)}
+    index.add(list(texts), list(texts.values()))
+    index.flush()
+    query = fakes.random_text(rng, 12)
+    before = index.search(query, 10)
+
+    update = {f"c{i}": fakes.random_text(rng, 60) for i in range(50, 150)}
+    index.add(list(update), list(update.values()))
+    index.delete(["c0", "c1"])
+
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    # 第二个段写入后合并倒排段时失败，此时文本块和倒排段已经写入但还没有提交
+    monkeypatch.setattr(index, "_merge", fail)
+    version = index.version
+    with pytest.raises(sqlite3.OperationalError):
+        index.flush()
+    assert (len(index), index.version) == (100, version)
+    assert index.search(query, 10) == before
+
+    monkeypatch.undo()
+    index.flush()
+    texts.update(update)
+    del texts["c0"], texts["c1"]
+    assert len(index) == len(texts) == 148
+    assert_same(index.search(query, 10), brute_force(texts, query))
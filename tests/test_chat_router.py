@@ -0,0 +1,56 @@
+import uuid
+from datetime import datetime
+
+from core.answer_cache import answer_cache
+from core.llm_scheduler import llm_scheduler
+
+
+def ask(client, session_id, content="FFF团的会长是谁？"):
+    return client.post(
+        "/chat", json={"messages": {"role": "user", "content": content}, "chat_session_id": session_id}
+    )
+
+
+def history(client, session_id) -> list[dict]:
+    return client.get("/chat/history", params={"id": session_id}).json()["data"]
+
+
+def test_rejected_question_is_not_saved(client, session_id, monkeypatch):
+    """排队已满返回 429 时，提问不写入历史记录"""
+
+    monkeypatch.setattr(llm_scheduler, "max_queue", 0)
+    monkeypatch.setattr(llm_scheduler, "_active", llm_scheduler.max_concurrency)
+    response = ask(client, session_id)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"]
+    monkeypatch.undo()
+
+    assert history(client, session_id) == []
+
+
+def test_answer_releases_llm_slot(client):
+    """正常回答和命中回答缓存后都归还 LLM 名额；回答缓存只用于没有历史记录的提问，所以每次使用新的会话"""
+
+    question = f"FFF团的会长是谁？{uuid.uuid4().hex}"
+    hits = answer_cache.stats()["hits"]
+    for i in range(2):
+        session_id = client.post("/session/add", json={"title": "测试"}).json()["data"]["id"]
+        response = ask(client, session_id, question)
+        assert response.status_code == 200
+        assert llm_scheduler.stats()["active"] == 0
+        assert answer_cache.stats()["hits"] == hits + i
+        assert [item["role"] for item in history(client, session_id)] == ["user", "assistant"]
+
+
+def test_history_fields(client, session_id):
+    """历史记录只查询列不构造 ORM 对象，返回的字段与格式不变"""
+
+    question = f"FFF团的会长是谁？{uuid.uuid4().hex}"
+    assert ask(client, session_id, question).status_code == 200
+    user, assistant = history(client, session_id)
+    assert (user["role"], user["content"], user["truncated"]) == ("user", question, False)
+    assert user["chat_session_id"] == assistant["chat_session_id"] == session_id
+    assert assistant["role"] == "assistant" and assistant["content"]
+    assert datetime.strptime(assistant["date"], "%Y-%m-%d %H:%M:%S") >= datetime.strptime(
+        user["date"], "%Y-%m-%d %H:%M:%S"
+    )
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+from langchain_core.output_parsers import StrOutputParser
+
+import fakes
+from core.llm_scheduler import llm_scheduler
+from crud.history_writer import history_writer
+from routers import chat_router
+
+
+class TrackedChatModel(fakes.FakeChatModel):
+    """记录已输出的 token 数，以及流式输出是否已被关闭"""
+
+    state: dict = {}
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.state.update(produced=0, closed=False)
+        try:
+            async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                self.state["produced"] += 1
+                yield chunk
+        finally:
+            self.state["closed"] = True
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+def tracked_chain():
+    # 约 5 秒才能输出完，测试在输出过程中断开
+    llm = TrackedChatModel(tokens_per_second=1000, think_tokens=5, answer_tokens=5000, state={})
+    return llm, llm | StrOutputParser()
+
+
+async def saved_answers(chat_session_id: uuid.UUID) -> list:
+    history = await chat_router.chat_history_crud.list_by_chat_session_id(chat_session_id)
+    return [item for item in history if item.role == "assistant"]
+
+
+@pytest.mark.parametrize("how", ["request", "close"])
+def test_disconnect_stops_generation_and_saves_partial_answer(app, monkeypatch, how):
+    """客户端中途断开：停止调用 LLM，已生成的部分回答保存为 truncated=True"""
+
+    monkeypatch.setattr(chat_router, "DISCONNECT_CHECK_INTERVAL", 0)
+    llm, chain = tracked_chain()
+    chat_session_id = uuid.uuid4()
+
+    async def run():
+        request = FakeRequest()
+        ticket = llm_scheduler.acquire(str(chat_session_id))
+        frames = chat_router.generate_stream(chain, "问题", chat_session_id, ticket, request=request)
+        received = []
+        async for frame in frames:
+            received.append(json.loads(frame))
+            if len(received) == 50:
+                if how == "request":
+                    # 下一次检查时发现断开，响应流自行结束
+                    request.disconnected = True
+                else:
+                    # StreamingResponse 被取消后，close_stream 关闭响应流
+                    break
+        await chat_router.close_stream(frames, ticket)
+        answers = await saved_answers(chat_session_id)
+        await history_writer.stop()
+        return received, answers
+
+    received, answers = asyncio.run(run())
+
+    assert llm.state["closed"]
+    assert llm.state["produced"] < 100
+    assert not any(frame.get("done") for frame in received)
+    assert llm_scheduler.stats()["active"] == 0
+
+    assert len(answers) == 1
+    answer = answers[0]
+    assert answer.truncated is True
+    assert answer.think
+    assert 0 < len(answer.content) < 5000
+
+
+def test_completed_stream_is_not_truncated(app):
+    llm = fakes.FakeChatModel(think_tokens=5, answer_tokens=20)
+    chat_session_id = uuid.uuid4()
+
+    async def run():
+        ticket = llm_scheduler.acquire(str(chat_session_id))
+        frames = chat_router.generate_stream(llm | StrOutputParser(), "问题", chat_session_id, ticket)
+        received = [json.loads(frame) async for frame in frames]
+        answers = await saved_answers(chat_session_id)
+        await history_writer.stop()
+        return received, answers
+
+    received, answers = asyncio.run(run())
+    assert received[-1]["done"] is True
+    assert len(answers) == 1 and answers[0].truncated is False
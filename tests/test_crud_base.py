@@ -0,0 +1,27 @@
+from sqlalchemy import inspect, text
+from sqlmodel import create_engine
+
+from crud.base import add_missing_columns
+
+
+def test_add_missing_columns(tmp_path):
+    """升级前创建的 chathistory 表没有 truncated 列：启动时补建，已有记录取默认值"""
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE chathistory (id CHAR(32) PRIMARY KEY, role VARCHAR NOT NULL, "
+                "content VARCHAR NOT NULL, think VARCHAR, chat_session_id CHAR(32), date DATETIME NOT NULL)"
+            )
+        )
+        connection.execute(
+            text("INSERT INTO chathistory VALUES ('a', 'assistant', '回答', NULL, NULL, '2024-01-01 00:00:00')")
+        )
+
+    add_missing_columns(engine)
+    assert "truncated" in {column["name"] for column in inspect(engine).get_columns("chathistory")}
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT truncated FROM chathistory")).scalar_one() == 0
+    # 再次执行不重复添加
+    add_missing_columns(engine)
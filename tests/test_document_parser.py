@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from core import document_parser
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def write_files(directory, names: list[str]) -> list[str]:
+    paths = []
+    for name in names:
+        path = directory / name
+        path.write_text(f"文本{name}", encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def crash_on_marker(path: str):
+    """文件名带 crash 时子进程直接退出，模拟解析器崩溃"""
+
+    if "crash" in os.path.basename(path):
+        os._exit(1)
+    return document_parser.load_file(path)
+
+
+def test_executor_is_reused(tmp_path):
+    """进程池在多次解析之间复用，不会每次重新启动子进程"""
+
+    paths = write_files(tmp_path, ["0.txt", "1.txt", "2.txt"])
+
+    first = {path: docs for path, docs, _ in document_parser.parse_files(paths, 2, 60)}
+    executor = document_parser._executor
+    second = {path: docs for path, docs, _ in document_parser.parse_files(paths, 2, 60)}
+
+    assert executor is not None and document_parser._executor is executor
+    for path in paths:
+        text = f"文本{os.path.basename(path)}"
+        assert [doc.page_content for doc in first[path]] == [text]
+        assert [doc.page_content for doc in second[path]] == [text]
+
+
+def test_idle_executor_is_shut_down(tmp_path):
+    paths = write_files(tmp_path, ["0.txt"])
+    list(document_parser.parse_files(paths, 1, 60, idle_timeout=0.1))
+    assert document_parser._executor is not None
+    time.sleep(0.5)
+    assert document_parser._executor is None
+
+
+def test_only_crashed_file_fails(tmp_path, monkeypatch):
+    """子进程崩溃时，同时在解析的其他文件重新解析成功，只有导致崩溃的文件失败"""
+
+    monkeypatch.setattr(document_parser, "load_file", crash_on_marker)
+    paths = write_files(tmp_path, ["0.txt", "1.txt", "crash.txt", "3.txt", "4.txt", "5.txt"])
+
+    results = {path: (docs, error) for path, docs, error in document_parser.parse_files(paths, 3, 60)}
+
+    assert set(results) == set(paths)
+    for path, (docs, error) in results.items():
+        if "crash" in os.path.basename(path):
+            assert (docs, error) == ([], "解析进程异常退出")
+        else:
+            assert error is None
+            assert [doc.page_content for doc in docs] == [f"文本{os.path.basename(path)}"]
+
+
+@pytest.mark.skipif(
+    "forkserver" not in multiprocessing.get_all_start_methods(), reason="需要 forkserver"
+)
+def test_workers_do_not_import_main(tmp_path):
+    """python main.py 启动时，解析子进程不重新导入主模块"""
+
+    paths = write_files(tmp_path, ["0.txt", "1.txt", "2.txt"])
+    script = tmp_path / "main.py"
+    script.write_text(
+        f"""
+import sys
+sys.path.insert(0, {str(APP_DIR)!r})
+print("imported main", flush=True)
+from core.document_parser import parse_files
+
+if __name__ == "__main__":
+    results = list(parse_files({paths!r}, 3, 60))
+    print("parsed", sum(1 for _, docs, _ in results if docs), flush=True)
+""",
+        encoding="utf-8",
+    )
+    output = subprocess.run(
+        [sys.executable, str(script)], capture_output=True, text=True, timeout=120
+    ).stdout
+    assert output.count("imported main") == 1
+    assert "parsed 3" in output
@@ -0,0 +1,42 @@
+import os
+import random
+
+from langchain_core.documents import Document
+
+import eval_retrieval
+from core import base
+from core.langchain_retrieval import build_retriever
+from core.langchain_vector import create_vector_store
+
+
+def test_evaluate_recall_and_mrr():
+    """recall@k 按文档计，同一文档的多个文本块只算一次；MRR 取第一个命中的排名"""
+
+    results = {
+        "q1": [Document("x", metadata={"source": "/docs/b.txt"}), Document("y", metadata={"source": "/docs/a.txt"})],
+        "q2": [Document("z", metadata={"source": "/docs/sub/c.txt"})] * 2,
+    }
+    dataset = [
+        {"question": "q1", "expected": ["a.txt", "missing.txt"]},
+        {"question": "q2", "expected": ["sub/c.txt"]},
+    ]
+    row = eval_retrieval.evaluate(results.__getitem__, dataset, "/docs")
+    assert row["recall"] == (0.5 + 1) / 2
+    assert row["mrr"] == (1 / 2 + 1) / 2
+    assert row["context_tokens"] > 0 and row["p95_ms"] >= row["p50_ms"]
+
+
+def test_synthetic_dataset_end_to_end(vector_dir):
+    """生成的问题取自应命中的文档；按问题检索，混合检索能找回大部分文档，k 限制返回数量"""
+
+    docs_dir = str(vector_dir / "corpus")
+    dataset = eval_retrieval.synthetic_dataset(docs_dir, 6, 10, random.Random(0))
+    for item in dataset:
+        with open(os.path.join(docs_dir, item["expected"][0]), encoding="utf-8") as f:
+            assert item["question"].split("。")[0] in f.read()
+
+    create_vector_store(source_dir=docs_dir)
+    retriever = build_retriever(base.open_vector_store(), base.bm25_index(), k=2, fetch_k=30, lambda_mult=0.8)
+    assert (retriever.vector_retriever.fetch_k, retriever.vector_retriever.lambda_mult) == (30, 0.8)
+    assert all(len(retriever.invoke(item["question"])) <= 2 for item in dataset)
+    assert eval_retrieval.evaluate(retriever.invoke, dataset, docs_dir)["recall"] >= 0.8
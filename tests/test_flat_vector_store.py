@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+import fakes
+from core.flat_vector_store import FlatVectorStore
+from core.mmr import normalize_rows
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_ivf_reused_rows_are_returned_once(tmp_path, quantization):
+    """删除后写入的文本块复用其他簇区间内的空行，IVF 检索多个簇时不能重复返回"""
+
+    rng = np.random.default_rng(0)
+    dim = 32
+    store = FlatVectorStore(
+        str(tmp_path), fakes.FakeEmbeddings(dim), ivf_lists=16, ivf_min_rows=2000, nprobe=4, quantization=quantization
+    )
+    ids = [f"c{i}" for i in range(3000)]
+    store.add_vectors(ids, normalize_rows(rng.standard_normal((3000, dim))), ids, [{}] * len(ids))
+    assert store._centroids is not None
+
+    store.delete(ids[::3])
+    new_vectors = normalize_rows(rng.standard_normal((800, dim)))
+    new_ids = [f"n{i}" for i in range(800)]
+    store.add_vectors(new_ids, new_vectors, new_ids, [{}] * len(new_ids))
+
+    for vector in new_vectors[:50]:
+        found = [doc.id for doc, _ in store.similarity_search_with_score_by_vector(vector.tolist(), 10)]
+        assert len(found) == len(set(found)) == 10
+        candidates = store.query_candidates(vector.tolist(), 20)[0]
+        assert len(candidates) == len(set(candidates))
+        rows, _ = store.search_vector(vector, 20)
+        assert len(rows) == len(set(rows.tolist()))
+
+
+@pytest.mark.parametrize("quantization, threshold", [("int8", 0.95), ("binary", 0.85)])
+def test_quantized_recall(tmp_path, quantization, threshold):
+    """量化后按编码取候选再按原始向量重新排序，recall@10 相对精确检索不低于阈值"""
+
+    rng = np.random.default_rng(0)
+    dim, size = 256, 5000
+    # 按簇分布的向量，与真实 embedding 一样相近的文本聚在一起
+    centers = normalize_rows(rng.standard_normal((50, dim)))
+    vectors = normalize_rows(centers[rng.integers(0, 50, size)] + rng.standard_normal((size, dim)) * 0.08)
+    queries = normalize_rows(vectors[:100] + rng.standard_normal((100, dim)) * 0.05)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+
+    store = FlatVectorStore(str(tmp_path), fakes.FakeEmbeddings(dim), quantization=quantization)
+    ids = [str(i) for i in range(size)]
+    store.add_vectors(ids, vectors, ids, [{}] * size)
+    found = [store.search_vector(query, 10)[0] for query in queries]
+    recall = np.mean([len(set(rows.tolist()) & set(top.tolist())) / 10 for rows, top in zip(found, exact)])
+    assert recall >= threshold
+
+
+def test_search_after_deleting_last_rows(tmp_path):
+    """删除末尾的行后精确检索只扫描到最后一个有效行，之后写入的行仍能检索到"""
+
+    rng = np.random.default_rng(0)
+    store = FlatVectorStore(str(tmp_path), fakes.FakeEmbeddings(16))
+    vectors = normalize_rows(rng.standard_normal((100, 16)))
+    ids = [f"c{i}" for i in range(100)]
+    store.add_vectors(ids, vectors, ids, [{}] * len(ids))
+
+    store.delete(ids[50:])
+    rows, _ = store.search_vector(vectors[80], 100)
+    assert sorted(rows.tolist()) == list(range(50))
+
+    store.delete(ids[:50])
+    assert len(store.search_vector(vectors[0], 10)[0]) == 0
+    store.add_vectors(["n"], vectors[80:81], ["n"], [{}])
+    assert [doc.id for doc in store.similarity_search_by_vector(vectors[80].tolist(), 1)] == ["n"]
+
+
+def test_get_sees_other_instance_reset(tmp_path):
+    """另一个实例（其他进程）清空并重新写入后，get 与 search 一样先重新加载"""
+
+    writer = FlatVectorStore(str(tmp_path), fakes.FakeEmbeddings(16))
+    reader = FlatVectorStore(str(tmp_path), fakes.FakeEmbeddings(16))
+    writer.add_texts(["甲", "乙"], ids=["a", "b"])
+    assert reader.get()["ids"] == ["a", "b"]
+
+    writer.reset()
+    writer.add_texts(["丙"], ids=["c"])
+    assert reader.get(include=["documents"])["documents"] == ["丙"]
+    assert reader.count() == 1
+
+
+def test_ivf_all_lists_match_exact_and_reload(tmp_path):
+    """IVF 检索全部簇时与精确检索一致；重新打开（其他进程）后按新的行号读取到相同的结果"""
+
+    rng = np.random.default_rng(0)
+    dim = 32
+    vectors = normalize_rows(rng.standard_normal((3000, dim)))
+    ids = [f"c{i}" for i in range(3000)]
+    store = FlatVectorStore(str(tmp_path), fakes.FakeEmbeddings(dim), ivf_lists=16, ivf_min_rows=2000, nprobe=16)
+    store.add_vectors(ids, vectors, ids, [{"i": i} for i in range(3000)])
+    assert store._centroids is not None
+
+    reopened = FlatVectorStore(str(tmp_path), fakes.FakeEmbeddings(dim), nprobe=16)
+    assert reopened.count() == 3000
+    for query in normalize_rows(rng.standard_normal((20, dim))):
+        exact = np.argsort(-(vectors @ query))[:5]
+        for current in (store, reopened):
+            found = current.similarity_search_by_vector(query.tolist(), 5)
+            assert [doc.id for doc in found] == [ids[i] for i in exact]
+            assert [doc.metadata["i"] for doc in found] == exact.tolist()
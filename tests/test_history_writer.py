@@ -0,0 +1,62 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from crud import history_writer as history_writer_module
+from crud.base import create_db_and_tables
+from crud.history_writer import HistoryWriter
+from models.chat_history_model import ChatHistory
+
+
+def history(chat_session_id) -> ChatHistory:
+    return ChatHistory(role="user", content="问题", chat_session_id=chat_session_id)
+
+
+def test_failed_commit_is_reported(monkeypatch):
+    """重试后仍写入失败时，等待中的查询和之后的第一次查询都收到异常，不当作已提交"""
+
+    class BrokenSession:
+        async def __aenter__(self):
+            raise RuntimeError("database is locked")
+
+        async def __aexit__(self, *args):
+            return False
+
+    monkeypatch.setattr(history_writer_module, "async_session", BrokenSession)
+    chat_session_id = uuid.uuid4()
+
+    async def run():
+        writer = HistoryWriter(flush_ms=1)
+        await writer.submit(history(chat_session_id))
+        with pytest.raises(HTTPException) as waiting:
+            await writer.wait_for(chat_session_id)
+        # 报告过一次后不再重复抛出
+        await writer.wait_for(chat_session_id)
+
+        await writer.submit(history(chat_session_id))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as later:
+            await writer.wait_for(chat_session_id)
+        await writer.stop()
+        return waiting.value, later.value
+
+    waiting, later = asyncio.run(run())
+    assert waiting.status_code == later.status_code == 500
+    assert "database is locked" in waiting.detail
+
+
+def test_commit_resolves_wait_for():
+    create_db_and_tables()
+    chat_session_id = uuid.uuid4()
+
+    async def run():
+        writer = HistoryWriter(flush_ms=1)
+        await writer.submit(history(chat_session_id))
+        await writer.wait_for(chat_session_id)
+        pending = dict(writer._pending)
+        await writer.stop()
+        return pending
+
+    assert asyncio.run(run()) == {}
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+import fakes
+from core import base
+from core.langchain_vector import (
+    VectorizeCancelled,
+    chunk_ids,
+    create_vector_store,
+    file_hash,
+    splitter_config,
+)
+
+
+class StopAfterBatches:
+    """模拟的后台任务：写入指定批次后取消，模拟向量化中断"""
+
+    def __init__(self, batches: int):
+        self.batches = batches
+        self.files_total = 0
+
+    def check_cancelled(self):
+        pass
+
+    def update(self, stage=None, files=0, chunks=0):
+        if chunks:
+            self.batches -= 1
+            if self.batches == 0:
+                raise VectorizeCancelled()
+
+
+def test_chunk_ids_depend_on_splitter_config():
+    ids = chunk_ids("a.txt", "digest", splitter_config(800, 150), 2)
+    assert ids == chunk_ids("a.txt", "digest", splitter_config(800, 150), 2)
+    assert set(ids).isdisjoint(chunk_ids("a.txt", "digest", splitter_config(400, 150), 2))
+    assert set(ids).isdisjoint(chunk_ids("a.txt", "digest", splitter_config(800, 100), 2))
+
+
+def test_rechunk_interrupted_keeps_old_chunks(vector_dir):
+    """修改分割参数后重新向量化中断：旧文本块不被覆盖，重新执行后只留下新参数的文本块"""
+
+    source_dir = vector_dir / "docs"
+    fakes.write_corpus(str(source_dir), 1, 6000, random.Random(0))
+    path = str(next(source_dir.iterdir()))
+    digest = file_hash(path)
+    store = base.open_vector_store()
+
+    create_vector_store(source_dir=str(source_dir), chunk_size=400, chunk_overlap=50)
+    assert (vector_dir / "index_manifest.json").exists()
+    old = store.get(include=["documents"])
+    old_chunks = dict(zip(old["ids"], old["documents"]))
+    assert set(old_chunks) == set(chunk_ids(path, digest, splitter_config(400, 50), len(old_chunks)))
+
+    with pytest.raises(VectorizeCancelled):
+        create_vector_store(
+            source_dir=str(source_dir), chunk_size=100, chunk_overlap=10, job=StopAfterBatches(2)
+        )
+    current = store.get(ids=list(old_chunks), include=["documents"])
+    assert dict(zip(current["ids"], current["documents"])) == old_chunks
+    assert store.count() == len(old_chunks) + 20
+
+    stats = create_vector_store(source_dir=str(source_dir), chunk_size=100, chunk_overlap=10)
+    assert stats["updated"] == 1
+    new_ids = chunk_ids(path, digest, splitter_config(100, 10), stats["chunks"])
+    assert sorted(store.get(include=[])["ids"]) == sorted(new_ids)
+    assert len(base.bm25_index()) == len(new_ids)
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import random
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from langchain_core.output_parsers import StrOutputParser
+
+import fakes
+from core.llm_scheduler import LLMScheduler
+from crud.history_writer import history_writer
+from routers import chat_router
+
+
+def grant_order(scheduler: LLMScheduler, active: list, tickets: list) -> list:
+    """逐个归还已获得名额的凭证（active），返回排队中的凭证获得名额的顺序"""
+
+    order = []
+    active = list(active)
+    while active:
+        # 每次归还最多让一个排队的凭证获得名额
+        scheduler.release(active.pop(0))
+        for ticket in tickets:
+            if ticket.granted.done() and ticket not in order:
+                order.append(ticket)
+                active.append(ticket)
+    return order
+
+
+def test_round_robin_across_sessions():
+    """排队按会话轮询：一个会话的连续提问不会挤占其他会话"""
+
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+        first = scheduler.acquire("a")
+        assert first.granted.done()
+        keys = ["a", "a", "a", "b", "c", "b"]
+        tickets = [scheduler.acquire(key) for key in keys]
+        assert [scheduler.position(t) for t in tickets] == [1, 4, 6, 2, 3, 5]
+
+        order = grant_order(scheduler, [first], tickets)
+        return [t.key for t in order], scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["a", "b", "c", "a", "b", "a"]
+    assert stats["active"] == 0 and stats["waiting"] == 0
+
+
+def test_position_matches_grant_order():
+    """随机的排队、放弃排队：position 与实际获得名额的顺序一致"""
+
+    async def run():
+        rng = random.Random(0)
+        for _ in range(20):
+            scheduler = LLMScheduler(max_concurrency=2, max_queue=100)
+            blockers = [scheduler.acquire("x"), scheduler.acquire("y")]
+            tickets = [scheduler.acquire(rng.choice("abcde")) for _ in range(rng.randint(1, 30))]
+            for ticket in rng.sample(tickets, len(tickets) // 4):
+                scheduler.release(ticket)
+                tickets.remove(ticket)
+
+            positions = {id(t): scheduler.position(t) for t in tickets}
+            order = grant_order(scheduler, blockers, tickets)
+            assert [positions[id(t)] for t in order] == list(range(1, len(tickets) + 1))
+
+    asyncio.run(run())
+
+
+def test_full_queue_returns_429_with_retry_after():
+    async def run():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=2)
+        tickets = [scheduler.acquire(str(i)) for i in range(3)]
+        with pytest.raises(HTTPException) as raised:
+            scheduler.acquire("other")
+        for ticket in tickets:
+            scheduler.release(ticket, used=False)
+        return raised.value, scheduler
+
+    error, scheduler = asyncio.run(run())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+    # 平均耗时 10 秒，排队 2 个、并发 1：排队的请求全部开始约需 30 秒
+    assert error.headers["Retry-After"] == "30"
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_stream_reports_queue_position(app, monkeypatch):
+    """排队期间响应流定时发送排队位置，前面的请求放弃排队后位置前移，获得名额后开始输出"""
+
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=10)
+    monkeypatch.setattr(chat_router, "llm_scheduler", scheduler)
+    monkeypatch.setattr(chat_router, "LLM_QUEUE_REPORT_INTERVAL", 0.01)
+    chain = fakes.FakeChatModel(think_tokens=2, answer_tokens=5) | StrOutputParser()
+    chat_session_id = uuid.uuid4()
+
+    async def run():
+        running = scheduler.acquire("running")
+        ahead = scheduler.acquire("ahead")
+        ticket = scheduler.acquire(str(chat_session_id))
+        frames = chat_router.generate_stream(chain, "问题", chat_session_id, ticket)
+        received = [json.loads(await anext(frames))]
+        scheduler.release(ahead)
+        received.append(json.loads(await anext(frames)))
+        scheduler.release(running)
+        received += [json.loads(frame) async for frame in frames]
+        await history_writer.stop()
+        return received
+
+    received = asyncio.run(run())
+    queued = [frame["queued"]["position"] for frame in received if "queued" in frame]
+    assert queued[:2] == [2, 1]
+    assert received[-1]["done"] is True
+    assert scheduler.stats()["active"] == 0
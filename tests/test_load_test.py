@@ -0,0 +1,56 @@
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import fake_ollama
+import load_test
+from fakes import FakeEmbeddings
+
+
+@pytest.fixture
+def ollama():
+    app = fake_ollama.create_app(tokens_per_second=0, prefill_ms=0, think_tokens=3, answer_tokens=5, dim=16)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_fake_ollama_chat_stream(ollama):
+    """流式输出为 NDJSON：先是 <think> 推理过程再是回答，最后一行 done 带统计"""
+
+    with ollama.stream("POST", "/api/chat", json={"model": "m", "messages": []}) as response:
+        frames = [json.loads(line) for line in response.iter_lines() if line]
+    content = "".join(frame["message"]["content"] for frame in frames)
+    assert content.startswith("<think>") and content.count("</think>") == 1
+    assert [frame["done"] for frame in frames] == [False] * 10 + [True]
+    assert frames[-1]["eval_count"] == 10 and frames[-1]["model"] == "m"
+
+    result = ollama.post("/api/chat", json={"model": "m", "messages": [], "stream": False}).json()
+    assert result["done"] and result["message"]["content"] == content
+
+
+def test_fake_ollama_embed(ollama):
+    response = ollama.post("/api/embed", json={"model": "m", "input": ["甲", "乙"]}).json()
+    assert response["embeddings"] == FakeEmbeddings(16).embed_documents(["甲", "乙"])
+    assert len(ollama.post("/api/embed", json={"input": "甲"}).json()["embeddings"]) == 1
+
+
+def metrics(buckets: dict, total: float) -> str:
+    lines = [f'docqa_sqlite_query_seconds_bucket{{kind="SELECT",le="{le}"}} {count}' for le, count in buckets.items()]
+    lines.append(f'docqa_sqlite_query_seconds_sum{{kind="SELECT"}} {total}')
+    lines.append(f'docqa_sqlite_query_seconds_count{{kind="SELECT"}} {buckets["+Inf"]}')
+    return "\n".join(lines)
+
+
+def test_sqlite_delta():
+    """两次采集 /metrics 之间的语句数、平均耗时和 p95 所在区间"""
+
+    before = metrics({"0.001": 10, "0.01": 10, "0.1": 10, "+Inf": 10}, 0.005)
+    after = metrics({"0.001": 50, "0.01": 100, "0.1": 110, "+Inf": 110}, 0.205)
+    assert load_test.sqlite_delta(before, after) == {"queries": 100, "mean_ms": 2.0, "p95_le_s": "0.1"}
+    assert load_test.sqlite_delta(before, before) == {"queries": 0}
+
+
+def test_percentiles():
+    assert load_test.percentiles([i / 1000 for i in range(1, 101)]) == {"p50_ms": 50.5, "p95_ms": 96.0, "p99_ms": 100.0}
+    assert load_test.percentiles([]) == {}
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from core.mmr import mmr_select, normalize_rows
+
+
+def reference_scores(query, candidates, selected: list[int], lambda_mult: float) -> dict[int, float]:
+    """按 MMR 定义逐个计算未选中候选的得分（float64）"""
+
+    query = query.astype(np.float64)
+    candidates = candidates.astype(np.float64)
+    scores = {}
+    for i in range(len(candidates)):
+        if i in selected:
+            continue
+        relevance = float(candidates[i] @ query)
+        redundancy = max((float(candidates[i] @ candidates[j]) for j in selected), default=0.0)
+        scores[i] = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+    return scores
+
+
+def check_against_reference(query, candidates, k: int, lambda_mult: float):
+    selected = mmr_select(query, candidates, k, lambda_mult)
+    assert len(selected) == min(k, len(candidates))
+    assert len(set(selected)) == len(selected)
+    # 每一步选中的候选都是参考实现中得分最高的（允许浮点误差范围内的并列）
+    for step, chosen in enumerate(selected):
+        scores = reference_scores(query, candidates, selected[:step], lambda_mult)
+        assert scores[chosen] >= max(scores.values()) - 1e-5
+    return selected
+
+
+@pytest.mark.parametrize("lambda_mult", [0.0, 0.3, 0.5, 1.0])
+def test_matches_reference_on_random_vectors(lambda_mult):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        count = int(rng.integers(1, 60))
+        candidates = normalize_rows(rng.normal(size=(count, 16)))
+        query = normalize_rows(rng.normal(size=16))[0]
+        check_against_reference(query, candidates, int(rng.integers(1, 20)), lambda_mult)
+
+
+def test_k_not_less_than_candidates():
+    rng = np.random.default_rng(1)
+    candidates = normalize_rows(rng.normal(size=(5, 8)))
+    query = normalize_rows(rng.normal(size=8))[0]
+    for k in (5, 6, 100):
+        selected = check_against_reference(query, candidates, k, 0.5)
+        assert sorted(selected) == list(range(5))
+    assert mmr_select(query, candidates, 0) == []
+    assert mmr_select(query, candidates[:0], 3) == []
+
+
+def test_duplicate_vectors():
+    """重复的向量得分完全相同；选中一个后，与它相同的候选冗余度为 1，不会紧接着被选中"""
+
+    rng = np.random.default_rng(2)
+    unique = normalize_rows(rng.normal(size=(6, 8)))
+    candidates = np.concatenate([unique, unique, unique[:2]])
+    query = unique[0] * 0.9 + unique[1] * 0.1
+    query = normalize_rows(query)[0]
+
+    selected = check_against_reference(query, candidates, 6, 0.5)
+    assert selected[0] in (0, 6, 12)
+    assert selected[1] not in (0, 6, 12)
+    check_against_reference(query, candidates, len(candidates), 0.5)
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import random
+
+from core.stream_encoder import StreamEncoder, coalesce
+
+
+def ndjson_frames(count: int) -> list[bytes]:
+    rng = random.Random(0)
+    encoder = StreamEncoder("fake")
+    frames = [encoder.encode_queued(1, 0.5)]
+    frames += [encoder.encode("内容" * rng.randint(0, 20) + "\n") for _ in range(count)]
+    frames.append(encoder.encode("", done=True))
+    return frames
+
+
+async def produce(frames: list[bytes], produced: list, rng: random.Random):
+    for frame in frames:
+        # 不定时地停顿，模拟 LLM 输出速度不均匀
+        if rng.random() < 0.1:
+            await asyncio.sleep(rng.random() * 0.004)
+        produced.append(frame)
+        yield frame
+
+
+def test_coalesced_output_is_identical_and_split_on_lines():
+    """合并后的输出与逐行输出逐字节一致，每次发送的都是完整的行"""
+
+    frames = ndjson_frames(500)
+
+    async def run(interval_ms, max_bytes):
+        source = produce(frames, [], random.Random(1))
+        return [chunk async for chunk in coalesce(source, interval_ms, max_bytes)]
+
+    for interval_ms, max_bytes in [(1, 4096), (5, 300), (50, 1)]:
+        chunks = asyncio.run(run(interval_ms, max_bytes))
+        assert b"".join(chunks) == b"".join(frames)
+        assert len(chunks) < len(frames) or max_bytes == 1
+        for chunk in chunks:
+            assert chunk.endswith(b"\n")
+            for line in chunk.splitlines():
+                json.loads(line)
+
+
+def test_coalesce_keeps_backpressure():
+    """下游没有继续读取时，上游最多被预先读取 max_pending 行"""
+
+    frames = ndjson_frames(1000)
+    produced = []
+
+    async def run():
+        chunks = coalesce(produce(frames, produced, random.Random(2)), 1, 1, max_pending=8)
+        first = await anext(chunks)
+        # 下游暂停读取（如客户端接收慢），上游只能填满队列
+        await asyncio.sleep(0.2)
+        read_ahead = len(produced)
+        await chunks.aclose()
+        return first, read_ahead
+
+    first, read_ahead = asyncio.run(run())
+    assert first == frames[0]
+    # 已发送的 1 行、队列中的 8 行，以及阻塞在写入队列上的 1 行
+    assert read_ahead <= 1 + 8 + 1
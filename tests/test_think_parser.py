@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from core.think_parser import ThinkParser
+
+
+def feed_all(chunks: list[str]) -> tuple[str, str]:
+    parser = ThinkParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.finish()
+    return parser.think, parser.content
+
+
+def split_all(chunks: list[str]) -> tuple[str, str]:
+    """按 split 返回的片段拼接，同时校验与 think / content 一致"""
+
+    parser = ThinkParser()
+    parts = {"think": "", "content": ""}
+    for chunk in chunks:
+        for kind, text in parser.split(chunk):
+            parts[kind] += text
+    for kind, text in parser.finish():
+        parts[kind] += text
+    assert (parts["think"], parts["content"]) == (parser.think, parser.content)
+    return parser.think, parser.content
+
+
+@pytest.fixture(params=[feed_all, split_all], ids=["feed", "split"])
+def parse(request):
+    return request.param
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [
+        ["<thi", "nk>推理</th", "ink>回答"],
+        ["<", "think", ">", "推理", "<", "/", "think", ">", "回答"],
+        ["<think>推理<", "/think>回答"],
+    ],
+)
+def test_tag_split_across_chunks(parse, chunks):
+    assert parse(chunks) == ("推理", "回答")
+
+
+def test_tag_split_at_random_boundaries(parse):
+    rng = random.Random(0)
+    for _ in range(50):
+        think = "".join(rng.choice(["推理", "<", ">", "/", "a<b", "</thin"]) for _ in range(50))
+        content = "".join(rng.choice(["回答", "<", ">", "/", "<thin", "x"]) for _ in range(50))
+        text = f"<think>{think}</think>{content}"
+        chunks = []
+        i = 0
+        while i < len(text):
+            size = rng.randint(1, 5)
+            chunks.append(text[i : i + size])
+            i += size
+        assert parse(chunks) == (think, content)
+
+
+def test_missing_close_tag(parse):
+    """输出中断没有 </think> 时，已输出的内容都归入推理过程，包括末尾暂存的文本"""
+
+    assert parse(["<think>", "推理", "</thi"]) == ("推理</thi", "")
+
+
+def test_empty_think(parse):
+    assert parse(["<think></think>", "回答"]) == ("", "回答")
+    assert parse(["<think>", "</think>回答"]) == ("", "回答")
+
+
+def test_text_before_think(parse):
+    assert parse(["开头", "<think>推理</think>", "回答"]) == ("推理", "开头回答")
+
+
+def test_no_think(parse):
+    assert parse(["a < b", "，", "<thin"]) == ("", "a < b，<thin")
+
+
+def test_split_segments():
+    parser = ThinkParser()
+    assert parser.split("<thi") == []
+    assert parser.split("nk>推理<") == [("think", "推理")]
+    assert parser.split("/think>回答") == [("content", "回答")]
+    assert parser.split("<") == []
+    assert parser.finish() == [("content", "<")]
+    assert (parser.think, parser.content) == ("推理", "回答<")
+
+
+def test_feed_then_split():
+    """feed 暂存的 chunk 在下一次 split 时先解析并计入 think / content，split 只返回新 chunk 的片段"""
+
+    parser = ThinkParser()
+    parser.feed("<think>推")
+    parser.feed("理</thi")
+    assert parser.split("nk>回答") == [("content", "回答")]
+    parser.finish()
+    assert (parser.think, parser.content) == ("推理", "回答")
+
+
+def test_long_stream(parse):
+    """逐字输出的长回答（10 万个 chunk）完整拼接"""
+
+    answer = "回答<b>" * 20000
+    chunks = ["<think>", "推理"] + ["</think>"] + list(answer)
+    assert parse(chunks) == ("推理", answer)
@@ -0,0 +1,40 @@
+import random
+import time
+
+import fakes
+from core import vector_job
+from core.langchain_vector import create_vector_store
+from core.vector_job import VectorJobManager
+
+
+def run_job(manager: VectorJobManager):
+    job = manager.submit()
+    while job.running:
+        time.sleep(0.01)
+    return job
+
+
+def test_invalidate_only_when_index_changed(vector_dir, monkeypatch):
+    """没有新增、变更或删除文件的向量化任务不重建检索链，也就不清空回答缓存"""
+
+    source_dir = vector_dir / "docs"
+    fakes.write_corpus(str(source_dir), 2, 2000, random.Random(0))
+    monkeypatch.setattr(
+        vector_job,
+        "vector_documents",
+        lambda job, on_committed: create_vector_store(source_dir=str(source_dir), job=job),
+    )
+    calls = []
+    monkeypatch.setattr(vector_job, "invalidate_qa_chain", lambda: calls.append(1))
+    manager = VectorJobManager()
+
+    assert run_job(manager).result["added"] == 2
+    assert len(calls) == 1
+
+    job = run_job(manager)
+    assert job.stage == "done" and job.result["skipped"] == 2
+    assert len(calls) == 1
+
+    next(source_dir.iterdir()).unlink()
+    assert run_job(manager).result["removed"] == 1
+    assert len(calls) == 2